@@ -0,0 +1,178 @@
+"""
+Batch position analysis: searches a stream of positions over a process pool and writes one JSON line per result.
+
+    python analysis.py positions.epd --depth 4 --workers 8 --output results.jsonl
+    cat positions.fen | python analysis.py --nodes 20000 > results.jsonl
+
+Every input line is a FEN, or an EPD record whose id operation is copied to the result. Blank lines and lines
+starting with # are skipped. Each position is searched with get_best_move, without the opening book, to the given
+depth, time or node budget (the first one reached ends the search), and the result holds the best move, score,
+completed depth, nodes and time. Scores are white's, a pawn is worth 10 points.
+
+Input is read lazily and only a few positions per worker are in flight at any time, so memory stays constant on
+inputs of any size. Results are written as soon as they finish, so they come out in completion order; the line
+number of the position in the input identifies them.
+"""
+import argparse
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from contextlib import redirect_stdout
+import io
+import json
+import re
+import sys
+import time
+from typing import Iterable, Iterator, Optional
+
+from chess_board import ChessBoard, move_to_string
+from engine import SearchStats, SearchTimer, get_best_move
+from transposition_table import TranspositionTable
+
+DEFAULT_DEPTH = 4
+TASKS_PER_WORKER = 2  # positions queued per worker, so no worker waits for the next one
+
+EPD_ID = re.compile(r'\bid\s+"([^"]*)"')
+
+# per worker process transposition table, set by init_analysis_worker
+analysis_table: Optional[TranspositionTable] = None
+
+
+def parse_position_line(line: str) -> tuple[str, Optional[str]]:
+    """
+    Returns the FEN of a FEN or EPD line and the EPD id, None if there is none.
+    An EPD record has the four position fields of a FEN followed by operations instead of the move counters.
+    """
+    fields = line.split()
+    if len(fields) < 4:
+        return line.strip(), None
+    if len(fields) == 6 and fields[4].isdigit() and fields[5].isdigit():
+        return line.strip(), None
+    match = EPD_ID.search(line)
+    return " ".join(fields[:4]), match.group(1) if match else None
+
+
+def init_analysis_worker(hash_mb: int = 16):
+    """Sets up an analysis worker process with its own transposition table"""
+    global analysis_table
+    analysis_table = TranspositionTable(size_mb=hash_mb)
+
+
+def analyze_position(
+        line_number: int,
+        line: str,
+        depth: Optional[int],
+        time_limit: Optional[float],
+        node_limit: Optional[int],
+    ) -> dict:
+    """
+    Searches the position of one input line and returns its result as a JSON ready dict.
+    An invalid position gives a result with an error instead of a move.
+    """
+    fen, position_id = parse_position_line(line)
+    result = {"line": line_number, "fen": fen}
+    if position_id is not None:
+        result["id"] = position_id
+    try:
+        board = ChessBoard.from_fen(fen)
+    except ValueError as error:
+        result["error"] = str(error)
+        return result
+
+    # every position starts from an empty table, so its result does not depend on what the worker searched before
+    if analysis_table is None:
+        init_analysis_worker()
+    analysis_table.clear()
+
+    stats = SearchStats()
+    start_time = time.perf_counter()
+    # the engine reports progress with print, keep it out of the JSONL output
+    with redirect_stdout(io.StringIO()):
+        piece, move = get_best_move(
+            board, board.turn, max_depth=depth, transposition_table=analysis_table, stats=stats,
+            timer=SearchTimer(time_limit, node_limit=node_limit), use_book=False,
+        )
+    elapsed = time.perf_counter() - start_time
+
+    score = stats.depth_moves[-1][2] if stats.depth_moves else None
+    mate = None
+    if score is not None and abs(score) == float('inf'):
+        # JSON has no infinity, a mate is given as the moves to it instead, positive when white mates
+        moves_to_mate = (len(stats.principal_variation) + 1) // 2
+        score, mate = None, moves_to_mate if score > 0 else -moves_to_mate
+    result.update({
+        "move": move_to_string((piece, move)) if piece is not None else None,
+        "score": score,
+        "mate": mate,
+        "depth": stats.depth_reached,
+        "nodes": stats.nodes,
+        "time": round(elapsed, 4),
+        "pv": stats.principal_variation,
+    })
+    return result
+
+
+def analyze_positions(
+        lines: Iterable[str],
+        depth: Optional[int] = None,
+        time_limit: Optional[float] = None,
+        node_limit: Optional[int] = None,
+        workers: int = 1,
+        hash_mb: int = 16,
+    ) -> Iterator[dict]:
+    """
+    Analyzes the positions of the given lines, see analyze_position, and yields every result as soon as it is done.
+    Without any budget positions are searched to DEFAULT_DEPTH.
+    With more than one worker the positions are searched in a process pool, at most TASKS_PER_WORKER per worker
+    at a time, and results come in completion order.
+    """
+    if depth is None and time_limit is None and node_limit is None:
+        depth = DEFAULT_DEPTH
+    positions = (
+        (line_number, line) for line_number, line in enumerate(lines, start=1)
+        if line.strip() and not line.lstrip().startswith("#")
+    )
+
+    if workers <= 1:
+        init_analysis_worker(hash_mb)
+        for line_number, line in positions:
+            yield analyze_position(line_number, line, depth, time_limit, node_limit)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_analysis_worker, initargs=(hash_mb,)) as executor:
+        pending = set()
+        for line_number, line in positions:
+            pending.add(executor.submit(analyze_position, line_number, line, depth, time_limit, node_limit))
+            if len(pending) < workers * TASKS_PER_WORKER:
+                continue
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+        for future in as_completed(pending):
+            yield future.result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze FEN or EPD positions and write the results as JSON lines")
+    parser.add_argument("input", nargs="?", default="-", help="file with one position per line, - for stdin (default)")
+    parser.add_argument("--output", help="JSONL file to write the results to, defaults to stdout")
+    parser.add_argument("--depth", type=int, help=f"search depth, {DEFAULT_DEPTH} if no budget is given")
+    parser.add_argument("--movetime", type=float, help="seconds per position")
+    parser.add_argument("--nodes", type=int, help="nodes per position")
+    parser.add_argument("--workers", type=int, default=1, help="processes to analyze positions in")
+    parser.add_argument("--hash", type=int, default=16, help="transposition table size per worker in MB")
+    args = parser.parse_args()
+
+    input_file = sys.stdin if args.input == "-" else open(args.input)
+    output_file = sys.stdout if args.output is None else open(args.output, "w")
+    try:
+        for result in analyze_positions(input_file, args.depth, args.movetime, args.nodes, args.workers, args.hash):
+            output_file.write(json.dumps(result, allow_nan=False) + "\n")
+            output_file.flush()
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+        if output_file is not sys.stdout:
+            output_file.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Batched evaluation of positions with NumPy.
+
+Positions are encoded as rows of 64 piece codes, and the material and piece square table part of
+the evaluation is scored for all rows in one vectorized lookup and sum. Checks and checkmates are
+still found per position on the board. The scores agree exactly with ChessBoard.evaluation_function,
+since every material and position term is a multiple of 0.5.
+"""
+import numpy as np
+
+from bitboard import PIECE_TYPE_COUNT, iter_squares
+from chess_board import ChessBoard, Move, PIECE_INDEX, MATERIAL_SCALE, POSITION_SCORES
+from pieces import PlayerColor
+
+# piece code of an empty square, white pieces are 1 + piece type and black pieces 7 + piece type
+EMPTY = 0
+COLOR_CODE_OFFSET = {PlayerColor.WHITE: 1, PlayerColor.BLACK: 1 + PIECE_TYPE_COUNT}
+PIECE_CODE_COUNT = 1 + 2 * PIECE_TYPE_COUNT
+
+PIECE_VALUES = [piece_class(PlayerColor.WHITE, (0, 0)).value for piece_class in PIECE_INDEX]
+
+
+def build_score_table() -> np.ndarray:
+    """Returns the score of each piece code on each square: signed material plus signed position bonus"""
+    score_table = np.zeros((PIECE_CODE_COUNT, 64), dtype=np.float64)
+    for color, offset in COLOR_CODE_OFFSET.items():
+        for piece_type, value in enumerate(PIECE_VALUES):
+            for square in range(64):
+                score_table[offset + piece_type, square] = \
+                    MATERIAL_SCALE[color] * value + POSITION_SCORES[color][piece_type][square] * value
+    return score_table
+
+
+SCORE_TABLE = build_score_table()
+SQUARES = np.arange(64)
+
+
+def encode_board(board: ChessBoard) -> np.ndarray:
+    """Returns the 64 piece codes of a board"""
+    codes = np.zeros(64, dtype=np.int8)
+    for color, offset in COLOR_CODE_OFFSET.items():
+        for piece_type, bitboard in enumerate(board.bitboards[color]):
+            for square in iter_squares(bitboard):
+                codes[square] = offset + piece_type
+    return codes
+
+
+def game_state_terms(board: ChessBoard) -> tuple[float, float]:
+    """
+    Returns the evaluation terms that are not material or position:
+    the check bonus, and the checkmate score (nan if neither side is checkmated)
+    """
+    white_in_check = board.is_king_in_check(PlayerColor.WHITE)
+    black_in_check = not white_in_check and board.is_king_in_check(PlayerColor.BLACK)
+
+    if white_in_check:
+        if not board.has_legal_move(PlayerColor.WHITE):
+            return 0.0, -np.inf
+        return -10.0, np.nan
+    if black_in_check:
+        if not board.has_legal_move(PlayerColor.BLACK):
+            return 0.0, np.inf
+        return 10.0, np.nan
+    return 0.0, np.nan
+
+
+def evaluate_positions(codes: np.ndarray, check_bonus: np.ndarray, checkmate_scores: np.ndarray) -> np.ndarray:
+    """
+    Scores N encoded positions in one pass.
+
+    Args:
+        codes (np.ndarray): N x 64 piece codes.
+        check_bonus (np.ndarray): N check bonuses, see game_state_terms.
+        checkmate_scores (np.ndarray): N checkmate scores, nan where nobody is checkmated.
+    Returns:
+        np.ndarray: N scores, positive if white is winning.
+    """
+    scores = SCORE_TABLE[codes, SQUARES].sum(axis=1) + check_bonus
+    return np.where(np.isnan(checkmate_scores), scores, checkmate_scores)
+
+
+def evaluate_boards(boards: list[ChessBoard]) -> np.ndarray:
+    """Scores a list of boards, for offline analysis"""
+    codes = np.array([encode_board(board) for board in boards], dtype=np.int8).reshape(len(boards), 64)
+    terms = np.array([game_state_terms(board) for board in boards], dtype=np.float64).reshape(len(boards), 2)
+    return evaluate_positions(codes, terms[:, 0], terms[:, 1])
+
+
+def evaluate_moves(board: ChessBoard, moves: list[Move]) -> np.ndarray:
+    """
+    Scores the position after each of the given moves, for the children of a frontier node.
+    Each move is played and taken back once to encode the child, then all children are scored together.
+    """
+    codes = np.zeros((len(moves), 64), dtype=np.int8)
+    terms = np.zeros((len(moves), 2), dtype=np.float64)
+    for index, move in enumerate(moves):
+        board.make_move(move)
+        codes[index] = encode_board(board)
+        terms[index] = game_state_terms(board)
+        board.unmake_move()
+    return evaluate_positions(codes, terms[:, 0], terms[:, 1])
@@ -0,0 +1,190 @@
+"""
+Search benchmark over a fixed set of positions.
+
+Every position is searched to a fixed depth a few times with a fresh transposition table, and the
+time to each depth, nodes searched, nodes/sec and chosen move are written as JSON. A stored result
+can be passed as a baseline to see which positions got faster or slower, for example
+
+    python benchmark.py --output baseline.json
+    (change the engine)
+    python benchmark.py --compare baseline.json
+
+A change is only reported as faster or slower when Welch's t-test over the repeated runs says the
+difference in time is significant at the 95% level.
+"""
+import argparse
+from contextlib import redirect_stdout
+import io
+import json
+import math
+import platform
+import statistics
+import time
+from typing import Optional
+
+from chess_board import ChessBoard, move_to_string
+from engine import PruningOptions, SearchStats, iterative_deepening_minimax
+from transposition_table import TranspositionTable
+
+# name: (category, FEN, depth)
+POSITIONS = {
+    "start": ("opening", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1", 4),
+    "italian": ("opening", "r1bqk1nr/pppp1ppp/2n5/2b1p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4", 3),
+    "kiwipete": ("middlegame", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", 3),
+    "symmetrical": ("middlegame", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10", 3),
+    "wac_001": ("tactical", "2rr3k/pp3pp1/1nnqbN1p/3pN3/2pP4/2P3Q1/PPB4P/R4RK1 w - - 0 1", 3),
+    "wac_002": ("tactical", "8/7p/5k2/5p2/p1p2P2/Pr1pPK2/1P1R3P/6R1 b - - 0 1", 3),
+    "king_and_pawn": ("endgame", "8/8/8/4k3/8/8/4PK2/8 w - - 0 1", 6),
+    "rook_endgame": ("endgame", "8/5k2/8/8/8/8/1R6/4K3 w - - 0 1", 5),
+}
+
+# two-sided 95% critical values of Student's t distribution by degrees of freedom
+T_CRITICAL_95 = [12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+                 2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086]
+
+
+def run_position(fen: str, depth: int, repeat: int, pruning: PruningOptions = PruningOptions()) -> dict:
+    """Searches a position to the given depth repeat times and returns the timings of every run"""
+    runs = []
+    for _ in range(repeat):
+        board = ChessBoard.from_fen(fen)
+        stats = SearchStats()
+        start_time = time.perf_counter()
+        # the engine reports progress with print, keep it out of the benchmark output
+        with redirect_stdout(io.StringIO()):
+            piece, move, score = iterative_deepening_minimax(
+                board_state=board,
+                max_depth=depth,
+                player_color=board.turn,
+                time_limit=float('inf'),
+                transposition_table=TranspositionTable(),
+                stats=stats,
+                pruning=pruning,
+            )
+        elapsed = time.perf_counter() - start_time
+        runs.append({
+            "time": elapsed,
+            "depth_times": stats.depth_times,
+            "nodes": stats.nodes,
+            "move": move_to_string((piece, move)) if piece is not None else None,
+            "score": score,
+            "stats": stats.as_dict(),
+        })
+
+    times = [run["time"] for run in runs]
+    mean_time = statistics.mean(times)
+    return {
+        "depth": depth,
+        "move": runs[-1]["move"],
+        "score": runs[-1]["score"],
+        "nodes": runs[-1]["nodes"],
+        "stats": runs[-1]["stats"],
+        "times": times,
+        "mean_time": mean_time,
+        "stdev_time": statistics.stdev(times) if len(times) > 1 else 0.0,
+        "nps": runs[-1]["nodes"] / mean_time if mean_time > 0 else 0.0,
+        "time_to_depth": [statistics.mean(depth_times) for depth_times in zip(*(run["depth_times"] for run in runs))],
+    }
+
+
+def run_benchmark(
+        names: list[str], repeat: int, depth: Optional[int] = None, pruning: PruningOptions = PruningOptions(),
+    ) -> dict:
+    """Runs the benchmark over the named positions, depth overrides the depth of every position"""
+    results = {}
+    for name in names:
+        category, fen, position_depth = POSITIONS[name]
+        results[name] = {"category": category, "fen": fen, **run_position(fen, depth or position_depth, repeat, pruning)}
+    return {
+        "python": platform.python_version(),
+        "repeat": repeat,
+        "pruning": pruning._asdict(),
+        "positions": results,
+    }
+
+
+def welch_t_test(sample: list[float], baseline: list[float]) -> tuple[float, bool]:
+    """Returns Welch's t statistic of two samples and whether their means differ at the 95% level"""
+    if len(sample) < 2 or len(baseline) < 2:
+        return 0.0, False
+    sample_variance = statistics.variance(sample) / len(sample)
+    baseline_variance = statistics.variance(baseline) / len(baseline)
+    standard_error = math.sqrt(sample_variance + baseline_variance)
+    if standard_error == 0:
+        return 0.0, statistics.mean(sample) != statistics.mean(baseline)
+
+    t = (statistics.mean(sample) - statistics.mean(baseline)) / standard_error
+    degrees_of_freedom = (sample_variance + baseline_variance) ** 2 / (
+        sample_variance ** 2 / (len(sample) - 1) + baseline_variance ** 2 / (len(baseline) - 1))
+    index = max(1, math.floor(degrees_of_freedom)) - 1
+    critical = T_CRITICAL_95[index] if index < len(T_CRITICAL_95) else 1.96
+    return t, abs(t) > critical
+
+
+def compare(results: dict, baseline: dict) -> list[str]:
+    """Returns one report line per position found in both results, and a geometric mean speedup line"""
+    lines = []
+    speedups = []
+    for name, result in results["positions"].items():
+        if name not in baseline["positions"]:
+            continue
+        base = baseline["positions"][name]
+        speedup = base["mean_time"] / result["mean_time"] if result["mean_time"] > 0 else float('inf')
+        speedups.append(speedup)
+        t, significant = welch_t_test(result["times"], base["times"])
+        if not significant:
+            verdict = "no significant change"
+        elif speedup > 1:
+            verdict = "faster"
+        else:
+            verdict = "slower"
+
+        notes = []
+        if result["depth"] != base["depth"]:
+            notes.append(f"depth {base['depth']} -> {result['depth']}")
+        if result["nodes"] != base["nodes"]:
+            notes.append(f"nodes {base['nodes']} -> {result['nodes']}")
+        if result["move"] != base["move"]:
+            notes.append(f"move {base['move']} -> {result['move']}")
+        lines.append(f"{name:16} {base['mean_time']:8.3f}s -> {result['mean_time']:8.3f}s  "
+                     f"x{speedup:5.2f}  t={t:6.2f}  {verdict}" + (f"  ({', '.join(notes)})" if notes else ""))
+
+    if speedups:
+        geometric_mean = math.exp(statistics.mean(math.log(speedup) for speedup in speedups))
+        lines.append(f"geometric mean speedup: x{geometric_mean:.2f}")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the search on a fixed set of positions")
+    parser.add_argument("--positions", nargs="+", choices=list(POSITIONS), default=list(POSITIONS),
+                        help="positions to run, defaults to all")
+    parser.add_argument("--depth", type=int, help="search every position to this depth instead of its own")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per position")
+    parser.add_argument("--output", help="file to write the JSON results to")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--no-null-move", action="store_true", help="search without null move pruning")
+    parser.add_argument("--no-futility", action="store_true", help="search without futility pruning")
+    parser.add_argument("--no-razoring", action="store_true", help="search without razoring")
+    args = parser.parse_args()
+
+    pruning = PruningOptions(null_move=not args.no_null_move, futility=not args.no_futility, razoring=not args.no_razoring)
+    results = run_benchmark(args.positions, args.repeat, args.depth, pruning)
+    for name, result in results["positions"].items():
+        print(f"{name:16} {result['category']:10} depth {result['depth']}  {result['mean_time']:8.3f}s "
+              f"± {result['stdev_time']:.3f}  {result['nodes']:8} nodes  {result['nps']:8.0f} nps  {result['move']}")
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        print()
+        for line in compare(results, baseline):
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
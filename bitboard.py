@@ -0,0 +1,170 @@
+"""
+Bitboard helpers for the board representation.
+
+Squares are indexed as row * 8 + col, matching the (row, col) positions used
+everywhere else, so bit 0 is A8 and bit 63 is H1.
+"""
+Position = tuple[int, int]
+
+# piece type indices into the per-color bitboard lists
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6)
+PIECE_TYPE_COUNT = 6
+
+FULL_BOARD = (1 << 64) - 1
+
+# (row, col) steps for each kind of piece movement
+KNIGHT_OFFSETS = [(-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)]
+KING_OFFSETS = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+ORTHOGONAL_DIRECTIONS = [(1, 0), (-1, 0), (0, 1), (0, -1)]
+DIAGONAL_DIRECTIONS = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+
+
+def square_index(position: Position) -> int:
+    """Returns the bit index of a (row, col) position"""
+    row, col = position
+    return row * 8 + col
+
+
+def square_position(square: int) -> Position:
+    """Returns the (row, col) position of a bit index"""
+    return square >> 3, square & 7
+
+
+def square_bit(position: Position) -> int:
+    """Returns a bitboard with only the given position set"""
+    row, col = position
+    return 1 << (row * 8 + col)
+
+
+def iter_squares(bitboard: int):
+    """Yields the index of every set bit, lowest first"""
+    while bitboard:
+        lowest = bitboard & -bitboard
+        yield lowest.bit_length() - 1
+        bitboard ^= lowest
+
+
+def lowest_square(bitboard: int) -> int:
+    """Returns the index of the lowest set bit, or -1 for an empty bitboard"""
+    return (bitboard & -bitboard).bit_length() - 1
+
+
+def popcount(bitboard: int) -> int:
+    """Returns the number of set bits"""
+    return bitboard.bit_count()
+
+
+def leaper_attacks(row: int, col: int, offsets: list[Position]) -> int:
+    """Returns the bitboard of squares one step away along the given offsets"""
+    attacks = 0
+    for dr, dc in offsets:
+        new_row, new_col = row + dr, col + dc
+        if 0 <= new_row < 8 and 0 <= new_col < 8:
+            attacks |= 1 << (new_row * 8 + new_col)
+    return attacks
+
+
+def sliding_attacks(row: int, col: int, directions: list[Position], occupancy: int) -> int:
+    """Returns the bitboard of squares reached along each direction, up to and including the first occupied square"""
+    attacks = 0
+    for dr, dc in directions:
+        new_row, new_col = row + dr, col + dc
+        while 0 <= new_row < 8 and 0 <= new_col < 8:
+            bit = 1 << (new_row * 8 + new_col)
+            attacks |= bit
+            if occupancy & bit:
+                break
+            new_row += dr
+            new_col += dc
+    return attacks
+
+
+def squares_to_positions(bitboard: int) -> list[Position]:
+    """Returns the (row, col) position of every set bit, lowest first"""
+    positions = []
+    while bitboard:
+        lowest = bitboard & -bitboard
+        square = lowest.bit_length() - 1
+        positions.append((square >> 3, square & 7))
+        bitboard ^= lowest
+    return positions
+
+
+# Precomputed attack tables, indexed by square.
+# Leapers attack a fixed set of squares. A white pawn attacks diagonally towards row 0, a black pawn towards row 7.
+KNIGHT_ATTACKS = [leaper_attacks(square >> 3, square & 7, KNIGHT_OFFSETS) for square in range(64)]
+KING_ATTACKS = [leaper_attacks(square >> 3, square & 7, KING_OFFSETS) for square in range(64)]
+WHITE_PAWN_ATTACKS = [leaper_attacks(square >> 3, square & 7, [(-1, -1), (-1, 1)]) for square in range(64)]
+BLACK_PAWN_ATTACKS = [leaper_attacks(square >> 3, square & 7, [(1, -1), (1, 1)]) for square in range(64)]
+
+
+def relevant_occupancy_mask(square: int, directions: list[Position]) -> int:
+    """
+    Returns the squares whose occupancy can change a slider's attacks from the given square:
+    its rays without the last square of each, since a piece on the board edge blocks nothing further
+    """
+    mask = 0
+    row, col = square >> 3, square & 7
+    for dr, dc in directions:
+        new_row, new_col = row + dr, col + dc
+        while 0 <= new_row + dr < 8 and 0 <= new_col + dc < 8:
+            mask |= 1 << (new_row * 8 + new_col)
+            new_row += dr
+            new_col += dc
+    return mask
+
+
+# Sliders look their attacks up by the occupancy of their relevant squares, like magic bitboards.
+# Instead of multiplying by a magic number to get a dense index, the masked occupancy is the key of a
+# per-square dict, filled the first time each occupancy is seen.
+ROOK_MASKS = [relevant_occupancy_mask(square, ORTHOGONAL_DIRECTIONS) for square in range(64)]
+BISHOP_MASKS = [relevant_occupancy_mask(square, DIAGONAL_DIRECTIONS) for square in range(64)]
+ROOK_TABLES: list[dict[int, int]] = [{} for _ in range(64)]
+BISHOP_TABLES: list[dict[int, int]] = [{} for _ in range(64)]
+
+
+def rook_attacks(square: int, occupancy: int) -> int:
+    """Returns the squares a rook on the given square attacks, up to and including the first piece on each ray"""
+    key = occupancy & ROOK_MASKS[square]
+    table = ROOK_TABLES[square]
+    attacks = table.get(key)
+    if attacks is None:
+        attacks = table[key] = sliding_attacks(square >> 3, square & 7, ORTHOGONAL_DIRECTIONS, key)
+    return attacks
+
+
+def bishop_attacks(square: int, occupancy: int) -> int:
+    """Returns the squares a bishop on the given square attacks, up to and including the first piece on each ray"""
+    key = occupancy & BISHOP_MASKS[square]
+    table = BISHOP_TABLES[square]
+    attacks = table.get(key)
+    if attacks is None:
+        attacks = table[key] = sliding_attacks(square >> 3, square & 7, DIAGONAL_DIRECTIONS, key)
+    return attacks
+
+
+def queen_attacks(square: int, occupancy: int) -> int:
+    """Returns the squares a queen on the given square attacks"""
+    return rook_attacks(square, occupancy) | bishop_attacks(square, occupancy)
+
+
+def squares_between(start: int, end: int) -> int:
+    """Returns the squares strictly between two squares on a shared rank, file or diagonal, 0 otherwise"""
+    start_row, start_col = start >> 3, start & 7
+    end_row, end_col = end >> 3, end & 7
+    row_step = (end_row > start_row) - (end_row < start_row)
+    col_step = (end_col > start_col) - (end_col < start_col)
+    if start == end or (start_row != end_row and start_col != end_col and
+                        abs(end_row - start_row) != abs(end_col - start_col)):
+        return 0
+
+    between = 0
+    row, col = start_row + row_step, start_col + col_step
+    while (row, col) != (end_row, end_col):
+        between |= 1 << (row * 8 + col)
+        row += row_step
+        col += col_step
+    return between
+
+
+BETWEEN = [[squares_between(start, end) for end in range(64)] for start in range(64)]
@@ -1,14 +1,67 @@
 from copy import copy, deepcopy
 from typing import Optional
 
+from bitboard import (
+    PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, PIECE_TYPE_COUNT, FULL_BOARD,
+    KNIGHT_ATTACKS, KING_ATTACKS, WHITE_PAWN_ATTACKS, BLACK_PAWN_ATTACKS, BETWEEN,
+    iter_squares, rook_attacks, bishop_attacks,
+)
 from pieces import ChessPiece, PlayerColor, Rook, Knight, Bishop, King, Queen, Pawn
 from piece_square_tables import pst_pawn, pst_knight, pst_bishop, pst_king, pst_rook, pst_queen
+from zobrist import PIECE_KEYS, CASTLING_KEYS, BLACK_TO_MOVE_KEY
+from util import position_to_string
 
 Position = tuple[int, int]
+Move = tuple[ChessPiece, Position]
+
+PIECE_INDEX = {Pawn: PAWN, Knight: KNIGHT, Bishop: BISHOP, Rook: ROOK, Queen: QUEEN, King: KING}
+
+# FEN letters of the black pieces, white pieces use the upper case letter
+FEN_SYMBOLS = {Pawn: 'p', Knight: 'n', Bishop: 'b', Rook: 'r', Queen: 'q', King: 'k'}
+FEN_PIECES = {symbol: piece_class for piece_class, symbol in FEN_SYMBOLS.items()}
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+# squares attacked by a pawn of each color
+PAWN_ATTACKS = {PlayerColor.WHITE: WHITE_PAWN_ATTACKS, PlayerColor.BLACK: BLACK_PAWN_ATTACKS}
+
+# A piece is worth value * 10 * (100 + piece square table bonus) / 100, split into a material part
+# (value * 10) and a position part (value * bonus / 10), both signed so white is positive.
+# Table bonuses are multiples of 5, so every term is a multiple of 0.5 and the running totals stay exact.
+MATERIAL_SCALE = {PlayerColor.WHITE: 10, PlayerColor.BLACK: -10}
+PIECE_SQUARE_TABLES = [pst_pawn, pst_knight, pst_bishop, pst_rook, pst_queen, pst_king]
+POSITION_SCORES: dict[PlayerColor, list[list[float]]] = {
+    color: [
+        [sign * table[row if color == PlayerColor.WHITE else 7 - row][col] / 10 for row in range(8) for col in range(8)]
+        for table in PIECE_SQUARE_TABLES
+    ]
+    for color, sign in [(PlayerColor.WHITE, 1), (PlayerColor.BLACK, -1)]
+}
+
+# castling rights bits
+WHITE_KINGSIDE = 1
+WHITE_QUEENSIDE = 2
+BLACK_KINGSIDE = 4
+BLACK_QUEENSIDE = 8
+ALL_CASTLING_RIGHTS = 15
+
+# castling rights kept when a piece moves from or to each square
+CASTLING_RIGHTS_KEPT = [ALL_CASTLING_RIGHTS] * 64
+CASTLING_RIGHTS_KEPT[0] = ALL_CASTLING_RIGHTS & ~BLACK_QUEENSIDE  # A8
+CASTLING_RIGHTS_KEPT[4] = ALL_CASTLING_RIGHTS & ~(BLACK_KINGSIDE | BLACK_QUEENSIDE)  # E8
+CASTLING_RIGHTS_KEPT[7] = ALL_CASTLING_RIGHTS & ~BLACK_KINGSIDE  # H8
+CASTLING_RIGHTS_KEPT[56] = ALL_CASTLING_RIGHTS & ~WHITE_QUEENSIDE  # A1
+CASTLING_RIGHTS_KEPT[60] = ALL_CASTLING_RIGHTS & ~(WHITE_KINGSIDE | WHITE_QUEENSIDE)  # E1
+CASTLING_RIGHTS_KEPT[63] = ALL_CASTLING_RIGHTS & ~WHITE_KINGSIDE  # H1
+
+
+def move_to_string(move: Move) -> str:
+    """Returns a move in coordinate notation, e.g. e2e4"""
+    piece, new_position = move
+    return (position_to_string(piece.position) + position_to_string(new_position)).lower()
 
 
 class ChessBoard:
-    def __init__(self, board_state: list[list[Optional[ChessPiece]]] = None):
+    def __init__(self, board_state: list[list[Optional[ChessPiece]]] = None, turn: PlayerColor = PlayerColor.WHITE):
         if board_state is None:
             self.board = self.create_empty_board()
             self.place_pieces()
@@ -16,6 +69,91 @@ class ChessBoard:
             self.board = board_state
 
         self.moves = []
+        self.undo_stack = []
+        self.turn = turn
+        self.sync_bitboards()
+        self.castling_rights = self.compute_castling_rights()
+        self.zobrist_key = self.compute_zobrist_key()
+
+    @classmethod
+    def from_fen(cls, fen: str) -> "ChessBoard":
+        """
+        Creates a board from a FEN string.
+        The castling field marks which kings and rooks have moved, a king or rook without a castling right
+        counts as moved. The en passant square and the move counters are ignored, this engine has no en passant.
+        """
+        fields = fen.split()
+        if len(fields) < 2:
+            raise ValueError(f"Invalid FEN: {fen!r}")
+        placement, active_color = fields[0], fields[1]
+        castling = fields[2] if len(fields) > 2 else '-'
+
+        rows = placement.split('/')
+        if len(rows) != 8:
+            raise ValueError(f"Invalid FEN: {fen!r}")
+        board_state = [[None] * 8 for _ in range(8)]
+        for row, fen_row in enumerate(rows):
+            col = 0
+            for symbol in fen_row:
+                if symbol.isdigit():
+                    col += int(symbol)
+                    continue
+                if symbol.lower() not in FEN_PIECES or col > 7:
+                    raise ValueError(f"Invalid FEN: {fen!r}")
+                color = PlayerColor.WHITE if symbol.isupper() else PlayerColor.BLACK
+                board_state[row][col] = FEN_PIECES[symbol.lower()](color, (row, col))
+                col += 1
+            if col != 8:
+                raise ValueError(f"Invalid FEN: {fen!r}")
+
+        for color, row, kingside, queenside in [
+            (PlayerColor.WHITE, 7, 'K', 'Q'),
+            (PlayerColor.BLACK, 0, 'k', 'q'),
+        ]:
+            for piece in board_state[row]:
+                if isinstance(piece, (King, Rook)) and piece.color == color:
+                    piece.has_moved = True
+            for col, right in [(7, kingside), (0, queenside)]:
+                king, rook = board_state[row][4], board_state[row][col]
+                if right in castling and isinstance(king, King) and isinstance(rook, Rook) and \
+                        king.color == color and rook.color == color:
+                    king.has_moved = False
+                    rook.has_moved = False
+
+        turn = PlayerColor.BLACK if active_color == 'b' else PlayerColor.WHITE
+        return cls(board_state, turn)
+
+    def to_fen(self) -> str:
+        """Returns the FEN string of the position, without an en passant square"""
+        rows = []
+        for row in range(8):
+            fen_row = ''
+            empty = 0
+            for piece in self.board[row]:
+                if piece is None:
+                    empty += 1
+                    continue
+                if empty:
+                    fen_row += str(empty)
+                    empty = 0
+                symbol = FEN_SYMBOLS[type(piece)]
+                fen_row += symbol.upper() if piece.color == PlayerColor.WHITE else symbol
+            if empty:
+                fen_row += str(empty)
+            rows.append(fen_row)
+
+        castling = ''.join(symbol for right, symbol in [
+            (WHITE_KINGSIDE, 'K'), (WHITE_QUEENSIDE, 'Q'), (BLACK_KINGSIDE, 'k'), (BLACK_QUEENSIDE, 'q'),
+        ] if self.castling_rights & right) or '-'
+        active_color = 'w' if self.turn == PlayerColor.WHITE else 'b'
+        return f"{'/'.join(rows)} {active_color} {castling} - 0 {len(self.moves) // 2 + 1}"
+
+    def parse_move(self, move_string: str) -> Optional[Move]:
+        """Returns the legal move of the side to move written in coordinate notation (e.g. e2e4), None if there is none"""
+        for move in self.generate_legal_moves(self.turn):
+            if move_to_string(move) == move_string.lower():
+                return move
+        return None
 
     def create_empty_board(self) -> list[list[Optional[ChessPiece]]]:
         """Create an empty 8x8 chess board"""
@@ -33,6 +171,122 @@ class ChessBoard:
             self.board[1][i] = Pawn(PlayerColor.BLACK, (1, i))
             self.board[6][i] = Pawn(PlayerColor.WHITE, (6, i))
 
+    def sync_bitboards(self):
+        """
+        Rebuilds the bitboards and piece lists from the 8x8 board.
+        The board list holds the piece objects, the bitboards answer occupancy and piece type queries:
+        one bitboard per color and piece type, one per color and one for all occupied squares.
+        The piece lists hold the pieces of each color and type, as insertion ordered dicts used as sets,
+        and king_squares the square index of each king (-1 if there is none).
+        Also resets the running material and position score totals used by the evaluation function.
+        """
+        self.bitboards: dict[PlayerColor, list[int]] = {
+            PlayerColor.WHITE: [0] * PIECE_TYPE_COUNT,
+            PlayerColor.BLACK: [0] * PIECE_TYPE_COUNT,
+        }
+        self.color_occupancy: dict[PlayerColor, int] = {PlayerColor.WHITE: 0, PlayerColor.BLACK: 0}
+        self.occupancy = 0
+        self.attack_maps: dict[PlayerColor, int] = {}
+        self.piece_lists: dict[PlayerColor, list[dict[ChessPiece, None]]] = {
+            PlayerColor.WHITE: [{} for _ in range(PIECE_TYPE_COUNT)],
+            PlayerColor.BLACK: [{} for _ in range(PIECE_TYPE_COUNT)],
+        }
+        self.king_squares: dict[PlayerColor, int] = {PlayerColor.WHITE: -1, PlayerColor.BLACK: -1}
+        self.material_score = 0
+        self.position_score = 0
+
+        for row in range(8):
+            for col in range(8):
+                piece = self.board[row][col]
+                if piece is not None:
+                    bit = 1 << (row * 8 + col)
+                    piece_type = PIECE_INDEX[type(piece)]
+                    self.bitboards[piece.color][piece_type] |= bit
+                    self.color_occupancy[piece.color] |= bit
+                    self.occupancy |= bit
+                    self.piece_lists[piece.color][piece_type][piece] = None
+                    if piece_type == KING:
+                        self.king_squares[piece.color] = row * 8 + col
+                    self.material_score += MATERIAL_SCALE[piece.color] * piece.value
+                    self.position_score += POSITION_SCORES[piece.color][piece_type][row * 8 + col] * piece.value
+
+    def place_piece(self, piece: ChessPiece, position: Position):
+        """
+        Puts a piece on an empty square, keeping the bitboards and piece lists in sync.
+        Does not change piece.position.
+        """
+        row, col = position
+        square = row * 8 + col
+        bit = 1 << square
+        piece_type = PIECE_INDEX[type(piece)]
+        self.board[row][col] = piece
+        self.bitboards[piece.color][piece_type] |= bit
+        self.color_occupancy[piece.color] |= bit
+        self.occupancy |= bit
+        self.zobrist_key ^= PIECE_KEYS[piece.color][piece_type][square]
+        self.attack_maps = {}
+        self.piece_lists[piece.color][piece_type][piece] = None
+        if piece_type == KING:
+            self.king_squares[piece.color] = square
+        self.material_score += MATERIAL_SCALE[piece.color] * piece.value
+        self.position_score += POSITION_SCORES[piece.color][piece_type][square] * piece.value
+
+    def remove_piece(self, position: Position) -> Optional[ChessPiece]:
+        """
+        Removes and returns the piece on a square, keeping the bitboards and piece lists in sync.
+        """
+        row, col = position
+        piece = self.board[row][col]
+        if piece is not None:
+            square = row * 8 + col
+            mask = ~(1 << square)
+            piece_type = PIECE_INDEX[type(piece)]
+            self.board[row][col] = None
+            self.bitboards[piece.color][piece_type] &= mask
+            self.color_occupancy[piece.color] &= mask
+            self.occupancy &= mask
+            self.zobrist_key ^= PIECE_KEYS[piece.color][piece_type][square]
+            self.attack_maps = {}
+            del self.piece_lists[piece.color][piece_type][piece]
+            if piece_type == KING:
+                self.king_squares[piece.color] = -1
+            self.material_score -= MATERIAL_SCALE[piece.color] * piece.value
+            self.position_score -= POSITION_SCORES[piece.color][piece_type][square] * piece.value
+        return piece
+
+    def compute_castling_rights(self) -> int:
+        """
+        Returns the castling rights mask implied by the pieces:
+        a side may castle while its king and that rook are on their starting squares and have not moved.
+        """
+        rights = 0
+        for color, row, kingside, queenside in [
+            (PlayerColor.WHITE, 7, WHITE_KINGSIDE, WHITE_QUEENSIDE),
+            (PlayerColor.BLACK, 0, BLACK_KINGSIDE, BLACK_QUEENSIDE),
+        ]:
+            king = self.board[row][4]
+            if not isinstance(king, King) or king.color != color or king.has_moved:
+                continue
+            for col, right in [(7, kingside), (0, queenside)]:
+                rook = self.board[row][col]
+                if isinstance(rook, Rook) and rook.color == color and not rook.has_moved:
+                    rights |= right
+        return rights
+
+    def compute_zobrist_key(self) -> int:
+        """
+        Computes the Zobrist key of the position from scratch.
+        zobrist_key holds the same value, updated incrementally as moves are made and taken back.
+        """
+        key = CASTLING_KEYS[self.castling_rights]
+        if self.turn == PlayerColor.BLACK:
+            key ^= BLACK_TO_MOVE_KEY
+        for color, bitboards in self.bitboards.items():
+            for piece_type, bitboard in enumerate(bitboards):
+                for square in iter_squares(bitboard):
+                    key ^= PIECE_KEYS[color][piece_type][square]
+        return key
+
     def get_moves(self) -> list[tuple[str, Position, Position]]:
         """Returns list of all moves already made"""
         return self.moves
@@ -41,14 +295,16 @@ class ChessBoard:
         """
         Returns True if given position does not contain a piece
         """
-        return self.get_piece(position) is None
+        row, col = position
+        return not (self.occupancy >> (row * 8 + col)) & 1
 
     def is_opponent_piece(self, color: PlayerColor, position: Position) -> bool:
         """
         Returns whether the given position contains an opponent piece for the given player
         """
-        piece = self.get_piece(position)
-        return piece is not None and piece.color != color
+        row, col = position
+        opponent_color = PlayerColor.WHITE if color == PlayerColor.BLACK else PlayerColor.BLACK
+        return bool((self.color_occupancy[opponent_color] >> (row * 8 + col)) & 1)
 
     def get_piece(self, position: Position) -> Optional[ChessPiece]:
         """
@@ -61,73 +317,235 @@ class ChessBoard:
         """
         Returns all pieces on the board for a given player
         """
-        pieces: list[ChessPiece] = []
-        for row in range(8):
-            for col in range(8):
-                piece = self.get_piece((row, col))
-                if piece and piece.color == color:
-                    pieces.append(piece)
+        return [piece for pieces in self.piece_lists[color] for piece in pieces]
 
-        return pieces
+    def get_pieces_of_type(self, color: PlayerColor, piece_type: int) -> list[ChessPiece]:
+        """
+        Returns the pieces of one type (bitboard.PAWN ... bitboard.KING) for a given player
+        """
+        return list(self.piece_lists[color][piece_type])
 
     def is_move_valid(self, piece: ChessPiece, new_position: Position) -> bool:
         """
-        Checks if a move is valid by creating a copy of the board, making the move,
-        and checking if the king is in check after the move.
+        Checks if a move is valid by making the move in place, checking if the king
+        is in check after the move, and taking the move back.
         """
         color = piece.color
 
-        # Create a copy of the board and make the move
-        board_copy = deepcopy(self)
-        old_row, old_col = piece.position
-        new_row, new_col = new_position
-        board_copy.board[old_row][old_col] = None
-        board_copy.board[new_row][new_col] = piece
+        self.make_move((piece, new_position))
+        in_check = self.is_king_in_check(color)
+        self.unmake_move()
+        return not in_check
 
-        # Check if the king is in check after the move
-        return not board_copy.is_king_in_check(color)
+    def is_legal_move(self, color: PlayerColor, move: Move) -> bool:
+        """
+        Checks if a move, e.g. one remembered from another position, can be played by the given player here:
+        the piece is still on the board and can reach the target, castling included, without leaving its king in check
+        """
+        piece, new_position = move
+        if piece.color != color or self.get_piece(piece.position) is not piece:
+            return False
+        if new_position not in piece.get_possible_moves(self) and \
+                not (isinstance(piece, King) and new_position in self.get_castling_moves(color)):
+            return False
+        return self.is_move_valid(piece, new_position)
 
     def get_possible_moves(self, color: PlayerColor) -> list[tuple[ChessPiece, list[Position]]]:
         """
         Returns a list of all pieces and their possible moves on the board for a given player
         """
-        valid_moves = []
+        valid_moves = {piece: [] for piece in self.get_pieces(color)}
+        for piece, move in self.generate_legal_moves(color):
+            valid_moves[piece].append(move)
+
+        return list(valid_moves.items())
+
+    def generate_legal_moves(self, color: PlayerColor, targets: int = FULL_BOARD) -> list[Move]:
+        """
+        Returns every legal (piece, position) move for the given player, castling included.
+        Checkers and pinned pieces are found once by looking outward from the king,
+        so moves are filtered with bitboard masks instead of being tried on the board.
+        Only moves landing on a square of the targets bitboard are returned, e.g. the opponent's pieces for captures.
+        """
+        opponent_color = PlayerColor.WHITE if color == PlayerColor.BLACK else PlayerColor.BLACK
         pieces = self.get_pieces(color)
+        king_square = self.king_squares[color]
+        if king_square < 0:
+            # no king to keep out of check
+            return [(piece, move) for piece in pieces for move in piece.get_possible_moves(self)
+                    if (targets >> (move[0] * 8 + move[1])) & 1]
+
+        checkers, check_mask, pin_masks = self.find_checks_and_pins(color, king_square)
+        double_check = checkers & (checkers - 1)
 
-        king_moves = []
+        legal_moves = []
         for piece in pieces:
-            possible_moves = piece.get_possible_moves(self)
-            valid_piece_moves = [move for move in possible_moves if self.is_move_valid(piece, move)]
-
-            # Handle castling moves for King
-            if isinstance(piece, King) and not piece.has_moved and not self.is_king_in_check(color):
-                if self.can_castle_kingside(color):
-                    valid_piece_moves.append((piece.position[0], 6))
-                if self.can_castle_queenside(color):
-                    valid_piece_moves.append((piece.position[0], 2))
-
-            valid_moves.append((piece, valid_piece_moves))
-
-        return valid_moves
-        # for piece in pieces:
-        #     possible_moves = piece.get_possible_moves(self)
-        #     valid_piece_moves = [move for move in possible_moves if self.is_move_valid(piece, move)]
-        #     if isinstance(piece, King):
-        #         king_moves = valid_piece_moves
-        #                 # Handle castling moves for King
-        #     if piece.has_moved and not self.is_king_in_check(color):
-        #         if self.can_castle_kingside(color):
-        #             valid_piece_moves.append((piece.position[0], 6))
-        #         if self.can_castle_queenside(color):
-        #             valid_piece_moves.append((piece.position[0], 2))
-        #         king_moves.extend(valid_piece_moves)
-        #     valid_moves.append((piece, valid_piece_moves))
-        
-
-        
-        # valid_moves.append((piece, valid_piece_moves))
-
-        # return valid_moves
+            row, col = piece.position
+            square = row * 8 + col
+
+            if square == king_square:
+                # the king may not step onto an attacked square, including squares behind it on a checking ray
+                occupancy = self.occupancy & ~(1 << king_square)
+                for move in piece.get_possible_moves(self):
+                    if (targets >> (move[0] * 8 + move[1])) & 1 and \
+                            not self.is_square_attacked(move, opponent_color, occupancy):
+                        legal_moves.append((piece, move))
+
+                if not checkers:
+                    legal_moves.extend((piece, move) for move in self.get_castling_moves(color)
+                                       if (targets >> (move[0] * 8 + move[1])) & 1)
+                continue
+
+            if double_check:
+                continue
+
+            # a move must deal with a check and a pinned piece must stay on its pin ray
+            mask = targets & check_mask & pin_masks.get(square, FULL_BOARD)
+            for move in piece.get_possible_moves(self):
+                if (mask >> (move[0] * 8 + move[1])) & 1:
+                    legal_moves.append((piece, move))
+
+        return legal_moves
+
+    def find_checks_and_pins(self, color: PlayerColor, king_square: int) -> tuple[int, int, dict[int, int]]:
+        """
+        Looks outward from the king of the given player and returns:
+        the bitboard of checking pieces,
+        the bitboard of squares a non-king move must land on (checker and blocking squares, every square if not in check),
+        and for every pinned piece the bitboard of squares it may move to (the pin ray including the pinner).
+        """
+        opponent_color = PlayerColor.WHITE if color == PlayerColor.BLACK else PlayerColor.BLACK
+        enemy = self.bitboards[opponent_color]
+        own_occupancy = self.color_occupancy[color]
+        occupancy = self.occupancy
+
+        # knight and pawn checks can only be answered by capturing the checker
+        checkers = (KNIGHT_ATTACKS[king_square] & enemy[KNIGHT]) | (PAWN_ATTACKS[color][king_square] & enemy[PAWN])
+        check_mask = checkers
+        pin_masks = {}
+
+        # sliding pieces either check the king, pin the only own piece between them and the king, or neither
+        for slider_attacks, sliders in [
+            (rook_attacks, enemy[ROOK] | enemy[QUEEN]),
+            (bishop_attacks, enemy[BISHOP] | enemy[QUEEN]),
+        ]:
+            if not sliders:
+                continue
+            attacks = slider_attacks(king_square, occupancy)
+            for square in iter_squares(attacks & sliders):
+                checkers |= 1 << square
+                check_mask |= BETWEEN[king_square][square] | (1 << square)
+
+            # look through the first own piece on each ray for a slider behind it
+            xray_attacks = slider_attacks(king_square, occupancy ^ (attacks & own_occupancy))
+            for square in iter_squares(xray_attacks & ~attacks & sliders):
+                ray = BETWEEN[king_square][square]
+                pinned_square = (ray & own_occupancy).bit_length() - 1
+                pin_masks[pinned_square] = ray | (1 << square)
+
+        if not checkers:
+            check_mask = FULL_BOARD
+        return checkers, check_mask, pin_masks
+
+    def is_square_attacked(self, position: Position, by_color: PlayerColor, occupancy: Optional[int] = None) -> bool:
+        """
+        Returns true if any piece of by_color attacks the given square,
+        looking outward from the square with the attack tables of each piece type.
+        An occupancy bitboard can be passed to look through pieces, e.g. a king moving along a checking ray.
+        Uses the cached attack map of by_color instead when there is one.
+        """
+        row, col = position
+        square = row * 8 + col
+        if occupancy is None:
+            attack_map = self.attack_maps.get(by_color)
+            if attack_map is not None:
+                return bool((attack_map >> square) & 1)
+            occupancy = self.occupancy
+        attackers = self.bitboards[by_color]
+
+        # a pawn attacks the square if a pawn of the other color on the square would attack the pawn
+        defending_color = PlayerColor.WHITE if by_color == PlayerColor.BLACK else PlayerColor.BLACK
+        if PAWN_ATTACKS[defending_color][square] & attackers[PAWN] or \
+                KNIGHT_ATTACKS[square] & attackers[KNIGHT] or \
+                KING_ATTACKS[square] & attackers[KING]:
+            return True
+
+        rooks_queens = attackers[ROOK] | attackers[QUEEN]
+        if rooks_queens and rook_attacks(square, occupancy) & rooks_queens:
+            return True
+        bishops_queens = attackers[BISHOP] | attackers[QUEEN]
+        if bishops_queens and bishop_attacks(square, occupancy) & bishops_queens:
+            return True
+        return False
+
+    def get_castling_moves(self, color: PlayerColor) -> list[Position]:
+        """
+        Returns the king target squares of the castling moves available to the given player
+        """
+        row = 7 if color == PlayerColor.WHITE else 0
+        castling_moves = []
+        if self.can_castle_kingside(color):
+            castling_moves.append((row, 6))
+        if self.can_castle_queenside(color):
+            castling_moves.append((row, 2))
+        return castling_moves
+
+    def attackers_to(self, position: Position, occupancy: Optional[int] = None) -> int:
+        """
+        Returns the bitboard of pieces of both colors attacking the given square.
+        Pieces missing from the occupancy bitboard are treated as gone, so sliders behind them are revealed.
+        """
+        row, col = position
+        square = row * 8 + col
+        if occupancy is None:
+            occupancy = self.occupancy
+        white = self.bitboards[PlayerColor.WHITE]
+        black = self.bitboards[PlayerColor.BLACK]
+
+        # white pawns attack the square from where a black pawn on it would attack, and the other way around
+        attackers = (BLACK_PAWN_ATTACKS[square] & white[PAWN]) | (WHITE_PAWN_ATTACKS[square] & black[PAWN])
+        attackers |= KNIGHT_ATTACKS[square] & (white[KNIGHT] | black[KNIGHT])
+        attackers |= KING_ATTACKS[square] & (white[KING] | black[KING])
+        attackers |= rook_attacks(square, occupancy) & (white[ROOK] | white[QUEEN] | black[ROOK] | black[QUEEN])
+        attackers |= bishop_attacks(square, occupancy) & (white[BISHOP] | white[QUEEN] | black[BISHOP] | black[QUEEN])
+        return attackers & occupancy
+
+    def piece_attacks(self, position: Position, occupancy: Optional[int] = None) -> int:
+        """
+        Returns the bitboard of squares attacked by the piece on the given square,
+        own pieces included since they are defended
+        """
+        row, col = position
+        square = row * 8 + col
+        if occupancy is None:
+            occupancy = self.occupancy
+        piece = self.board[row][col]
+        piece_type = PIECE_INDEX[type(piece)]
+
+        if piece_type == PAWN:
+            return PAWN_ATTACKS[piece.color][square]
+        if piece_type == KNIGHT:
+            return KNIGHT_ATTACKS[square]
+        if piece_type == KING:
+            return KING_ATTACKS[square]
+        if piece_type == BISHOP:
+            return bishop_attacks(square, occupancy)
+        if piece_type == ROOK:
+            return rook_attacks(square, occupancy)
+        return rook_attacks(square, occupancy) | bishop_attacks(square, occupancy)
+
+    def attack_map(self, color: PlayerColor) -> int:
+        """
+        Returns the bitboard of every square attacked by the given player.
+        The map is cached until the next change to the board and is then used by is_square_attacked.
+        """
+        attack_map = self.attack_maps.get(color)
+        if attack_map is None:
+            attack_map = 0
+            for square in iter_squares(self.color_occupancy[color]):
+                attack_map |= self.piece_attacks((square >> 3, square & 7))
+            self.attack_maps[color] = attack_map
+        return attack_map
 
     def move_piece(self, piece: ChessPiece, new_position: Position) -> bool:
         """
@@ -147,46 +565,105 @@ class ChessBoard:
             print("Illegal move:/")
             return False
 
-        old_row, old_col = piece.position
+        self.make_move((piece, new_position))
+        return True
+
+    def make_move(self, move: Move):
+        """
+        Plays a move in place without checking that it is legal.
+        Pushes an undo record so unmake_move can restore the board exactly.
+        """
+        piece, new_position = move
+        old_position = piece.position
+        old_row, old_col = old_position
         new_row, new_col = new_position
 
         # record move
-        self.moves.append((piece.to_str(), piece.position, new_position))
+        self.moves.append((piece.to_str(), old_position, new_position))
 
         # Move the piece
-        self.board[old_row][old_col] = None
-        self.board[new_row][new_col] = piece
+        captured = self.remove_piece(new_position)
+        self.remove_piece(old_position)
+        self.place_piece(piece, new_position)
         piece.position = new_position
 
         # If Castle move: Move the Rook as well
+        castle = None
         if isinstance(piece, King) and not piece.has_moved and abs(old_col - new_col) == 2:
-            # Castling kingside
-            if new_col > old_col:
-                rook = self.get_piece((old_row, 7))
-                if rook is not None and not rook.has_moved:
-                    self.board[old_row][7] = None
-                    self.board[old_row][5] = rook
-                    rook.position = (old_row, 5)
-                    rook.has_moved = True
-                else:
-                    print("Illegal move:/")
-                    return False
-            # Castling queenside
-            else:
-                rook = self.get_piece((old_row, 0))
-                if rook is not None and not rook.has_moved:
-                    self.board[old_row][0] = None
-                    self.board[old_row][3] = rook
-                    rook.position = (old_row, 3)
-                    rook.has_moved = True
-                else:
-                    print("Illegal move:/")
-                    return False
-        
+            rook_col, rook_new_col = (7, 5) if new_col > old_col else (0, 3)
+            rook = self.remove_piece((old_row, rook_col))
+            self.place_piece(rook, (old_row, rook_new_col))
+            rook.position = (old_row, rook_new_col)
+            castle = (rook, (old_row, rook_col), rook.has_moved)
+            rook.has_moved = True
+
         # Castling Purposes: If piece=King or Rook, set has_moved to True
+        had_moved = None
         if isinstance(piece, King) or isinstance(piece, Rook):
+            had_moved = piece.has_moved
             piece.has_moved = True
-        return True
+
+        # update castling rights and side to move in the zobrist key
+        castling_rights = self.castling_rights
+        self.castling_rights &= CASTLING_RIGHTS_KEPT[old_row * 8 + old_col] & CASTLING_RIGHTS_KEPT[new_row * 8 + new_col]
+        self.zobrist_key ^= CASTLING_KEYS[castling_rights] ^ CASTLING_KEYS[self.castling_rights]
+
+        turn = self.turn
+        self.turn = PlayerColor.WHITE if piece.color == PlayerColor.BLACK else PlayerColor.BLACK
+        if self.turn != turn:
+            self.zobrist_key ^= BLACK_TO_MOVE_KEY
+
+        self.undo_stack.append((piece, old_position, captured, had_moved, castle, castling_rights, turn))
+
+    def unmake_move(self):
+        """
+        Takes back the last move played with make_move
+        """
+        piece, old_position, captured, had_moved, castle, castling_rights, turn = self.undo_stack.pop()
+        self.moves.pop()
+
+        self.zobrist_key ^= CASTLING_KEYS[self.castling_rights] ^ CASTLING_KEYS[castling_rights]
+        self.castling_rights = castling_rights
+        if self.turn != turn:
+            self.zobrist_key ^= BLACK_TO_MOVE_KEY
+        self.turn = turn
+
+        if castle is not None:
+            rook, rook_position, rook_had_moved = castle
+            self.remove_piece(rook.position)
+            self.place_piece(rook, rook_position)
+            rook.position = rook_position
+            rook.has_moved = rook_had_moved
+
+        new_position = piece.position
+        self.remove_piece(new_position)
+        self.place_piece(piece, old_position)
+        piece.position = old_position
+        if had_moved is not None:
+            piece.has_moved = had_moved
+
+        if captured is not None:
+            self.place_piece(captured, new_position)
+
+    def make_null_move(self):
+        """
+        Passes the turn to the other player without moving a piece, for null move pruning.
+        Taken back with unmake_null_move, in the same order as moves made with make_move.
+        """
+        self.undo_stack.append(None)
+        self.turn = PlayerColor.WHITE if self.turn == PlayerColor.BLACK else PlayerColor.BLACK
+        self.zobrist_key ^= BLACK_TO_MOVE_KEY
+
+    def unmake_null_move(self):
+        """Takes back the last null move played with make_null_move"""
+        self.undo_stack.pop()
+        self.turn = PlayerColor.WHITE if self.turn == PlayerColor.BLACK else PlayerColor.BLACK
+        self.zobrist_key ^= BLACK_TO_MOVE_KEY
+
+    def has_non_pawn_material(self, color: PlayerColor) -> bool:
+        """Returns true if the given player has a piece other than pawns and the king"""
+        bitboards = self.bitboards[color]
+        return bool(bitboards[KNIGHT] | bitboards[BISHOP] | bitboards[ROOK] | bitboards[QUEEN])
 
     def get_opponent_possible_moves_without_check(self, color: PlayerColor) -> list[Position]:
         """
@@ -206,18 +683,12 @@ class ChessBoard:
         """
         Returns true if the king for the given player is in check under the current board position
         """
-        king_position: Optional[Position] = None
-        for row in range(8):
-            for col in range(8):
-                piece = self.get_piece((row, col))
-                if piece and piece.color == color and isinstance(piece, King):
-                    king_position = (row, col)
-                    break
-            if king_position:
-                break
+        king_square = self.king_squares[color]
+        if king_square < 0:
+            return False
 
-        opponent_possible_moves = self.get_opponent_possible_moves_without_check(color)
-        return king_position in opponent_possible_moves
+        opponent_color = PlayerColor.WHITE if color == PlayerColor.BLACK else PlayerColor.BLACK
+        return self.is_square_attacked((king_square >> 3, king_square & 7), opponent_color)
 
     def is_checkmate(self, color: PlayerColor) -> bool:
         """
@@ -226,23 +697,7 @@ class ChessBoard:
         if not self.is_king_in_check(color):
             return False
 
-        possible_moves_per_piece = self.get_possible_moves(color)
-        for curr_piece, possible_moves in possible_moves_per_piece:
-            # Create a copy of the board and make the move
-            for move in possible_moves:
-                board_copy = deepcopy(self)
-                piece_copy = deepcopy(curr_piece)
-                
-                # Try the move and continue to the next move if it is invalid
-                move_result = board_copy.move_piece(piece_copy, move)
-                if not move_result:
-                    continue
-
-                # Check if the king is still in check after the move
-                if not board_copy.is_king_in_check(color):
-                    return False
-
-        return True
+        return not self.has_legal_move(color)
 
 
     def is_stalemate(self, color: PlayerColor) -> bool:
@@ -252,23 +707,14 @@ class ChessBoard:
         if self.is_king_in_check(color):
             return False
 
-        possible_moves_per_piece = self.get_possible_moves(color)
-        for curr_piece, possible_moves in possible_moves_per_piece:
-            # Create a copy of the board and make the move
-            for move in possible_moves:
-                board_copy = deepcopy(self)
-                piece_copy = deepcopy(curr_piece)
-                
-                # Try the move and continue to the next move if it is invalid
-                move_result = board_copy.move_piece(piece_copy, move)
-                if not move_result:
-                    continue
-
-                # Check if the king is still in check after the move
-                if not board_copy.is_king_in_check(color):
-                    return False
+        return not self.has_legal_move(color)
 
-        return True
+    def has_legal_move(self, color: PlayerColor) -> bool:
+        """
+        Returns true if the given player has at least one legal move.
+        Every move returned by get_possible_moves already leaves the king out of check.
+        """
+        return any(possible_moves for _, possible_moves in self.get_possible_moves(color))
 
 
     # Game Score Function
@@ -276,102 +722,98 @@ class ChessBoard:
         '''
         This function will return a score for the current board state
         If white is winning it would return a positive number, if black is winning negative.
-        If either side is in checkmate it will return inf or -inf
+        If either side is in checkmate it will return -inf or inf
+        The material and position scores are running totals updated as pieces are placed and removed,
+        only checks and checkmates are looked at here.
         '''
-        if self.is_checkmate(PlayerColor.WHITE):
+        white_in_check = self.is_king_in_check(PlayerColor.WHITE)
+        black_in_check = not white_in_check and self.is_king_in_check(PlayerColor.BLACK)
+
+        if white_in_check and not self.has_legal_move(PlayerColor.WHITE):
             print("i have been checkmated by a robot...")
-            return float("infinity")
-        elif self.is_checkmate(PlayerColor.BLACK):
-            print("checkmate bitch")
             return -float("infinity")
-        else:
-            score = 0
-            for row in range(8):
-                for col in range(8):
-                    piece = self.get_piece((row, col))
-                    if piece is not None:
-                        row_flip = row if piece.color == PlayerColor.WHITE else 7-row
-
-                        # calculate a multiplier based on the position of the piece
-                        position_score = 0
-                        if isinstance(piece, Pawn):
-                            position_score += pst_pawn[row_flip][col]
-                        elif isinstance(piece, Knight):
-                            position_score += pst_knight[row_flip][col]
-                        elif isinstance(piece, Bishop):
-                            position_score += pst_bishop[row_flip][col]
-                        elif isinstance(piece, Rook):
-                            position_score += pst_rook[row_flip][col]
-                        elif isinstance(piece, Queen):
-                            position_score += pst_queen[row_flip][col]
-                        elif isinstance(piece, King):
-                            position_score += pst_king[row_flip][col]
-                        
-                        position_multiple = (position_score + 100) / 100
-                        added_score = piece.value * 10 * position_multiple
-
-                        min_max_multiplier = 1 if piece.color == PlayerColor.WHITE else -1
-                        score += added_score * min_max_multiplier # multiply by -1 if player is black
-
-                        mobility = len(piece.get_possible_moves(self)) * 0.2
-                        added_score += mobility
-
-        if self.is_king_in_check(PlayerColor.WHITE):
+        elif black_in_check and not self.has_legal_move(PlayerColor.BLACK):
+            print("checkmate bitch")
+            return float("infinity")
+
+        score = self.material_score + self.position_score
+        if white_in_check:
             score -= 10
-        elif self.is_king_in_check(PlayerColor.BLACK):
+        elif black_in_check:
             score += 10
         return score
 
+    def compute_evaluation_scores(self) -> tuple[float, float]:
+        """
+        Computes the material and position scores from scratch.
+        material_score and position_score hold the same values, updated incrementally.
+        """
+        material_score = 0
+        position_score = 0
+        for color in [PlayerColor.WHITE, PlayerColor.BLACK]:
+            for piece in self.get_pieces(color):
+                row, col = piece.position
+                row_flip = row if piece.color == PlayerColor.WHITE else 7-row
+                pst = PIECE_SQUARE_TABLES[PIECE_INDEX[type(piece)]]
+
+                min_max_multiplier = 1 if piece.color == PlayerColor.WHITE else -1  # multiply by -1 if player is black
+                material_score += piece.value * 10 * min_max_multiplier
+                position_score += piece.value * pst[row_flip][col] / 10 * min_max_multiplier
+        return material_score, position_score
+
     def __hash__(self):
-        # Use a tuple of tuples containing the board state as the hash input
-        return hash(tuple(tuple(self.board[row][col] for col in range(8)) for row in range(8)))
+        # The zobrist key identifies the position, including side to move and castling rights
+        return self.zobrist_key
 
     def can_castle_kingside(self, color: PlayerColor) -> bool:
-            
-            row = 7 if color == PlayerColor.WHITE else 0
-            king = self.get_piece((row, 4))
-            rook = self.get_piece((row, 7))
-            if not isinstance(king, King) or king.has_moved:
+        """
+        Returns true if the given player can castle kingside: the castling right is kept,
+        f and g are empty and the king is not in check and does not pass through or land on an attacked square
+        """
+        opponent_color = PlayerColor.WHITE if color == PlayerColor.BLACK else PlayerColor.BLACK
+        row, right = (7, WHITE_KINGSIDE) if color == PlayerColor.WHITE else (0, BLACK_KINGSIDE)
+        if not self.castling_rights & right:
+            return False
+
+        # Check if squares between king and rook are empty
+        for col in range(5, 7):
+            if not self.is_square_empty((row, col)):
                 return False
-            if not isinstance(rook, Rook) or rook.has_moved:
+
+        # Check if squares king moves through are not attacked
+        for col in range(4, 7):
+            if self.is_square_attacked((row, col), opponent_color):
                 return False
-            
-            # Check if squares between king and rook are empty
-            for col in range(5, 7):
-                if not self.is_square_empty((row, col)):
-                    return False
-
-            # Check if squares king moves through are not attacked
-            opponent_possible_moves = self.get_opponent_possible_moves_without_check(color)
-            for col in range(4, 8):
-                if (row, col) in opponent_possible_moves:
-                    return False
-            return True
-    
+        return True
+
     def can_castle_queenside(self, color: PlayerColor) -> bool:
-            row = 7 if color == PlayerColor.WHITE else 0
-            king = self.get_piece((row, 4))
-            rook = self.get_piece((row, 0))
-            if not isinstance(king, King) or king.has_moved:
+        """
+        Returns true if the given player can castle queenside: the castling right is kept,
+        b, c and d are empty and the king is not in check and does not pass through or land on an attacked square
+        """
+        opponent_color = PlayerColor.WHITE if color == PlayerColor.BLACK else PlayerColor.BLACK
+        row, right = (7, WHITE_QUEENSIDE) if color == PlayerColor.WHITE else (0, BLACK_QUEENSIDE)
+        if not self.castling_rights & right:
+            return False
+
+        # Check if squares between king and rook are empty
+        for col in range(1, 3+1):
+            if not self.is_square_empty((row, col)):
                 return False
-            if not isinstance(rook, Rook) or rook.has_moved:
+
+        # Check if squares king moves through are not attacked
+        for col in range(2, 4+1):
+            if self.is_square_attacked((row, col), opponent_color):
                 return False
-            
-            # Check if squares between king and rook are empty
-            for col in range(1, 3+1):
-                if not self.is_square_empty((row, col)):
-                    return False
-
-            # Check if squares king moves through are not attacked
-            opponent_possible_moves = self.get_opponent_possible_moves_without_check(color)
-            for col in range(0, 4+1):
-                if (row, col) in opponent_possible_moves:
-                    return False
-            return True  
-    
+        return True
 
     def __deepcopy__(self, memo):
         new_board = ChessBoard()
         new_board.board = deepcopy(self.board, memo)
         new_board.moves = copy(self.moves)
+        new_board.undo_stack = deepcopy(self.undo_stack, memo)
+        new_board.sync_bitboards()
+        new_board.turn = self.turn
+        new_board.castling_rights = self.castling_rights
+        new_board.zobrist_key = self.zobrist_key
         return new_board
\ No newline at end of file
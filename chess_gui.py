@@ -1,17 +1,46 @@
+import argparse
+import multiprocessing
 import tkinter as tk
 import threading
+import time
 from PIL import ImageTk, Image  # pip install pillow
 from typing import Optional
 from chess_board import ChessBoard, Position
 from pieces.chess_piece import PlayerColor
-from engine import minimax, get_best_move
+from engine import MAX_SEARCH_DEPTH, minimax, get_best_move, SearchStats, TimeControl, allocate_time
+from transposition_table import TranspositionTable, SharedTranspositionTable
+from profiling import MoveProfiler
+from pondering import Ponderer
+from util import position_to_string
 
 class ChessGUI(tk.Tk):
-    def __init__(self, board: ChessBoard):
+    def __init__(
+            self, board: ChessBoard, profiler: Optional[MoveProfiler] = None, workers: int = 1, root_split: bool = False,
+            clock: Optional[float] = None, increment: float = 0.0, ponder: bool = False,
+    ):
         self.board = board
         self.selected_piece: Optional[Position] = None
         self.current_player = PlayerColor.WHITE
 
+        # kept for the whole game so each engine move reuses earlier search results
+        # with several search processes the table lives in shared memory so they all use it
+        self.workers = workers
+        self.root_split = root_split
+        self.transposition_table = TranspositionTable(size_mb=64) if workers == 1 else SharedTranspositionTable(size_mb=64)
+
+        # profiles every engine move when set
+        self.profiler = profiler
+
+        # seconds left on the engine's clock, without a clock every move gets a fixed time
+        self.engine_clock = clock
+        self.increment = increment
+        # without a clock the search stops at a fixed depth, with one the clock decides how deep to search
+        self.max_depth = 5 if clock is None else MAX_SEARCH_DEPTH
+
+        # searches the expected reply while white thinks, single process searches only
+        # it stops at the same depth as the normal search, so a ponder hit answers no later than a normal move
+        self.ponderer = Ponderer(self.transposition_table, self.max_depth) if ponder and workers == 1 else None
+
         # self.window = tk.Tk()
         # self.window.title("Chess")
         # self.canvas = tk.Canvas(self.window, width=640, height=640)
@@ -122,8 +151,31 @@ class ChessGUI(tk.Tk):
 
     def play_black_move(self):
         print("getting black move...")
-        best_piece, best_move = get_best_move(self.board, PlayerColor.BLACK, max_depth=5, max_time=15)
+        stats = SearchStats()
+        time_control = TimeControl(self.engine_clock, self.increment) if self.engine_clock is not None else None
+        start_time = time.time()
+        best_piece, best_move = None, None
+        if self.ponderer is not None and self.ponderer.pondering:
+            _, old_position, new_position = self.board.moves[-1]
+            white_move = (position_to_string(old_position) + position_to_string(new_position)).lower()
+            soft_limit, hard_limit = allocate_time(time_control) if time_control is not None else (15, 15)
+            move_string = self.ponderer.finish(white_move, soft_limit, hard_limit)
+            if move_string is not None:
+                print(f"ponder hit: {white_move}")
+                stats = self.ponderer.stats
+                best_piece, best_move = self.board.parse_move(move_string) or (None, None)
+
+        if best_piece is None:
+            best_piece, best_move = get_best_move(
+                self.board, PlayerColor.BLACK, max_depth=self.max_depth, max_time=15,
+                transposition_table=self.transposition_table, stats=stats, profiler=self.profiler,
+                workers=self.workers, root_split=self.root_split, time_control=time_control,
+            )
+        if self.engine_clock is not None:
+            self.engine_clock += self.increment - (time.time() - start_time)
+            print(f"engine clock: {self.engine_clock:.1f}s")
         print(f"best move: {best_piece}, {best_move}")
+        print(f"search stats: {stats}")
         if best_move:
             self.board.move_piece(best_piece, best_move)
             self.window.after(0, self.refresh_board_and_switch_player)
@@ -132,6 +184,10 @@ class ChessGUI(tk.Tk):
             move_text = f"{self.current_player.name.capitalize()}: {self.board.moves[-1]}\n"
             self.move_history.insert(tk.END, move_text)
 
+            # think about the reply the search expects while white is thinking
+            if self.ponderer is not None and len(stats.principal_variation) >= 2:
+                self.ponderer.start(self.board, PlayerColor.BLACK, stats.principal_variation[1])
+
         print(f"board score: {self.board.evaluation_function()}")
 
     def refresh_board_and_switch_player(self):
@@ -160,6 +216,29 @@ class ChessGUI(tk.Tk):
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play chess against the engine")
+    parser.add_argument("--profile", metavar="DIR",
+                        help="profile every engine move, saving the profiles and a game summary to DIR")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="search with this many processes sharing one transposition table (Lazy SMP)")
+    parser.add_argument("--root-split", action="store_true",
+                        help="with --workers, split the root moves over the processes instead")
+    parser.add_argument("--clock", type=float, metavar="MINUTES",
+                        help="give the engine a game clock instead of a fixed 15 seconds per move")
+    parser.add_argument("--increment", type=float, default=0.0, metavar="SECONDS",
+                        help="with --clock, seconds added to the engine's clock after every move")
+    parser.add_argument("--ponder", action="store_true",
+                        help="search the expected reply while you think, with a single search process")
+    args = parser.parse_args()
+
+    # as in uci.py: search processes forked from this multithreaded process could inherit a held lock and hang
+    if args.workers > 1 and "forkserver" in multiprocessing.get_all_start_methods():
+        multiprocessing.set_start_method("forkserver")
+
     chess_board = ChessBoard()
-    gui = ChessGUI(chess_board)
+    gui = ChessGUI(chess_board, profiler=MoveProfiler(args.profile) if args.profile else None, workers=args.workers,
+                   root_split=args.root_split, clock=args.clock * 60 if args.clock else None, increment=args.increment,
+                   ponder=args.ponder)
     gui.run()
+    if args.workers > 1:
+        gui.transposition_table.close()
@@ -1,13 +1,321 @@
-from copy import deepcopy
-from typing import List, Tuple, Optional
+from contextlib import nullcontext
+from itertools import chain
+from typing import Callable, Iterator, List, NamedTuple, Tuple, Optional
+import multiprocessing
 import random
 import time
 
-from chess_board import ChessBoard, Position
+from bitboard import (
+    FULL_BOARD, PAWN, BISHOP, ROOK, QUEEN, KING, PIECE_TYPE_COUNT, rook_attacks, bishop_attacks,
+)
+from chess_board import ChessBoard, Position, PIECE_INDEX, move_to_string
 from pieces.chess_piece import ChessPiece, PlayerColor
+from transposition_table import (
+    TranspositionTable, SharedTranspositionTable, EXACT, LOWER_BOUND, UPPER_BOUND, encode_move, decode_move,
+)
+from profiling import MoveProfiler
 
 from util import string_to_position, position_to_string
 
+try:
+    from batch_evaluation import evaluate_moves  # needs numpy
+except ImportError:
+    evaluate_moves = None
+
+
+class SearchStats:
+    """
+    Counters filled in by a search, pass one to iterative_deepening_minimax or get_best_move to read them afterwards.
+    The counters are plain integer increments, cheap enough to keep on in every search.
+
+    nodes: calls to minimax, leaf_evaluations: positions scored by the evaluation function,
+    cutoffs: nodes that stopped searching moves once beta <= alpha, first_move_cutoffs: those that stopped after the first move,
+    tt_probes / tt_hits: transposition table lookups and lookups that found the position,
+    tt_cutoffs: nodes answered by the stored result, lmr_researches: reduced moves searched again at full depth,
+    null_move_cutoffs / futility_prunes / razorings: nodes and moves cut by each selective pruning, see PruningOptions,
+    pvs_researches: moves that beat the null window of principal variation search and were searched again,
+    aspiration_researches: iterations searched again with a wider window after failing outside the aspiration window.
+    depth_times and depth_nodes hold the elapsed seconds and node count at the end of each completed depth,
+    depth_moves the best move and score found at each completed depth,
+    principal_variation the best line of the last completed depth in coordinate notation.
+    """
+
+    def __init__(self):
+        self.nodes = 0
+        self.leaf_evaluations = 0
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        self.tt_probes = 0
+        self.tt_hits = 0
+        self.tt_cutoffs = 0
+        self.lmr_researches = 0
+        self.null_move_cutoffs = 0
+        self.futility_prunes = 0
+        self.razorings = 0
+        self.pvs_researches = 0
+        self.aspiration_researches = 0
+        self.depth_times: list[float] = []
+        self.depth_nodes: list[int] = []
+        self.depth_moves: list[Tuple[Optional[ChessPiece], Optional[Position], Optional[float]]] = []
+        self.principal_variation: list[str] = []
+
+    def add(self, other: "SearchStats"):
+        """Adds the counters of another search, e.g. one of several parallel searches"""
+        self.nodes += other.nodes
+        self.leaf_evaluations += other.leaf_evaluations
+        self.cutoffs += other.cutoffs
+        self.first_move_cutoffs += other.first_move_cutoffs
+        self.tt_probes += other.tt_probes
+        self.tt_hits += other.tt_hits
+        self.tt_cutoffs += other.tt_cutoffs
+        self.lmr_researches += other.lmr_researches
+        self.null_move_cutoffs += other.null_move_cutoffs
+        self.futility_prunes += other.futility_prunes
+        self.razorings += other.razorings
+        self.pvs_researches += other.pvs_researches
+        self.aspiration_researches += other.aspiration_researches
+
+    @property
+    def depth_reached(self) -> int:
+        return len(self.depth_times)
+
+    @property
+    def first_move_cutoff_rate(self) -> float:
+        """Share of cutoffs caused by the first move searched, a measure of move ordering"""
+        return self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0
+
+    @property
+    def tt_hit_rate(self) -> float:
+        return self.tt_hits / self.tt_probes if self.tt_probes else 0.0
+
+    def as_dict(self) -> dict:
+        """Returns the counters as a JSON serializable dict"""
+        return {
+            "nodes": self.nodes,
+            "leaf_evaluations": self.leaf_evaluations,
+            "cutoffs": self.cutoffs,
+            "first_move_cutoffs": self.first_move_cutoffs,
+            "first_move_cutoff_rate": self.first_move_cutoff_rate,
+            "tt_probes": self.tt_probes,
+            "tt_hits": self.tt_hits,
+            "tt_cutoffs": self.tt_cutoffs,
+            "lmr_researches": self.lmr_researches,
+            "null_move_cutoffs": self.null_move_cutoffs,
+            "futility_prunes": self.futility_prunes,
+            "razorings": self.razorings,
+            "pvs_researches": self.pvs_researches,
+            "aspiration_researches": self.aspiration_researches,
+            "depth_reached": self.depth_reached,
+            "depth_times": self.depth_times,
+            "depth_nodes": self.depth_nodes,
+        }
+
+    def __str__(self):
+        elapsed = self.depth_times[-1] if self.depth_times else 0.0
+        return (f"depth {self.depth_reached} nodes {self.nodes} time {elapsed:.3f}s "
+                f"nps {self.nodes / elapsed if elapsed > 0 else 0:.0f} evaluations {self.leaf_evaluations} "
+                f"cutoffs {self.cutoffs} (first move {self.first_move_cutoff_rate:.0%}) "
+                f"tt hits {self.tt_hits}/{self.tt_probes} lmr re-searches {self.lmr_researches} "
+                f"null move cutoffs {self.null_move_cutoffs} futility prunes {self.futility_prunes} "
+                f"razorings {self.razorings} pvs re-searches {self.pvs_researches} "
+                f"aspiration re-searches {self.aspiration_researches}")
+
+
+class PruningOptions(NamedTuple):
+    """
+    Switches for the selective pruning in minimax, all on by default.
+
+    null_move: pass the turn and search shallower, if the opponent still can't get below beta a real move won't either.
+    Not done in check, right after another null move, or with only pawns left where passing could be the best move (zugzwang).
+    futility: at depth 1, skip quiet moves that don't give check when the static score is too far below alpha to catch up.
+    razoring: at depth 2, search only one ply when the static score is far below alpha.
+    """
+    null_move: bool = True
+    futility: bool = True
+    razoring: bool = True
+
+
+NO_PRUNING = PruningOptions(null_move=False, futility=False, razoring=False)
+
+NULL_MOVE_REDUCTION = 2
+NULL_WINDOW = 0.5  # scores are multiples of 0.5, see chess_board.py
+FUTILITY_MARGIN = 30  # three pawns
+RAZOR_MARGIN = 40
+
+# the clock is read once per this many nodes, reading it at every node costs more than a node's own work
+TIME_CHECK_INTERVAL = 256
+DEFAULT_MOVES_TO_GO = 30  # moves the remaining clock is split over when the time control doesn't say
+MOVE_OVERHEAD = 0.05  # seconds kept back per move for everything around the search
+HARD_LIMIT_FACTOR = 3  # how far past its share of the clock a move may run before the search is aborted
+STABLE_ITERATIONS = 3  # completed depths with the same best move after which half the soft limit is enough
+MAX_SEARCH_DEPTH = 64
+
+
+class TimeControl(NamedTuple):
+    """
+    The engine's clock for a move: seconds left, seconds added after every move,
+    and moves until the next time control (None for the rest of the game)
+    """
+    remaining: float
+    increment: float = 0.0
+    moves_to_go: Optional[int] = None
+
+
+def allocate_time(time_control: TimeControl) -> Tuple[float, float]:
+    """
+    Returns the soft and hard time limits in seconds for a move.
+    The soft limit is an even share of the remaining clock plus most of the increment, no new depth is started after it.
+    The hard limit aborts the search in the middle of a depth, it is a few times the soft limit
+    but never more than half the clock, or all of it on the last move before the time control.
+    """
+    available = max(time_control.remaining - MOVE_OVERHEAD, 0.0)
+    moves_to_go = time_control.moves_to_go or DEFAULT_MOVES_TO_GO
+    soft_limit = min(available / moves_to_go + time_control.increment * 0.75, available)
+    hard_limit = min(soft_limit * HARD_LIMIT_FACTOR, available if moves_to_go == 1 else available / 2)
+    return min(soft_limit, hard_limit), hard_limit
+
+
+class SearchTimer:
+    """
+    Decides when a search stops, shared by all its nodes.
+
+    soft_limit: seconds after which no new depth of iterative deepening is started.
+    hard_limit: seconds after which the search is aborted wherever it is, defaults to the soft limit.
+    node_limit: nodes after which the search is aborted.
+    minimax calls should_abort at every node, which counts it and only reads the clock every TIME_CHECK_INTERVAL nodes.
+    stop() aborts the search from another thread, e.g. the GUI or the UCI stop command. Searches in other processes
+    share a stop_event (a multiprocessing.Event) with it, which stop() sets and should_abort polls with the clock.
+    """
+
+    def __init__(self, soft_limit: Optional[float] = None, hard_limit: Optional[float] = None,
+                 start_time: Optional[float] = None, node_limit: Optional[int] = None, stop_event=None):
+        self.start_time = time.time() if start_time is None else start_time
+        self.soft_limit = float('inf') if soft_limit is None else soft_limit
+        self.hard_limit = self.soft_limit if hard_limit is None else hard_limit
+        self.node_limit = float('inf') if node_limit is None else node_limit
+        self.stop_event = stop_event
+        self.nodes = 0
+        self.nodes_until_check = TIME_CHECK_INTERVAL
+        self.stopped = False
+
+    def elapsed(self) -> float:
+        """Returns the seconds since the search started"""
+        return time.time() - self.start_time
+
+    def restart(self, soft_limit: Optional[float] = None, hard_limit: Optional[float] = None):
+        """Starts the clock again with new limits, e.g. when a ponder search becomes the search for the move"""
+        self.start_time = time.time()
+        self.soft_limit = float('inf') if soft_limit is None else soft_limit
+        self.hard_limit = self.soft_limit if hard_limit is None else hard_limit
+
+    def stop(self):
+        """Aborts the search at the next node"""
+        self.stopped = True
+        if self.stop_event is not None:
+            self.stop_event.set()
+
+    def should_abort(self) -> bool:
+        """
+        Returns whether the search has to stop now: stop() was called or a hard limit passed.
+        Otherwise the node is searched and counted towards the node limit.
+        """
+        if self.stopped:
+            return True
+        if self.nodes >= self.node_limit:
+            self.stopped = True
+            return True
+        self.nodes += 1
+        self.nodes_until_check -= 1
+        if self.nodes_until_check > 0:
+            return False
+        self.nodes_until_check = TIME_CHECK_INTERVAL
+        if self.elapsed() >= self.hard_limit or (self.stop_event is not None and self.stop_event.is_set()):
+            self.stopped = True
+        return self.stopped
+
+    def soft_limit_reached(self, stable_iterations: int = 0) -> bool:
+        """
+        Returns whether iterative deepening should stop instead of starting another depth.
+        A best move that stayed the same for STABLE_ITERATIONS depths is not expected to change, half the soft limit is enough.
+        """
+        soft_limit = self.soft_limit / 2 if stable_iterations >= STABLE_ITERATIONS else self.soft_limit
+        return self.stopped or self.elapsed() >= soft_limit or self.nodes >= self.node_limit
+
+
+class FirstDepthTimer(SearchTimer):
+    """
+    The timer of iterative deepening's first depth, which has no move to fall back on if it is cut short:
+    it keeps to the node limit of the search's timer and stops with it, but ignores its time limits.
+    """
+
+    def __init__(self, timer: SearchTimer):
+        super().__init__(node_limit=timer.node_limit - timer.nodes, stop_event=timer.stop_event)
+        self.timer = timer
+
+    def should_abort(self) -> bool:
+        if self.timer.stopped:
+            self.stopped = True
+        return super().should_abort()
+
+
+# half width of the first aspiration window around the previous iteration's score, doubled after every fail
+ASPIRATION_WINDOW = 40
+ASPIRATION_MAX_WINDOW = 80  # past this the window is opened all the way
+
+# move_score ranks winning and even captures first, then the killer moves, then the other quiet moves by history,
+# and losing captures last
+GOOD_CAPTURE_SCORE = 1_000_000
+KILLER_SCORE = 900_000
+KILLER_SLOTS = 2
+HISTORY_MAX = 100_000  # all history scores are halved once one gets past this
+CENTRAL_SQUARES = {(3, 3), (3, 4), (4, 3), (4, 4)}
+
+# piece values in pawns for static exchange evaluation by piece type, the king is never given up
+SEE_VALUES = [1, 3, 3, 5, 9, 100]
+
+
+class MoveOrdering:
+    """
+    Move ordering heuristics learned during a search, shared by all its nodes and kept across iterations.
+
+    killers: per ply, the last quiet moves that caused a beta cutoff there, most recent first.
+    They are often good in the sibling positions of the same ply.
+    history: per color, a butterfly table indexed by encoded move (start square * 64 + target square),
+    adding depth squared for every cutoff a quiet move caused anywhere in the tree.
+    """
+
+    def __init__(self):
+        self.killers: list[list[int]] = []
+        self.history = {color: [0] * 64 * 64 for color in PlayerColor}
+
+    def new_search(self):
+        """Forgets the killers and halves the history, so the last search only guides the next one"""
+        self.killers = []
+        for table in self.history.values():
+            for index, value in enumerate(table):
+                if value:
+                    table[index] = value >> 1
+
+    def killers_at(self, ply: int) -> list[int]:
+        """Returns the killer moves of a ply, most recent first"""
+        return self.killers[ply] if ply < len(self.killers) else []
+
+    def add_cutoff(self, color: PlayerColor, encoded_move: int, ply: int, depth: int):
+        """Records a quiet move that caused a beta cutoff at the given ply and remaining depth"""
+        while len(self.killers) <= ply:
+            self.killers.append([])
+        killers = self.killers[ply]
+        if encoded_move in killers:
+            killers.remove(encoded_move)
+        killers.insert(0, encoded_move)
+        del killers[KILLER_SLOTS:]
+
+        table = self.history[color]
+        table[encoded_move] += depth * depth
+        if table[encoded_move] > HISTORY_MAX:
+            for index, value in enumerate(table):
+                table[index] = value >> 1
+
 
 def minimax(
         board_state: ChessBoard, 
@@ -15,10 +323,16 @@ def minimax(
         player_color: PlayerColor, 
         alpha: float = -float('inf'), 
         beta: float = float('inf'),
-        cache: Optional[dict[str, tuple[Optional[ChessPiece], Optional[Position], int]]] = None,
-        start_time: time = None,
-        time_limit: time = None,
+        transposition_table: Optional[TranspositionTable] = None,
+        timer: Optional[SearchTimer] = None,
         lmr_move_count: int = 100,
+        batch_frontier: bool = False,
+        stats: Optional[SearchStats] = None,
+        pruning: PruningOptions = PruningOptions(),
+        ply: int = 0,
+        allow_null_move: bool = True,
+        principal_variation: Optional[List[int]] = None,
+        move_ordering: Optional[MoveOrdering] = None,
     ) -> Tuple[Optional[ChessPiece], Optional[Position], int]:
     """
     Minimax algorithm with alpha-beta pruning for the chess AI
@@ -29,199 +343,540 @@ def minimax(
         player_color (PlayerColor): Color of the current player.
         alpha (float, optional): Alpha value for alpha-beta pruning. Defaults to -float('inf').
         beta (float, optional): Beta value for alpha-beta pruning. Defaults to float('inf').
-        cache (Optional[dict[str, tuple[Optional[ChessPiece], Optional[Position], int]]], optional): A dictionary to store previously computed board evaluations. Defaults to None.
+        transposition_table (Optional[TranspositionTable], optional): Table of previously searched positions, shared by the whole search. Defaults to a new table.
+        timer (Optional[SearchTimer]): aborts the search when it runs out of time or is stopped. Defaults to no limit.
         lmr_move_count (int): how many moves to do full depth search, rest do shallower search
+        batch_frontier (bool): score the children of depth 1 nodes together with NumPy (see batch_evaluation) instead of one by one
+        stats (Optional[SearchStats]): counts the nodes visited, shared by the whole search
+        pruning (PruningOptions): which selective pruning to use, none of it is done at the root
+        ply (int): distance from the root
+        allow_null_move (bool): false for the child of a null move, so two are never played in a row
+        principal_variation (Optional[List[int]]): encoded moves of the previous iteration's best line from the root,
+            passed only to the nodes on it so each of them searches its move of the line first
+        move_ordering (Optional[MoveOrdering]): killer moves and history, shared by the whole search. Defaults to a new one.
     Returns:
         Tuple[Optional[ChessPiece], Optional[Position], int, bool]: Best piece, best move, score of the best move, terminated due to time.
     """
 
-    if cache is None:
-        cache = {}
-
-    board_key = hash(board_state)
-    if board_key in cache and depth == cache[board_key][2]:
-        # print(f'board key {board_key}')
-        # print(cache[board_key])
-        return cache[board_key]
-
-    elapsed_time = time.time() - start_time
-    terminate = start_time is not None and time_limit is not None and elapsed_time >= time_limit
+    if transposition_table is None:
+        transposition_table = TranspositionTable()
+    if move_ordering is None:
+        move_ordering = MoveOrdering()
+    # out of time or nodes, or stopped: every node counts towards the limits, also those the table cuts off
+    if timer is not None and timer.should_abort():
+        return None, None, None, True
+
+    # use a stored result if it was searched at least as deep and settles this window
+    if stats is not None:
+        stats.nodes += 1
+        stats.tt_probes += 1
+    board_key = board_state.zobrist_key
+    entry = transposition_table.probe(board_key)
+    hash_move = None
+    if stats is not None and entry is not None:
+        stats.tt_hits += 1
+    if entry is not None and entry.best_move is not None:
+        hash_move = entry.best_move
+        if entry.depth >= depth:
+            if entry.bound == LOWER_BOUND:
+                alpha = max(alpha, entry.score)
+            elif entry.bound == UPPER_BOUND:
+                beta = min(beta, entry.score)
+            if entry.bound == EXACT or beta <= alpha:
+                stored_move = decode_move(board_state, hash_move)
+                if stored_move is not None:
+                    if stats is not None:
+                        stats.tt_cutoffs += 1
+                    return stored_move[0], stored_move[1], entry.score, False
+    alpha_original, beta_original = alpha, beta
 
     opponent_color = PlayerColor.WHITE if player_color == PlayerColor.BLACK else PlayerColor.BLACK
     maximizing_player = player_color == PlayerColor.WHITE  # white is always maximizing, black minimizing
     
-    # base case: depth is 0 or game over
-    if  depth == 0 or \
-        board_state.is_checkmate(player_color) or \
-        board_state.is_stalemate(player_color) or \
-        terminate:
-
-        terminated_score = None
-        evaluated_score = board_state.evaluation_function() if depth == 0 else terminated_score
-
-        return None, None, evaluated_score, terminate
+    # base case: depth is 0 (or below after a reduction)
+    if depth <= 0:
+        if stats is not None:
+            stats.leaf_evaluations += 1
+        return None, None, board_state.evaluation_function(), False
+
+    # selective pruning compares the static score, the running material and position totals, with the window
+    in_check = pruning != NO_PRUNING and ply > 0 and board_state.is_king_in_check(player_color)
+    static_score = board_state.material_score + board_state.position_score
+    if maximizing_player:
+        static_margin = static_score - alpha
+    else:
+        static_margin = beta - static_score
+
+    # null move pruning
+    if pruning.null_move and ply > 0 and allow_null_move and depth > NULL_MOVE_REDUCTION and not in_check \
+            and board_state.has_non_pawn_material(player_color) \
+            and (static_score >= beta if maximizing_player else static_score <= alpha) \
+            and abs(beta if maximizing_player else alpha) != float('inf'):
+        null_alpha, null_beta = (beta - NULL_WINDOW, beta) if maximizing_player else (alpha, alpha + NULL_WINDOW)
+        board_state.make_null_move()
+        _, _, null_score, null_terminated = minimax(
+            board_state=board_state,
+            depth=depth - 1 - NULL_MOVE_REDUCTION,
+            player_color=opponent_color,
+            alpha=null_alpha,
+            beta=null_beta,
+            transposition_table=transposition_table,
+            timer=timer,
+            batch_frontier=batch_frontier,
+            stats=stats,
+            pruning=pruning,
+            ply=ply + 1,
+            allow_null_move=False,
+            move_ordering=move_ordering)
+        board_state.unmake_null_move()
+        if null_terminated:
+            return None, None, None, True
+        if null_score is not None and \
+                (null_score >= beta if maximizing_player else null_score <= alpha):
+            if stats is not None:
+                stats.null_move_cutoffs += 1
+            return None, None, beta if maximizing_player else alpha, False
+
+    # razoring: far below alpha two plies from the frontier, only look one ply ahead
+    if pruning.razoring and ply > 0 and depth == 2 and not in_check and static_margin + RAZOR_MARGIN <= 0:
+        depth = 1
+        if stats is not None:
+            stats.razorings += 1
+
+    # futility pruning: at the frontier, quiet moves can't make up a static score this far below alpha
+    futile = pruning.futility and ply > 0 and depth == 1 and not in_check and static_margin + FUTILITY_MARGIN <= 0
+
+    # the move of the previous iteration's principal variation at this ply, if this node is on it
+    pv_move = principal_variation[ply] if principal_variation is not None and ply < len(principal_variation) else None
+
+    # frontier node: every child is a leaf, so score them all in one vectorized pass instead of generating them in stages
+    # (with no legal moves the game is over, which the staged generation below finds)
+    if batch_frontier and depth == 1 and evaluate_moves is not None:
+        possible_moves = board_state.generate_legal_moves(player_color)
+        if possible_moves:
+            scores = evaluate_moves(board_state, possible_moves)
+            # the children are nodes of the search like any other, also for the node limit
+            if timer is not None:
+                timer.nodes += len(possible_moves)
+            if stats is not None:
+                stats.nodes += len(possible_moves)
+                stats.leaf_evaluations += len(possible_moves)
+            best_index = int(scores.argmax()) if maximizing_player else int(scores.argmin())
+            best_piece, best_move = possible_moves[best_index]
+            best_score = float(scores[best_index])
+            store_search_result(transposition_table, board_key, depth, best_piece, best_move, best_score, alpha_original, beta_original)
+            return best_piece, best_move, best_score, False
+
+    # legal moves are generated best first in stages while they are searched, the game is over if there are none
+    staged = staged_moves(board_state, player_color, hash_move, pv_move, move_ordering, ply)
+    first_move = next(staged, None)
+    if first_move is None:
+        if board_state.is_king_in_check(player_color):
+            checkmate_score = -float('inf') if maximizing_player else float('inf')
+            return None, None, checkmate_score, False
+        return None, None, 0, False  # stalemate
+    possible_moves = chain([first_move], staged)
 
     best_move = None
     best_piece = None
 
+    def search_child(child_depth: int, child_alpha: float, child_beta: float, child_pv: Optional[List[int]]):
+        return minimax(
+            board_state=board_state,
+            depth=child_depth,
+            player_color=opponent_color,
+            alpha=child_alpha,
+            beta=child_beta,
+            transposition_table=transposition_table,
+            timer=timer,
+            batch_frontier=batch_frontier,
+            stats=stats,
+            pruning=pruning,
+            ply=ply + 1,
+            principal_variation=child_pv,
+            move_ordering=move_ordering)
+
     if maximizing_player:
         max_score = -float('inf')
 
-        # Get all possible moves and their scores
-        possible_moves = [(piece, move) for piece, moves in board_state.get_possible_moves(player_color) for move in moves]
-
-        # Sort the moves based on their scores
-        possible_moves.sort(key=lambda move: move_score(move, board_state), reverse=True)  # descending order
-
         terminated = False
 
         # Iterate over the ordered moves
         for move_num, (piece, move) in enumerate(possible_moves):
-            # create a new board and move the piece
-            new_board = deepcopy(board_state)
-            new_piece = deepcopy(piece)
-            new_board.move_piece(new_piece, move)
-            
+            is_capture = board_state.get_piece(move) is not None
+            child_pv = principal_variation if pv_move is not None and encode_move((piece, move)) == pv_move else None
+
+            # play the move in place, it is taken back once the child has been searched
+            board_state.make_move((piece, move))
+
+            if futile and best_move is not None and not is_capture and not board_state.is_king_in_check(opponent_color):
+                board_state.unmake_move()
+                if stats is not None:
+                    stats.futility_prunes += 1
+                continue
+
             # Late Move Reductions
             reduction = 1 if move_num <= lmr_move_count else 2
-            minimax_piece, minimax_move, minimax_score, terminated_lmr = minimax(
-                board_state=new_board, 
-                depth=depth - reduction, 
-                player_color=opponent_color, 
-                alpha=alpha, 
-                beta=beta, 
-                cache = cache,
-                start_time=start_time, 
-                time_limit=time_limit)
-            
-            if minimax_score is not None and reduction == 2 and minimax_score > alpha:
-                minimax_piece, minimax_move, minimax_score, terminated_deep = minimax(
-                board_state=new_board, 
-                depth=depth - 1, 
-                player_color=opponent_color, 
-                alpha=alpha, 
-                beta=beta, 
-                cache=cache,
-                start_time=start_time, 
-                time_limit=time_limit)
+            if best_move is None:
+                # the first move is expected to be the best, it is searched with the full window
+                minimax_piece, minimax_move, minimax_score, terminated_lmr = search_child(depth - 1, alpha, beta, child_pv)
+            else:
+                # principal variation search: only check that the others can't beat alpha with a null window
+                minimax_piece, minimax_move, minimax_score, terminated_lmr = search_child(
+                    depth - reduction, alpha, alpha + NULL_WINDOW, child_pv)
+
+                if minimax_score is not None and reduction == 2 and minimax_score > alpha:
+                    if stats is not None:
+                        stats.lmr_researches += 1
+                    minimax_piece, minimax_move, minimax_score, terminated_lmr = search_child(
+                        depth - 1, alpha, alpha + NULL_WINDOW, child_pv)
+
+                # it beat alpha, search again with the full window for its real score
+                if minimax_score is not None and alpha < minimax_score < beta:
+                    if stats is not None:
+                        stats.pvs_researches += 1
+                    minimax_piece, minimax_move, minimax_score, terminated_lmr = search_child(
+                        depth - 1, alpha, beta, child_pv)
+
+            board_state.unmake_move()
+
+            # the search was stopped below this move: its score is partial, give up on the remaining moves too
+            if terminated_lmr:
+                terminated = True
+                break
 
             # update best move if a better score is found
-            if minimax_score is not None and minimax_score > max_score:
+            if minimax_score is not None and (minimax_score > max_score or best_move is None):
                 max_score = minimax_score
                 best_move = move
                 best_piece = piece
 
-            terminated = terminated_lmr 
-
             # Update alpha and prune if beta <= alpha only after the full depth search
             alpha = max(alpha, max_score)
             if beta <= alpha:
+                if stats is not None:
+                    stats.cutoffs += 1
+                    stats.first_move_cutoffs += move_num == 0
+                if not is_capture:
+                    move_ordering.add_cutoff(player_color, encode_move((piece, move)), ply, depth)
                 break
 
-        max_score = None if max_score == -float('inf') else max_score
+        max_score = None if best_move is None else max_score
 
-        cache[board_key] = best_piece, best_move, max_score
+        if not terminated:
+            store_search_result(transposition_table, board_key, depth, best_piece, best_move, max_score, alpha_original, beta_original)
         return best_piece, best_move, max_score, terminated
     else:
         min_score = float('inf')
 
-        # Get all possible moves and their scores
-        possible_moves = [(piece, move) for piece, moves in board_state.get_possible_moves(player_color) for move in moves]
-
-        # Sort the moves based on their scores
-        possible_moves.sort(key=lambda move: move_score(move, board_state), reverse=False)  # ascending order
-
         terminated = False
 
         for move_num, (piece, move) in enumerate(possible_moves):
-            # create a new board and move the piece
-            new_board = deepcopy(board_state)
-            new_piece = deepcopy(piece)
-            new_board.move_piece(new_piece, move)
+            is_capture = board_state.get_piece(move) is not None
+            child_pv = principal_variation if pv_move is not None and encode_move((piece, move)) == pv_move else None
+
+            # play the move in place, it is taken back once the child has been searched
+            board_state.make_move((piece, move))
+
+            if futile and best_move is not None and not is_capture and not board_state.is_king_in_check(opponent_color):
+                board_state.unmake_move()
+                if stats is not None:
+                    stats.futility_prunes += 1
+                continue
 
             # Late Move Reductions
             reduction = 1 if move_num <= lmr_move_count else 2
-            minimax_piece, minimax_move, minimax_score, terminated_lmr = minimax(
-                board_state=new_board, 
-                depth=depth - reduction, 
-                player_color=opponent_color, 
-                alpha=alpha, 
-                beta=beta, 
-                cache = cache,
-                start_time=start_time, 
-                time_limit=time_limit)
-            
-            if minimax_score is not None and reduction == 2 and minimax_score < beta:
-                minimax_piece, minimax_move, minimax_score, terminated_deep = minimax(
-                board_state=new_board, 
-                depth=depth - 1, 
-                player_color=opponent_color, 
-                alpha=alpha, 
-                beta=beta, 
-                cache = cache,
-                start_time=start_time, 
-                time_limit=time_limit)
+            if best_move is None:
+                # the first move is expected to be the best, it is searched with the full window
+                minimax_piece, minimax_move, minimax_score, terminated_lmr = search_child(depth - 1, alpha, beta, child_pv)
+            else:
+                # principal variation search: only check that the others can't get below beta with a null window
+                minimax_piece, minimax_move, minimax_score, terminated_lmr = search_child(
+                    depth - reduction, beta - NULL_WINDOW, beta, child_pv)
+
+                if minimax_score is not None and reduction == 2 and minimax_score < beta:
+                    if stats is not None:
+                        stats.lmr_researches += 1
+                    minimax_piece, minimax_move, minimax_score, terminated_lmr = search_child(
+                        depth - 1, beta - NULL_WINDOW, beta, child_pv)
+
+                # it got below beta, search again with the full window for its real score
+                if minimax_score is not None and alpha < minimax_score < beta:
+                    if stats is not None:
+                        stats.pvs_researches += 1
+                    minimax_piece, minimax_move, minimax_score, terminated_lmr = search_child(
+                        depth - 1, alpha, beta, child_pv)
+
+            board_state.unmake_move()
+
+            # the search was stopped below this move: its score is partial, give up on the remaining moves too
+            if terminated_lmr:
+                terminated = True
+                break
 
             # update best move if a lower score is found
-            if minimax_score is not None and minimax_score < min_score:
+            if minimax_score is not None and (minimax_score < min_score or best_move is None):
                 min_score = minimax_score
                 best_move = move
                 best_piece = piece
 
-            terminated = terminated_lmr
-
             # update beta and prune if beta <= alpha
             beta = min(beta, min_score)
             if beta <= alpha:
+                if stats is not None:
+                    stats.cutoffs += 1
+                    stats.first_move_cutoffs += move_num == 0
+                if not is_capture:
+                    move_ordering.add_cutoff(player_color, encode_move((piece, move)), ply, depth)
                 break
 
-        min_score = None if min_score == float('inf') else min_score
+        min_score = None if best_move is None else min_score
 
-        cache[board_key] = best_piece, best_move, min_score
+        if not terminated:
+            store_search_result(transposition_table, board_key, depth, best_piece, best_move, min_score, alpha_original, beta_original)
         return best_piece, best_move, min_score, terminated
 
 
+def get_principal_variation(
+        board_state: ChessBoard,
+        transposition_table: TranspositionTable,
+        player_color: PlayerColor,
+        max_length: int,
+    ) -> List[int]:
+    """
+    Returns the best line from the position as encoded moves, following the best moves stored in the transposition table.
+    Stops at a missing or illegal stored move, or after max_length moves.
+    """
+    principal_variation = []
+    color = player_color
+    while len(principal_variation) < max_length:
+        entry = transposition_table.probe(board_state.zobrist_key)
+        if entry is None or entry.best_move is None:
+            break
+        move = decode_move(board_state, entry.best_move)
+        if move is None or move not in board_state.generate_legal_moves(color):
+            break
+        board_state.make_move(move)
+        principal_variation.append(entry.best_move)
+        color = PlayerColor.WHITE if color == PlayerColor.BLACK else PlayerColor.BLACK
+
+    for _ in principal_variation:
+        board_state.unmake_move()
+    return principal_variation
+
+
+def principal_variation_to_strings(board_state: ChessBoard, principal_variation: List[int]) -> List[str]:
+    """Returns the moves of an encoded line in coordinate notation, playing them through and taking them back"""
+    move_strings = []
+    for encoded_move in principal_variation:
+        move = decode_move(board_state, encoded_move)
+        move_strings.append(move_to_string(move))
+        board_state.make_move(move)
+    for _ in move_strings:
+        board_state.unmake_move()
+    return move_strings
+
+
+def staged_moves(
+        board_state: ChessBoard,
+        player_color: PlayerColor,
+        hash_move: Optional[int] = None,
+        pv_move: Optional[int] = None,
+        move_ordering: Optional[MoveOrdering] = None,
+        ply: int = 0,
+    ) -> Iterator[Tuple[ChessPiece, Position]]:
+    """
+    Yields the legal moves of the player best first, generating and scoring them in stages as they are asked for,
+    so a node that is cut off after a move or two never generates the rest:
+    the principal variation move and the hash move, captures that don't lose material by most valuable victim
+    and least valuable attacker, the killer moves, the other quiet moves by move_score, and last the captures
+    that lose material by static exchange evaluation.
+    """
+    yielded = set()
+    # moves remembered from other positions are checked on their own, without generating the others
+    for encoded_move in (pv_move, hash_move):
+        if encoded_move is None or encoded_move in yielded:
+            continue
+        move = decode_move(board_state, encoded_move)
+        if move is not None and board_state.is_legal_move(player_color, move):
+            yielded.add(encoded_move)
+            yield move
+
+    opponent_color = PlayerColor.WHITE if player_color == PlayerColor.BLACK else PlayerColor.BLACK
+    good_captures, losing_captures = [], []
+    for move in board_state.generate_legal_moves(player_color, board_state.color_occupancy[opponent_color]):
+        if encode_move(move) in yielded:
+            continue
+        piece, target_position = move
+        victim_value = board_state.get_piece(target_position).value
+        # taking a piece worth at least the capturing one can't lose material, only the others need an exchange
+        if victim_value >= piece.value or see_ge(board_state, move):
+            good_captures.append((victim_value * 10 - piece.value, move))
+        else:
+            losing_captures.append((static_exchange_evaluation(board_state, move), move))
+    good_captures.sort(key=lambda capture: capture[0], reverse=True)
+    for _, move in good_captures:
+        yield move
+
+    if move_ordering is not None:
+        for encoded_move in list(move_ordering.killers_at(ply)):
+            if encoded_move in yielded:
+                continue
+            move = decode_move(board_state, encoded_move)
+            if move is not None and board_state.get_piece(move[1]) is None \
+                    and board_state.is_legal_move(player_color, move):
+                yielded.add(encoded_move)
+                yield move
+
+    quiet_moves = [
+        move for move in board_state.generate_legal_moves(player_color, ~board_state.occupancy & FULL_BOARD)
+        if encode_move(move) not in yielded
+    ]
+    quiet_moves.sort(key=lambda move: move_score(move, board_state, move_ordering, ply), reverse=True)
+    yield from quiet_moves
+
+    losing_captures.sort(key=lambda capture: capture[0], reverse=True)
+    for _, move in losing_captures:
+        yield move
+
+
+def store_search_result(
+        transposition_table: TranspositionTable,
+        board_key: int,
+        depth: int,
+        best_piece: Optional[ChessPiece],
+        best_move: Optional[Position],
+        score: Optional[float],
+        alpha: float,
+        beta: float,
+    ):
+    """
+    Stores a node's result with its bound type: scores outside the (alpha, beta) window
+    only bound the real score because the search was cut off
+    """
+    if score is None or best_piece is None:
+        return
+
+    if score <= alpha:
+        bound = UPPER_BOUND
+    elif score >= beta:
+        bound = LOWER_BOUND
+    else:
+        bound = EXACT
+    transposition_table.store(board_key, depth, score, bound, encode_move((best_piece, best_move)))
+
+
 def iterative_deepening_minimax(
         board_state: ChessBoard, 
         max_depth: int, 
         player_color: PlayerColor, 
-        time_limit: int,
+        time_limit: Optional[float] = None,
+        transposition_table: Optional[TranspositionTable] = None,
+        batch_frontier: bool = False,
+        stats: Optional[SearchStats] = None,
+        on_depth: Optional[Callable[[SearchStats], None]] = None,
+        pruning: PruningOptions = PruningOptions(),
+        move_ordering: Optional[MoveOrdering] = None,
+        timer: Optional[SearchTimer] = None,
     ) -> Tuple[Optional[ChessPiece], Optional[Position], int]:
+    """
+    Searches one depth deeper at a time until max_depth or the time limit is reached,
+    and returns the best piece, move and score of the deepest completed search.
+    A depth that runs out of time or is stopped is thrown away. Time limits never cut the first depth short,
+    the timer's node limit and stop() do, see FirstDepthTimer.
+    Pass a SearchTimer instead of time_limit for separate soft and hard limits (see allocate_time),
+    or to stop the search from another thread. Without one time_limit is both limits.
+    Pass a SearchStats to collect search statistics, on_depth is called with it after every completed depth.
+    pruning switches the selective pruning of the search, see PruningOptions.
+    The killer moves and history of move_ordering are kept across iterations, and across moves when the caller passes one in.
+    """
+
+    if timer is None:
+        timer = SearchTimer(time_limit)
+    start_time = timer.start_time
+    if stats is None and on_depth is not None:
+        stats = SearchStats()
 
-    start_time = time.time()
-    maximizing_player = player_color == PlayerColor.WHITE
+    # the table is kept across iterations, and across moves when the caller passes one in
+    if transposition_table is None:
+        transposition_table = TranspositionTable()
+    transposition_table.new_search()
+    if move_ordering is None:
+        move_ordering = MoveOrdering()
+    move_ordering.new_search()
 
     depth_move_scores = []
+    principal_variation = None
+    stable_iterations = 0  # completed depths since the best move last changed
+    first_depth_timer = FirstDepthTimer(timer)
 
     for current_depth in range(1, max_depth + 1):
         print(f"Depth: {current_depth}")
-        piece, move, score, terminated = minimax(
-            board_state=board_state, 
-            depth=current_depth, 
-            player_color=player_color, 
-            start_time=start_time, 
-            time_limit=time_limit
-            )
 
-        if not terminated:
-            print(f"Best move at depth: {current_depth}: {piece}, {move}, {score}")
-            depth_move_scores.append((piece, move, score))
-        else:
-            print(f"Search at depth = {current_depth} was terminated")
-            best_score = depth_move_scores[-1][2]
-            terminated_search_best_score = score
-            
-            if maximizing_player and terminated_search_best_score is not None and terminated_search_best_score > best_score:
-                print(f"Explored move is better than best move at previous depth... {piece}, {move}, {score}")
-                depth_move_scores.append((piece, move, score))
+        # aspiration window: expect a score close to the previous iteration's, widen the window when it isn't
+        alpha, beta = -float('inf'), float('inf')
+        window = ASPIRATION_WINDOW
+        previous_score = depth_move_scores[-1][2] if depth_move_scores else None
+        if previous_score is not None and abs(previous_score) != float('inf'):
+            alpha, beta = previous_score - window, previous_score + window
+
+        while True:
+            piece, move, score, terminated = minimax(
+                board_state=board_state,
+                depth=current_depth,
+                player_color=player_color,
+                alpha=alpha,
+                beta=beta,
+                transposition_table=transposition_table,
+                timer=timer if depth_move_scores else first_depth_timer,
+                batch_frontier=batch_frontier,
+                stats=stats,
+                pruning=pruning,
+                principal_variation=principal_variation,
+                move_ordering=move_ordering,
+                )
+            if terminated or score is None:
+                break
 
-            elif not maximizing_player and terminated_search_best_score is not None and terminated_search_best_score < best_score:
-                print(f"Explored move is better than best move at previous depth... {piece}, {move}, {score}")
+            window *= 2
+            if score <= alpha and alpha != -float('inf'):
+                alpha = -float('inf') if window > ASPIRATION_MAX_WINDOW else score - window
+            elif score >= beta and beta != float('inf'):
+                beta = float('inf') if window > ASPIRATION_MAX_WINDOW else score + window
+            else:
+                break
+            if stats is not None:
+                stats.aspiration_researches += 1
+        if not depth_move_scores:
+            timer.nodes += first_depth_timer.nodes
+
+        if terminated:
+            # the unfinished depth only searched some of the moves, the last completed depth is played
+            print(f"Search at depth = {current_depth} was terminated")
+            if not depth_move_scores:
+                # the node limit or stop() cut even the first depth short: play the best move searched, or the first in order
+                if piece is None:
+                    piece, move = next(staged_moves(board_state, player_color, move_ordering=move_ordering), (None, None))
                 depth_move_scores.append((piece, move, score))
+            break
 
-        # check if time limit has been reached and break if so
-        elapsed_time = time.time() - start_time
-        if elapsed_time >= time_limit:
+        print(f"Best move at depth: {current_depth}: {piece}, {move}, {score}")
+        if depth_move_scores and depth_move_scores[-1][:2] == (piece, move):
+            stable_iterations += 1
+        else:
+            stable_iterations = 0
+        depth_move_scores.append((piece, move, score))
+        principal_variation = get_principal_variation(board_state, transposition_table, player_color, current_depth)
+        if stats is not None:
+            stats.principal_variation = principal_variation_to_strings(board_state, principal_variation)
+            stats.depth_times.append(time.time() - start_time)
+            stats.depth_nodes.append(stats.nodes)
+            stats.depth_moves.append((piece, move, score))
+            if on_depth is not None:
+                on_depth(stats)
+
+        # don't start another depth past the soft limit, or earlier when the best move keeps being the same
+        if timer.soft_limit_reached(stable_iterations):
             print(f"Depth: {current_depth} - Time Limit Reached")
             break
 
@@ -229,11 +884,7 @@ def iterative_deepening_minimax(
 
 
 def get_random_move(board_state: ChessBoard, color: PlayerColor) -> Tuple[ChessPiece, Position]:
-    possible_moves = []
-
-    for piece, moves in board_state.get_possible_moves(color):
-        for move in moves:
-            possible_moves.append((piece, move))
+    possible_moves = board_state.generate_legal_moves(color)
 
     if not possible_moves:
         return None, None
@@ -277,61 +928,136 @@ def get_book_move_black(board_state: ChessBoard) -> Tuple[str, Position, Positio
 
 
 
-def move_score(move: Tuple[ChessPiece, Position], board_state: ChessBoard) -> int:
+def move_score(
+        move: Tuple[ChessPiece, Position],
+        board_state: ChessBoard,
+        move_ordering: Optional[MoveOrdering] = None,
+        ply: int = 0,
+    ) -> int:
+    """
+    Returns how promising a move looks for the side playing it, higher is searched first.
+    Captures are ranked by static exchange evaluation, quiet moves by the killer and history heuristics
+    of move_ordering, with a small bonus for moving to the center. Nothing is played on the board.
+    """
     piece, target_position = move
     target_piece = board_state.get_piece(target_position)
 
-    score = 0
-    see_score = 0
-    # capture moves given priority based on relative value
+    # captures: winning and even exchanges before everything else, losing ones after every quiet move
     if target_piece is not None and target_piece.color != piece.color:
-        # what should multiplier be?
-        see_score = static_exchange_evaluation(board_state, (piece, target_position)) * 100
-        score += see_score
-        # print(score)
-        # score += (target_piece.value - piece.value) * 50
-
-    new_board = deepcopy(board_state)
-    new_piece = deepcopy(piece)
-    new_board.move_piece(new_piece, target_position)
-
-    # check moves also given priority
-    opponent_color = PlayerColor.WHITE if piece.color == PlayerColor.BLACK else PlayerColor.BLACK
-    if new_board.is_king_in_check(opponent_color):
-        score += 50
-
-    # center control bonus
-    central_squares = [(3, 3), (3, 4), (4, 3), (4, 4)]
-    if target_position in central_squares:
-        score += 10
-
-    # moved piece mobility is rewarded
-    mobility = len(new_piece.get_possible_moves(new_board))
-    score += mobility
-
-    # if piece.color == PlayerColor.BLACK:
-    #     score = -score
-    # score += new_board.evaluation_function()
+        see_score = static_exchange_evaluation(board_state, move) * 100
+        return GOOD_CAPTURE_SCORE + see_score if see_score >= 0 else see_score
+
+    score = 10 if target_position in CENTRAL_SQUARES else 0
+    if move_ordering is not None:
+        encoded_move = encode_move(move)
+        killers = move_ordering.killers_at(ply)
+        if encoded_move in killers:
+            return KILLER_SCORE - killers.index(encoded_move)
+        score += move_ordering.history[piece.color][encoded_move]
     return score
 
 
-def get_best_move(board_state: ChessBoard, color: PlayerColor, max_depth: int = None, max_time: int = None) -> Tuple[ChessPiece, Position]:
-    time_limit = max_time  # time limit in seconds
-    max_depth = max_depth
-
-    if color == PlayerColor.BLACK:
+def get_best_move(
+        board_state: ChessBoard,
+        color: PlayerColor,
+        max_depth: int = None,
+        max_time: int = None,
+        transposition_table: Optional[TranspositionTable] = None,
+        batch_frontier: bool = False,
+        stats: Optional[SearchStats] = None,
+        on_depth: Optional[Callable[[SearchStats], None]] = None,
+        profiler: Optional[MoveProfiler] = None,
+        workers: int = 1,
+        root_split: bool = False,
+        pruning: PruningOptions = PruningOptions(),
+        time_control: Optional[TimeControl] = None,
+        timer: Optional[SearchTimer] = None,
+        use_book: bool = True,
+    ) -> Tuple[ChessPiece, Position]:
+    """
+    Returns the piece and target position of the engine's move: a book move in the opening for black,
+    otherwise the result of iterative_deepening_minimax.
+    The book follows the game's moves from the start position, pass use_book=False for games set up another way.
+    Pass a SearchStats to read the search statistics afterwards, or an on_depth callback to get them after every depth.
+    A book move searches nothing and leaves the statistics empty.
+    Pass a MoveProfiler to profile the search, see profiling.py.
+    With more than one worker the search runs in that many processes with Lazy SMP (see parallel_search.py),
+    the transposition table should then be a SharedTranspositionTable, any other table is not used.
+    With root_split the root moves are split over the worker processes instead, each with its own table.
+    pruning switches the selective pruning of the single process search, see PruningOptions.
+    The time for the move is max_time seconds, or allocated from the game clock when a TimeControl is passed.
+    Pass a SearchTimer to set the limits yourself or to stop the search from another thread,
+    the best move of the deepest completed depth is then played. The parallel searches only use the soft limit,
+    which they are held to through the timer's stop_event, see watch_timer in parallel_search.py.
+    """
+    if timer is None:
+        timer = SearchTimer(*allocate_time(time_control)) if time_control is not None else SearchTimer(max_time)
+    time_limit = timer.soft_limit  # time limit in seconds of the parallel searches
+    node_limit = None if timer.node_limit == float('inf') else int(timer.node_limit)
+    if max_depth is None:
+        max_depth = MAX_SEARCH_DEPTH  # the clock decides how deep to search
+
+    if color == PlayerColor.BLACK and use_book:
         book_move = get_book_move_black(board_state)
         piece_str, start_pos, end_pos = book_move
         if piece_str is not None:
             piece = board_state.get_piece(start_pos)
             return piece, end_pos
 
-    piece, move, _ = iterative_deepening_minimax(
-        board_state=board_state,
-        max_depth=max_depth,
-        player_color=color,
-        time_limit=time_limit,
-    )
+    # the worker processes of the parallel searches can only be stopped through an event they share
+    if workers > 1 and timer.stop_event is None:
+        timer.stop_event = multiprocessing.Event()
+
+    if workers > 1 and root_split:
+        from parallel_search import root_split_search, watch_timer  # imports this module
+
+        with profiler.profile_move() if profiler is not None else nullcontext(), watch_timer(timer):
+            piece, move, _ = root_split_search(
+                board_state=board_state,
+                max_depth=max_depth,
+                player_color=color,
+                time_limit=time_limit,
+                workers=workers,
+                stats=stats,
+                stop_event=timer.stop_event,
+                node_limit=node_limit,
+                on_depth=on_depth,
+            )
+        return piece, move
+
+    if workers > 1:
+        from parallel_search import lazy_smp_search, watch_timer  # imports this module
+
+        if not isinstance(transposition_table, SharedTranspositionTable):
+            transposition_table = None
+        with profiler.profile_move() if profiler is not None else nullcontext(), watch_timer(timer):
+            piece, move, _ = lazy_smp_search(
+                board_state=board_state,
+                max_depth=max_depth,
+                player_color=color,
+                time_limit=time_limit,
+                workers=workers,
+                transposition_table=transposition_table,
+                stats=stats,
+                stop_event=timer.stop_event,
+                node_limit=node_limit,
+                on_depth=on_depth,
+            )
+        return piece, move
+
+    with profiler.profile_move() if profiler is not None else nullcontext():
+        piece, move, _ = iterative_deepening_minimax(
+            board_state=board_state,
+            max_depth=max_depth,
+            player_color=color,
+            time_limit=time_limit,
+            transposition_table=transposition_table,
+            batch_frontier=batch_frontier,
+            stats=stats,
+            on_depth=on_depth,
+            pruning=pruning,
+            timer=timer,
+        )
     # piece, move, _ = minimax(board_state, depth, True, color)
     # piece, move = get_random_move(board_state, color)
 
@@ -339,65 +1065,121 @@ def get_best_move(board_state: ChessBoard, color: PlayerColor, max_depth: int =
 
 
 
+def least_valuable_attacker(board_state: ChessBoard, attackers: int, color: PlayerColor) -> Tuple[int, Optional[int]]:
+    """Returns the bit and piece type of the given player's least valuable piece among the attackers, (0, None) if none"""
+    pieces = board_state.bitboards[color]
+    for piece_type in range(PIECE_TYPE_COUNT):
+        candidates = attackers & pieces[piece_type]
+        if candidates:
+            return candidates & -candidates, piece_type
+    return 0, None
+
+
+def revealed_attackers(board_state: ChessBoard, square: int, piece_type: int, occupancy: int) -> int:
+    """
+    Returns the sliders of both colors attacking the square through the occupancy,
+    after a piece of the given type left the square's rays (an x-ray attacker is revealed behind it)
+    """
+    white, black = board_state.bitboards[PlayerColor.WHITE], board_state.bitboards[PlayerColor.BLACK]
+    attackers = 0
+    if piece_type in (PAWN, BISHOP, QUEEN):
+        attackers |= bishop_attacks(square, occupancy) & (white[BISHOP] | white[QUEEN] | black[BISHOP] | black[QUEEN])
+    if piece_type in (ROOK, QUEEN):
+        attackers |= rook_attacks(square, occupancy) & (white[ROOK] | white[QUEEN] | black[ROOK] | black[QUEEN])
+    return attackers & occupancy
+
+
 def static_exchange_evaluation(board_state: ChessBoard, move: Tuple[ChessPiece, Position]) -> int:
     """
-    This function performs Static Exchange Evaluation (SEE) on a given move.
+    This function performs Static Exchange Evaluation (SEE) on a given move:
+    both sides keep capturing on the target square with their least valuable attacker, and may stop whenever
+    going on would lose material. Attackers are looked up with board attack queries, and sliders behind
+    a piece that has captured (x-rays) join the exchange.
     
     Args:
         board_state (ChessBoard): The current state of the chess board.
         move (Tuple[ChessPiece, Position]): The move to be evaluated.
         
     Returns:
-        int: The SEE score for the given move.
+        int: The SEE score for the given move, in pawns, 0 if it is not a capture.
     """
     piece, target_position = move
-    attacker_color = piece.color
-    opponent_color = PlayerColor.WHITE if attacker_color == PlayerColor.BLACK else PlayerColor.BLACK
-
-    # Get the target piece, and return 0 if there is no target piece
     target_piece = board_state.get_piece(target_position)
-    if target_piece is None or target_piece.color == attacker_color:
+    if target_piece is None or target_piece.color == piece.color:
         return 0
 
-    # Initialize the attackers and the gains array
-    attackers = {color: [] for color in [attacker_color, opponent_color]}
-    gains = [0] * 32
-    gains[0] = target_piece.value
-
-    # Find all attacking pieces for both sides
-    for row in range(8):
-        for col in range(8):
-            attacking_piece = board_state.get_piece((row, col))
-            if attacking_piece is not None and attacking_piece.color in [attacker_color, opponent_color]:
-                if target_position in attacking_piece.get_possible_moves(board_state):
-                    attackers[attacking_piece.color].append((attacking_piece, attacking_piece.value))
-
+    row, col = target_position
+    square = row * 8 + col
+    start_row, start_col = piece.position
+    from_bit = 1 << (start_row * 8 + start_col)
+    piece_type = PIECE_INDEX[type(piece)]
+    occupancy = board_state.occupancy
+    attackers = board_state.attackers_to(target_position, occupancy)
+
+    # gains[n] is the material the side making the nth capture wins, if the other side doesn't recapture
+    gains = [SEE_VALUES[PIECE_INDEX[type(target_piece)]]]
+    color = piece.color
+    while from_bit:
+        # speculative: what the next side wins by taking the piece that just captured
+        gains.append(SEE_VALUES[piece_type] - gains[-1])
+        if max(-gains[-2], gains[-1]) < 0:
+            break  # neither side can change the outcome by going on
+
+        occupancy ^= from_bit
+        attackers = (attackers & occupancy) | revealed_attackers(board_state, square, piece_type, occupancy)
+        color = PlayerColor.WHITE if color == PlayerColor.BLACK else PlayerColor.BLACK
+        from_bit, piece_type = least_valuable_attacker(board_state, attackers & board_state.color_occupancy[color], color)
+
+    # the last entry is a capture nobody could make, then each side picks the better of capturing or stopping
+    gains.pop()
+    while len(gains) > 1:
+        last_gain = gains.pop()
+        gains[-1] = -max(-gains[-1], last_gain)
+    return gains[0]
 
-    # Sort the attackers by the piece values
-    for color in [attacker_color, opponent_color]:
-        attackers[color].sort(key=lambda x: x[1])
 
-    current_attacker_color = attacker_color
-    current_depth = 1
+def see_ge(board_state: ChessBoard, move: Tuple[ChessPiece, Position], threshold: int = 0) -> bool:
+    """
+    Returns whether the static exchange evaluation of a move, a capture or a quiet move, is at least threshold pawns.
+    Stops as soon as the answer is known, which is cheaper than working out the exchange's value.
+    """
+    piece, target_position = move
+    target_piece = board_state.get_piece(target_position)
 
+    # even if the opponent takes the moved piece right away
+    balance = (SEE_VALUES[PIECE_INDEX[type(target_piece)]] if target_piece is not None else 0) - threshold
+    if balance < 0:
+        return False
+    piece_type = PIECE_INDEX[type(piece)]
+    balance = SEE_VALUES[piece_type] - balance
+    if balance <= 0:
+        return True
+
+    row, col = target_position
+    square = row * 8 + col
+    start_row, start_col = piece.position
+    occupancy = board_state.occupancy ^ (1 << (start_row * 8 + start_col))
+    attackers = board_state.attackers_to(target_position, occupancy)
+    color = piece.color
+    result = 1  # whether the player of the move reaches the threshold if the side to capture stops here
     while True:
-        # If no attackers are left for the current side, break the loop
-        if not attackers[current_attacker_color]:
+        color = PlayerColor.WHITE if color == PlayerColor.BLACK else PlayerColor.BLACK
+        attackers &= occupancy
+        from_bit, piece_type = least_valuable_attacker(board_state, attackers & board_state.color_occupancy[color], color)
+        if not from_bit:
             break
+        result ^= 1
 
-        # Get the next attacker
-        next_attacker, next_attacker_value = attackers[current_attacker_color].pop(0)
-
-        # Add the captured value to the gains array
-        gains[current_depth] = -gains[current_depth - 1] + next_attacker_value
-
-        # Switch to the other side
-        current_attacker_color = opponent_color if current_attacker_color == attacker_color else attacker_color
-        current_depth += 1
+        # the king can only capture last
+        if piece_type == KING:
+            if attackers & ~board_state.color_occupancy[color]:
+                result ^= 1
+            break
 
-    # Compute the SEE score
-    while current_depth > 1:
-        current_depth -= 1
-        gains[current_depth - 1] = min(gains[current_depth - 1], -gains[current_depth])
+        balance = SEE_VALUES[piece_type] - balance
+        if balance < result:
+            break
+        occupancy ^= from_bit
+        attackers |= revealed_attackers(board_state, square, piece_type, occupancy)
 
-    return gains[0]
+    return bool(result)
@@ -0,0 +1,409 @@
+"""
+Parallel search over several processes.
+
+Python threads share one interpreter lock, so the search only uses more than one core in separate processes.
+Positions are sent to the workers as FEN strings and moves come back in coordinate notation,
+instead of pickling the board's piece objects.
+
+Lazy SMP: every worker searches the whole tree from the same root with iterative deepening, sharing one
+SharedTranspositionTable. Results one worker stores cut off the search of the others, and the workers are kept
+apart by starting odd numbered helpers one depth deeper and by listing each helper's pieces in a different
+order, which changes the order of equally scored moves. The deepest completed result is played.
+
+Root splitting: the root moves are searched one per task over a process pool, each worker keeping its own
+transposition table. The best score found so far at the root is shared between the workers, so a root move
+searched after a good one is searched with the narrower window and cut off early.
+
+The workers can't read a SearchTimer of the main process. They stop at their own time limit and node limit share,
+or when the main process sets the stop_event they share, see watch_timer.
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait
+from contextlib import contextmanager, redirect_stdout
+import io
+import multiprocessing
+import random
+import threading
+import time
+from typing import Callable, Optional, Tuple
+
+from chess_board import ChessBoard, Position, move_to_string
+from engine import (
+    MoveOrdering, SearchStats, SearchTimer, get_principal_variation, iterative_deepening_minimax, minimax, move_score,
+    principal_variation_to_strings,
+)
+from pieces.chess_piece import ChessPiece, PlayerColor
+from transposition_table import TranspositionTable, SharedTranspositionTable
+from util import string_to_position
+
+WATCH_INTERVAL = 0.01  # seconds between checks of the main process's timer, see watch_timer
+REPORT_INTERVAL = 0.05  # seconds between reads of the depths completed by Lazy SMP workers
+
+# per worker process state of the Lazy SMP search, set by init_lazy_smp_worker
+lazy_smp_stop_event = None
+lazy_smp_reports = None
+
+# per worker process state of the root splitting search, set by init_root_split_worker
+root_split_bound = None
+root_split_updates = None
+root_split_table: Optional[TranspositionTable] = None
+root_split_move_ordering: Optional[MoveOrdering] = None
+root_split_stop_event = None
+root_split_nodes_left = float('inf')
+
+
+def shuffle_move_order(board: ChessBoard, seed: int):
+    """Lists the pieces of each type in a random order, so equally scored moves are searched in a different order"""
+    rng = random.Random(seed)
+    for piece_lists in board.piece_lists.values():
+        for piece_type, pieces in enumerate(piece_lists):
+            shuffled = list(pieces)
+            rng.shuffle(shuffled)
+            piece_lists[piece_type] = dict.fromkeys(shuffled)
+
+
+@contextmanager
+def watch_timer(timer: SearchTimer):
+    """
+    Stops the worker processes of a parallel search through the timer's stop_event, once the timer's soft limit
+    passes or it is stopped. A thread of this process checks the timer every WATCH_INTERVAL seconds while in the
+    with block, so limits the timer only gets during the search, like those of a ponder hit, reach the workers.
+    The timer needs a stop_event.
+    """
+    finished = threading.Event()
+
+    def watch():
+        while not finished.wait(WATCH_INTERVAL):
+            if timer.stopped or timer.elapsed() >= timer.soft_limit:
+                timer.stop()
+                return
+
+    thread = threading.Thread(target=watch, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        finished.set()
+        thread.join()
+
+
+def init_lazy_smp_worker(stop_event, reports=None):
+    """
+    Sets up a Lazy SMP worker process with the event that stops the search, None if it can't be stopped,
+    and the multiprocessing.SimpleQueue it reports its completed depths to, None for no reports
+    """
+    global lazy_smp_stop_event, lazy_smp_reports
+    lazy_smp_stop_event = stop_event
+    lazy_smp_reports = reports
+
+
+def lazy_smp_worker(
+        fen: str,
+        max_depth: int,
+        time_limit: float,
+        transposition_table: SharedTranspositionTable,
+        worker_index: int,
+        node_limit: Optional[int] = None,
+    ) -> Tuple[int, Optional[str], Optional[float], SearchStats]:
+    """
+    Searches the position with iterative deepening until max_depth, the time limit or the node limit,
+    and returns the deepest completed depth with its best move, score and the worker's search statistics.
+    Every completed depth is reported as (worker index, depth, move, score, nodes, principal variation).
+    """
+    timer = SearchTimer(time_limit, node_limit=node_limit, stop_event=lazy_smp_stop_event)
+    board = ChessBoard.from_fen(fen)
+    if worker_index > 0:
+        shuffle_move_order(board, worker_index)
+
+    stats = SearchStats()
+    # killers and history carry over from one depth to the next, as in iterative_deepening_minimax
+    move_ordering = MoveOrdering()
+    best_depth, best_move, best_score = 0, None, None
+    try:
+        # odd helpers skip depth 1 so they are always one depth ahead of the main worker
+        for depth in range(1 + worker_index % 2, max_depth + 1):
+            with redirect_stdout(io.StringIO()):
+                piece, move, score, terminated = minimax(
+                    board_state=board,
+                    depth=depth,
+                    player_color=board.turn,
+                    transposition_table=transposition_table,
+                    timer=timer,
+                    stats=stats,
+                    move_ordering=move_ordering,
+                )
+            if terminated or piece is None:
+                break
+            best_depth, best_move, best_score = depth, move_to_string((piece, move)), score
+            stats.depth_times.append(timer.elapsed())
+            stats.depth_nodes.append(stats.nodes)
+            if lazy_smp_reports is not None:
+                principal_variation = get_principal_variation(board, transposition_table, board.turn, depth)
+                lazy_smp_reports.put((worker_index, depth, best_move, score, stats.nodes,
+                                      principal_variation_to_strings(board, principal_variation)))
+    finally:
+        transposition_table.close()
+
+    return best_depth, best_move, best_score, stats
+
+
+def lazy_smp_search(
+        board_state: ChessBoard,
+        max_depth: int,
+        player_color: PlayerColor,
+        time_limit: float,
+        workers: int,
+        transposition_table: Optional[SharedTranspositionTable] = None,
+        stats: Optional[SearchStats] = None,
+        stop_event=None,
+        node_limit: Optional[int] = None,
+        on_depth: Optional[Callable[[SearchStats], None]] = None,
+    ) -> Tuple[Optional[ChessPiece], Optional[Position], Optional[float]]:
+    """
+    Searches the position with Lazy SMP over the given number of worker processes,
+    and returns the best piece, move and score of the deepest search any worker completed.
+    Pass a SearchStats to get the summed statistics of all workers, and the time, nodes, move and principal variation
+    of every depth as the first worker to complete it found them. on_depth is called with it after every depth.
+    Setting the multiprocessing.Event stop_event stops all workers, see SearchTimer.
+    The node limit is split evenly over the workers. If no worker completes the first depth, it is searched
+    in this process.
+    """
+    start_time = time.time()
+    if stats is None and on_depth is not None:
+        stats = SearchStats()
+    own_table = transposition_table is None
+    if own_table:
+        transposition_table = SharedTranspositionTable()
+    transposition_table.new_search()
+
+    fen = search_fen(board_state, player_color)
+    worker_node_limit = None if node_limit is None else max(1, node_limit // workers)
+    reports = multiprocessing.SimpleQueue() if stats is not None else None
+    nodes_before = stats.nodes if stats is not None else 0
+    worker_nodes = [0] * workers
+
+    def read_reports():
+        """Records the depths the workers completed since the last call, see lazy_smp_worker"""
+        while not reports.empty():
+            worker_index, depth, move_string, score, nodes, principal_variation = reports.get()
+            worker_nodes[worker_index] = nodes
+            if depth <= stats.depth_reached:
+                continue
+            stats.nodes = nodes_before + sum(worker_nodes)
+            stats.principal_variation = principal_variation
+            # a helper that completes a deeper search first completed the depths below it as well
+            while stats.depth_reached < depth:
+                stats.depth_times.append(time.time() - start_time)
+                stats.depth_nodes.append(stats.nodes)
+                stats.depth_moves.append(resolve_move(board_state, move_string, score))
+            if on_depth is not None:
+                on_depth(stats)
+
+    try:
+        with ProcessPoolExecutor(
+                max_workers=workers, initializer=init_lazy_smp_worker, initargs=(stop_event, reports)) as executor:
+            futures = [
+                executor.submit(
+                    lazy_smp_worker, fen, max_depth, time_limit, transposition_table, worker_index, worker_node_limit)
+                for worker_index in range(workers)
+            ]
+            pending = futures
+            while pending:
+                _, pending = wait(pending, timeout=REPORT_INTERVAL)
+                if reports is not None:
+                    read_reports()
+            results = [future.result() for future in futures]
+    finally:
+        if own_table:
+            transposition_table.close()
+        if reports is not None:
+            reports.close()
+
+    # the deepest completed search wins, the main worker on equal depth
+    best_depth, best_move, best_score, _ = max(results, key=lambda result: result[0])
+    if stats is not None:
+        stats.nodes = nodes_before
+        for _, _, _, worker_stats in results:
+            stats.add(worker_stats)
+
+    if best_move is None:
+        # no worker completed a depth before the node limit or a stop, search the first depth here:
+        # as in iterative_deepening_minimax it is always completed, so there is a move to play
+        return iterative_deepening_minimax(board_state, 1, player_color, stats=stats, on_depth=on_depth)
+    return resolve_move(board_state, best_move, best_score)
+
+
+def search_fen(board_state: ChessBoard, player_color: PlayerColor) -> str:
+    """Returns the FEN sent to the workers, with the given player to move"""
+    fields = board_state.to_fen().split()
+    fields[1] = 'w' if player_color == PlayerColor.WHITE else 'b'
+    return ' '.join(fields)
+
+
+def resolve_move(
+        board_state: ChessBoard,
+        move_string: Optional[str],
+        score: Optional[float],
+    ) -> Tuple[Optional[ChessPiece], Optional[Position], Optional[float]]:
+    """Returns the piece, target position and score of a move sent back by a worker"""
+    if move_string is None:
+        return None, None, None
+    start, target = string_to_position(move_string[:2].upper()), string_to_position(move_string[2:4].upper())
+    return board_state.get_piece(start), target, score
+
+
+def init_root_split_worker(bound, updates, stop_event=None, node_limit: Optional[int] = None):
+    """
+    Sets up a root splitting worker process with the shared root bound, the shared count of its updates,
+    the event that stops the search, the nodes the process may search over all its root moves
+    and its own transposition table and killer and history tables
+    """
+    global root_split_bound, root_split_updates, root_split_table, root_split_move_ordering, root_split_stop_event, \
+        root_split_nodes_left
+    root_split_bound = bound
+    root_split_updates = updates
+    root_split_table = TranspositionTable()
+    root_split_move_ordering = MoveOrdering()
+    root_split_stop_event = stop_event
+    root_split_nodes_left = float('inf') if node_limit is None else node_limit
+
+
+def root_split_worker(
+        fen: str,
+        move_string: str,
+        depth: int,
+        start_time: float,
+        time_limit: float,
+    ) -> Tuple[str, Optional[float], int, bool, SearchStats]:
+    """
+    Searches one root move to the given depth, with the best root score found so far by any worker as bound.
+    Returns the move, its score (None if the search ran out of time), the number of the bound update it made
+    (0 if it did not beat the bound), whether it ran out of time or nodes and the statistics.
+    A score that does not beat the shared bound is only an upper bound (a lower one for black), so the best move
+    of the depth is the one that made the last update.
+    """
+    global root_split_nodes_left
+    board = ChessBoard.from_fen(fen)
+    player_color = board.turn
+    opponent_color = PlayerColor.WHITE if player_color == PlayerColor.BLACK else PlayerColor.BLACK
+    board.make_move(board.parse_move(move_string))
+
+    alpha, beta = -float('inf'), float('inf')
+    if player_color == PlayerColor.WHITE:
+        alpha = root_split_bound.value
+    else:
+        beta = root_split_bound.value
+
+    stats = SearchStats()
+    timer = SearchTimer(time_limit, start_time=start_time, node_limit=root_split_nodes_left, stop_event=root_split_stop_event)
+    with redirect_stdout(io.StringIO()):
+        _, _, score, terminated = minimax(
+            board_state=board,
+            depth=depth - 1,
+            player_color=opponent_color,
+            alpha=alpha,
+            beta=beta,
+            transposition_table=root_split_table,
+            timer=timer,
+            stats=stats,
+            move_ordering=root_split_move_ordering,
+        )
+    root_split_nodes_left -= timer.nodes
+
+    # broadcast a better root score to the other workers
+    update = 0
+    if not terminated and score is not None:
+        with root_split_bound.get_lock():
+            if player_color == PlayerColor.WHITE and score > root_split_bound.value or \
+                    player_color == PlayerColor.BLACK and score < root_split_bound.value:
+                root_split_bound.value = score
+                root_split_updates.value += 1
+                update = root_split_updates.value
+    return move_string, score, update, terminated, stats
+
+
+def root_split_search(
+        board_state: ChessBoard,
+        max_depth: int,
+        player_color: PlayerColor,
+        time_limit: float,
+        workers: int,
+        stats: Optional[SearchStats] = None,
+        stop_event=None,
+        node_limit: Optional[int] = None,
+        on_depth: Optional[Callable[[SearchStats], None]] = None,
+    ) -> Tuple[Optional[ChessPiece], Optional[Position], Optional[float]]:
+    """
+    Searches the position with iterative deepening, splitting the root moves of every depth over the given number
+    of worker processes, and returns the best piece, move and score of the deepest completed depth.
+    Root moves are searched best first: by move_score at depth 1, then by their score at the previous depth.
+    Pass a SearchStats to get the summed statistics of all root moves, on_depth is called with it after every depth.
+    The principal variation is only the best move, the workers' tables are not read back.
+    Setting the multiprocessing.Event stop_event stops all workers, see SearchTimer.
+    The node limit is split evenly over the worker processes.
+    """
+    start_time = time.time()
+    if stats is None and on_depth is not None:
+        stats = SearchStats()
+    maximizing_player = player_color == PlayerColor.WHITE
+    worst_score = -float('inf') if maximizing_player else float('inf')
+
+    fen = search_fen(board_state, player_color)
+    moves = board_state.generate_legal_moves(player_color)
+    moves.sort(key=lambda move: move_score(move, board_state), reverse=True)
+    move_strings = [move_to_string(move) for move in moves]
+    if not move_strings:
+        return None, None, None
+
+    bound = multiprocessing.Value('d', worst_score)
+    updates = multiprocessing.Value('i', 0, lock=False)  # only changed while holding the bound's lock
+    best_move, best_score = move_strings[0], None
+    worker_node_limit = None if node_limit is None else max(1, node_limit // workers)
+    with ProcessPoolExecutor(
+            max_workers=workers, initializer=init_root_split_worker,
+            initargs=(bound, updates, stop_event, worker_node_limit)) as executor:
+        for depth in range(1, max_depth + 1):
+            bound.value = worst_score
+            updates.value = 0
+            futures = [
+                executor.submit(root_split_worker, fen, move_string, depth, start_time, time_limit)
+                for move_string in move_strings
+            ]
+
+            depth_scores = {}
+            last_update, best_of_depth = 0, None
+            terminated = False
+            for future in as_completed(futures):
+                move_string, score, update, move_terminated, move_stats = future.result()
+                if stats is not None:
+                    stats.add(move_stats)
+                if move_terminated or score is None:
+                    terminated = True
+                    continue
+                depth_scores[move_string] = score
+                if update > last_update:
+                    last_update, best_of_depth = update, move_string
+
+            if terminated:
+                # the unfinished depth only searched some of the moves, the last completed depth is played
+                break
+
+            # every move scored the worst score (e.g. all lose to mate), play the first in search order
+            if best_of_depth is None:
+                best_of_depth = move_strings[0]
+            best_move, best_score = best_of_depth, depth_scores[best_of_depth]
+
+            if stats is not None:
+                stats.depth_times.append(time.time() - start_time)
+                stats.depth_nodes.append(stats.nodes)
+                stats.depth_moves.append(resolve_move(board_state, best_move, best_score))
+                stats.principal_variation = [best_move]
+                if on_depth is not None:
+                    on_depth(stats)
+
+            # search the best move of this depth first at the next one, then the others by their (bound) scores
+            move_strings.sort(key=lambda move_string: depth_scores[move_string], reverse=maximizing_player)
+            move_strings.insert(0, move_strings.pop(move_strings.index(best_move)))
+            if time.time() - start_time >= time_limit or stop_event is not None and stop_event.is_set():
+                break
+
+    return resolve_move(board_state, best_move, best_score)
@@ -0,0 +1,99 @@
+"""
+Perft: counts the leaf nodes of the legal move tree to a fixed depth.
+
+Used to check move generation against known node counts and to measure its speed on its own,
+without search or evaluation. Run `python perft.py --help` for the options, for example
+
+    python perft.py 4
+    python perft.py 3 --fen "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1" --divide
+
+Known counts only match positions without en passant or promotions, which this engine does not play.
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import time
+
+from chess_board import ChessBoard, Move, START_FEN, move_to_string
+
+
+def perft(board: ChessBoard, depth: int) -> int:
+    """Returns the number of leaf nodes depth moves ahead of the side to move"""
+    if depth == 0:
+        return 1
+
+    nodes = 0
+    for piece, moves in board.get_possible_moves(board.turn):
+        if depth == 1:
+            nodes += len(moves)
+            continue
+        for move in moves:
+            board.make_move((piece, move))
+            nodes += perft(board, depth - 1)
+            board.unmake_move()
+    return nodes
+
+
+def root_moves(board: ChessBoard) -> list[Move]:
+    """Returns the legal moves of the side to move"""
+    return [(piece, move) for piece, moves in board.get_possible_moves(board.turn) for move in moves]
+
+
+def perft_root_move(fen: str, move_string: str, depth: int) -> int:
+    """
+    Counts the leaf nodes below one root move of the position.
+    Takes the position as FEN so it can run in a worker process.
+    """
+    board = ChessBoard.from_fen(fen)
+    board.make_move(board.parse_move(move_string))
+    return perft(board, depth - 1)
+
+
+def divide(board: ChessBoard, depth: int, workers: int = 1) -> dict[str, int]:
+    """
+    Returns the leaf node count below each root move, keyed by the move in coordinate notation.
+    With more than one worker the root moves are counted in a process pool.
+    """
+    move_strings = [move_to_string(move) for move in root_moves(board)]
+    if workers > 1 and depth > 1:
+        fen = board.to_fen()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            counts = executor.map(perft_root_move, [fen] * len(move_strings), move_strings,
+                                  [depth] * len(move_strings))
+            return dict(zip(move_strings, counts))
+
+    counts = {}
+    for move, move_string in zip(root_moves(board), move_strings):
+        board.make_move(move)
+        counts[move_string] = perft(board, depth - 1)
+        board.unmake_move()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Count the leaf nodes of the legal move tree")
+    parser.add_argument("depth", type=int, help="number of plies to count")
+    parser.add_argument("--fen", default=START_FEN, help="position to count from, defaults to the start position")
+    parser.add_argument("--divide", action="store_true", help="print the node count below each root move")
+    parser.add_argument("--workers", type=int, default=1, help="processes to split the root moves over, with --divide")
+    args = parser.parse_args()
+    if args.depth < 1:
+        parser.error("depth must be at least 1")
+
+    board = ChessBoard.from_fen(args.fen)
+    start_time = time.perf_counter()
+    if args.divide:
+        counts = divide(board, args.depth, args.workers)
+        for move_string, count in sorted(counts.items()):
+            print(f"{move_string}: {count}")
+        nodes = sum(counts.values())
+    else:
+        nodes = perft(board, args.depth)
+    elapsed = time.perf_counter() - start_time
+
+    print(f"Nodes: {nodes}")
+    print(f"Time: {elapsed:.3f}s")
+    print(f"Nodes/sec: {nodes / elapsed if elapsed > 0 else 0:.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 from typing import TYPE_CHECKING
 
+from bitboard import KNIGHT_ATTACKS, squares_to_positions
 from pieces.chess_piece import ChessPiece, PlayerColor
 from util import position_to_string
 
@@ -15,23 +16,11 @@ class Knight(ChessPiece):
         self.value = 3
 
     def get_possible_moves(self, board: "ChessBoard") -> list[Position]:
-        moves = []
-
         row, col = self.position
-        directions = [
-            (-2, -1), (-2, 1),
-            (-1, -2), (-1, 2),
-            (1, -2),  (1, 2),
-            (2, -1),  (2, 1)
-        ]
-
-        for dr, dc in directions:
-            new_row, new_col = row + dr, col + dc
-            if 0 <= new_row < 8 and 0 <= new_col < 8:
-                if board.is_square_empty((new_row, new_col)) or board.is_opponent_piece(self.color, (new_row, new_col)):
-                    moves.append((new_row, new_col))
-
-        return moves
+
+        # every attacked square not holding an own piece
+        targets = KNIGHT_ATTACKS[row * 8 + col] & ~board.color_occupancy[self.color]
+        return squares_to_positions(targets)
 
     def to_str(self):
         return "Knight"
@@ -1,5 +1,6 @@
 from typing import TYPE_CHECKING
 
+from bitboard import WHITE_PAWN_ATTACKS, BLACK_PAWN_ATTACKS, squares_to_positions
 from pieces.chess_piece import ChessPiece, PlayerColor
 from util import position_to_string
 
@@ -24,33 +25,26 @@ class Pawn(ChessPiece):
             if 0 <= row - 1 < 8 and board.is_square_empty((row - 1, col)):
                 moves.append((row - 1, col))
 
-            # Two squares forward from the starting position
-            if row == 6 and board.is_square_empty((row - 1, col)) and board.is_square_empty((row - 2, col)):
-                moves.append((row - 2, col))
+                # Two squares forward from the starting position
+                if row == 6 and board.is_square_empty((row - 2, col)):
+                    moves.append((row - 2, col))
 
             # Capture moves
-            if 0 <= row - 1 < 8:
-                if 0 <= col - 1 < 8 and board.is_opponent_piece(self.color, (row - 1, col - 1)):
-                    moves.append((row - 1, col - 1))
-                if 0 <= col + 1 < 8 and board.is_opponent_piece(self.color, (row - 1, col + 1)):
-                    moves.append((row - 1, col + 1))
+            captures = WHITE_PAWN_ATTACKS[row * 8 + col] & board.color_occupancy[PlayerColor.BLACK]
 
         else:  # "black"
             # One square forward
             if 0 <= row + 1 < 8 and board.is_square_empty((row + 1, col)):
                 moves.append((row + 1, col))
 
-            # Two squares forward from the starting position
-            if row == 1 and board.is_square_empty((row + 1, col)) and board.is_square_empty((row + 2, col)):
-                moves.append((row + 2, col))
+                # Two squares forward from the starting position
+                if row == 1 and board.is_square_empty((row + 2, col)):
+                    moves.append((row + 2, col))
 
             # Capture moves
-            if 0 <= row + 1 < 8:
-                if 0 <= col - 1 < 8 and board.is_opponent_piece(self.color, (row + 1, col - 1)):
-                    moves.append((row + 1, col - 1))
-                if 0 <= col + 1 < 8 and board.is_opponent_piece(self.color, (row + 1, col + 1)):
-                    moves.append((row + 1, col + 1))
+            captures = BLACK_PAWN_ATTACKS[row * 8 + col] & board.color_occupancy[PlayerColor.WHITE]
 
+        moves.extend(squares_to_positions(captures))
         return moves
 
     def to_str(self):
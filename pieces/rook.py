@@ -1,5 +1,6 @@
 from typing import TYPE_CHECKING
 
+from bitboard import rook_attacks, squares_to_positions
 from pieces.chess_piece import ChessPiece, PlayerColor
 from util import position_to_string
 
@@ -16,29 +17,11 @@ class Rook(ChessPiece):
         self.has_moved = False
 
     def get_possible_moves(self, board: "ChessBoard") -> list[Position]:
-        moves = []
-
         row, col = self.position
 
-        # Define direction vectors
-        directions = [(1, 0), (-1, 0), (0, 1), (0, -1)]
-
-        # Iterate through directions
-        for dr, dc in directions:
-            for i in range(1, 8):
-                new_row, new_col = row + dr * i, col + dc * i
-
-                if 0 <= new_row < 8 and 0 <= new_col < 8:
-                    if board.is_square_empty((new_row, new_col)):
-                        moves.append((new_row, new_col))
-                    elif board.is_opponent_piece(self.color, (new_row, new_col)):
-                        moves.append((new_row, new_col))
-                        break
-                    else:
-                        break
-                else:
-                    break
-        return moves
+        # rays up to the first piece, minus the own pieces
+        targets = rook_attacks(row * 8 + col, board.occupancy) & ~board.color_occupancy[self.color]
+        return squares_to_positions(targets)
 
     def has_moved(self):
         return self.has_moved
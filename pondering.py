@@ -0,0 +1,103 @@
+"""
+Pondering: searching on the opponent's time.
+
+After the engine moves, the second move of its principal variation is the reply it expects. A Ponderer plays
+that reply on its own copy of the board and searches the position in a background thread, without a time limit,
+while the opponent thinks. When the opponent plays the expected move (a ponder hit) the same search carries on,
+now with the move's time limits, so the depths it already finished count towards the move. Any other move
+(a miss) stops the search and the engine searches the real position as usual. Both searches share the
+transposition table, so even a miss leaves useful entries behind.
+
+    ponderer = Ponderer(transposition_table)
+    ponderer.start(board, PlayerColor.BLACK, stats.principal_variation[1])
+    (the opponent moves)
+    move_string = ponderer.finish(opponent_move_string, soft_limit, hard_limit)  # None on a miss
+"""
+import threading
+from typing import Optional
+
+from chess_board import ChessBoard, move_to_string
+from engine import MAX_SEARCH_DEPTH, MoveOrdering, SearchStats, SearchTimer, iterative_deepening_minimax
+from pieces.chess_piece import PlayerColor
+from transposition_table import TranspositionTable
+
+
+class Ponderer:
+    """
+    Runs one ponder search at a time in a background thread, see the module docstring.
+    After finish the statistics of the search, pondering included, are in stats.
+    """
+
+    def __init__(self, transposition_table: Optional[TranspositionTable] = None, max_depth: int = MAX_SEARCH_DEPTH):
+        self.transposition_table = TranspositionTable() if transposition_table is None else transposition_table
+        self.max_depth = max_depth
+        self.move_ordering = MoveOrdering()
+        self.expected_move: Optional[str] = None
+        self.timer: Optional[SearchTimer] = None
+        self.stats = SearchStats()
+        self.best_move: Optional[str] = None
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def pondering(self) -> bool:
+        """Whether a ponder search was started and not finished yet"""
+        return self.thread is not None
+
+    def start(self, board: ChessBoard, color: PlayerColor, expected_move: str) -> bool:
+        """
+        Starts searching the position after the opponent's expected move, for the given engine color.
+        The board is copied, so the caller may keep using it. Returns False if the expected move is not legal.
+        """
+        self.stop()
+        ponder_board = ChessBoard.from_fen(board.to_fen())
+        move = ponder_board.parse_move(expected_move)
+        if move is None:
+            return False
+        ponder_board.make_move(move)
+
+        self.expected_move = expected_move
+        self.timer = SearchTimer()
+        self.stats = SearchStats()
+        self.best_move = None
+        self.thread = threading.Thread(target=self.search, args=(ponder_board, color), daemon=True)
+        self.thread.start()
+        return True
+
+    def search(self, board: ChessBoard, color: PlayerColor):
+        """The ponder thread: searches until max_depth, the time limits set on a ponder hit, or stop"""
+        piece, move, _ = iterative_deepening_minimax(
+            board_state=board,
+            max_depth=self.max_depth,
+            player_color=color,
+            transposition_table=self.transposition_table,
+            stats=self.stats,
+            move_ordering=self.move_ordering,
+            timer=self.timer,
+        )
+        self.best_move = move_to_string((piece, move)) if piece is not None else None
+
+    def finish(self, opponent_move: str, soft_limit: float, hard_limit: Optional[float] = None) -> Optional[str]:
+        """
+        Called with the move the opponent played. On a ponder hit the search continues for the given limits,
+        counted from now, and its best move is returned in coordinate notation. On a miss the search is stopped
+        and None is returned.
+        """
+        if not self.pondering:
+            return None
+        if opponent_move != self.expected_move:
+            self.stop()
+            return None
+
+        # the move's clock starts now, the depths finished while pondering were free
+        self.timer.restart(soft_limit, hard_limit)
+        self.thread.join()
+        self.thread = None
+        return self.best_move
+
+    def stop(self):
+        """Stops the ponder search, if any, and waits for its thread"""
+        if self.thread is None:
+            return
+        self.timer.stop()
+        self.thread.join()
+        self.thread = None
@@ -0,0 +1,127 @@
+"""
+Opt-in profiling of engine moves.
+
+A MoveProfiler runs each engine move under cProfile, saves the profile of every move to its own file
+(open them with `python -m pstats <file>` or snakeviz) and adds it to a profile of the whole game.
+The game profile is summarized by where the time goes: move generation, evaluation, making moves,
+copying, static exchange evaluation and the search itself.
+
+    profiler = MoveProfiler("profiles")
+    get_best_move(board, PlayerColor.BLACK, max_depth=4, max_time=10, profiler=profiler)
+    print(profiler.summary())
+
+The GUI takes the same option as `python chess_gui.py --profile profiles`.
+"""
+from contextlib import contextmanager
+import cProfile
+import os
+import pstats
+from typing import Optional
+
+# functions whose own time counts towards each category, matched by file name or function name
+CATEGORY_FILES = {
+    "move generation": {"bitboard.py"},
+    "evaluation": {"batch_evaluation.py"},
+    "copying": {"copy.py"},
+}
+CATEGORY_FUNCTIONS = {
+    "move generation": {
+        "generate_legal_moves", "get_possible_moves", "find_checks_and_pins", "is_square_attacked",
+        "get_castling_moves", "can_castle_kingside", "can_castle_queenside", "attackers_to", "piece_attacks",
+        "attack_map", "has_legal_move", "is_king_in_check", "is_move_valid",
+    },
+    "evaluation": {"evaluation_function", "compute_evaluation_scores"},
+    "making moves": {"make_move", "unmake_move", "move_piece", "place_piece", "remove_piece"},
+    "copying": {"__deepcopy__"},
+    "static exchange evaluation": {
+        "static_exchange_evaluation", "see_ge", "least_valuable_attacker", "revealed_attackers",
+    },
+    "search": {"minimax", "iterative_deepening_minimax", "move_score", "staged_moves", "store_search_result"},
+}
+CATEGORIES = [
+    "move generation", "evaluation", "making moves", "copying", "static exchange evaluation", "search", "other",
+]
+
+
+def function_category(filename: str, function_name: str) -> str:
+    """Returns the category of a profiled function"""
+    for category, names in CATEGORY_FUNCTIONS.items():
+        if function_name in names:
+            return category
+    for category, files in CATEGORY_FILES.items():
+        if os.path.basename(filename) in files:
+            return category
+    return "other"
+
+
+class MoveProfiler:
+    """
+    Profiles engine moves one at a time, see profile_move.
+    Profiles are written to output_dir as move_001.prof, move_002.prof, ... and the game summary to summary.txt.
+    """
+
+    def __init__(self, output_dir: str = "profiles"):
+        self.output_dir = output_dir
+        self.move_count = 0
+        self.move_times: list[float] = []
+        self.game_stats: Optional[pstats.Stats] = None
+        os.makedirs(output_dir, exist_ok=True)
+
+    @contextmanager
+    def profile_move(self):
+        """Profiles the code run inside the with block as one engine move"""
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            self.add_profile(profile)
+
+    def add_profile(self, profile: cProfile.Profile):
+        """Saves the profile of one move and adds it to the game profile"""
+        self.move_count += 1
+        path = os.path.join(self.output_dir, f"move_{self.move_count:03d}.prof")
+        profile.dump_stats(path)
+
+        stats = pstats.Stats(profile)
+        self.move_times.append(stats.total_tt)
+        if self.game_stats is None:
+            self.game_stats = stats
+        else:
+            self.game_stats.add(stats)
+
+        with open(os.path.join(self.output_dir, "summary.txt"), "w") as file:
+            file.write(self.summary())
+
+    def category_times(self) -> dict[str, float]:
+        """Returns the seconds spent in each category over the game, by the functions' own time"""
+        times = {category: 0.0 for category in CATEGORIES}
+        if self.game_stats is None:
+            return times
+        for (filename, _, function_name), (_, _, own_time, _, _) in self.game_stats.stats.items():
+            times[function_category(filename, function_name)] += own_time
+        return times
+
+    def summary(self, function_count: int = 15) -> str:
+        """Returns the time per category and the functions with the most own time over the game"""
+        if self.game_stats is None:
+            return "No moves profiled\n"
+
+        total_time = self.game_stats.total_tt
+        lines = [f"{self.move_count} moves profiled, {total_time:.3f}s in total"]
+        if self.move_times:
+            slowest = max(range(len(self.move_times)), key=self.move_times.__getitem__)
+            lines.append(f"slowest move: move_{slowest + 1:03d}.prof, {self.move_times[slowest]:.3f}s")
+
+        lines.append("")
+        for category, seconds in sorted(self.category_times().items(), key=lambda item: -item[1]):
+            share = seconds / total_time if total_time > 0 else 0.0
+            lines.append(f"{category:28} {seconds:8.3f}s {share:6.1%}")
+
+        lines.append("")
+        hottest = sorted(self.game_stats.stats.items(), key=lambda item: -item[1][2])[:function_count]
+        for (filename, line, function_name), (_, call_count, own_time, cumulative_time, _) in hottest:
+            location = f"{os.path.basename(filename)}:{line}({function_name})"
+            lines.append(f"{own_time:8.3f}s own {cumulative_time:8.3f}s cumulative {call_count:9} calls  {location}")
+        return "\n".join(lines) + "\n"
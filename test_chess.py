@@ -1,8 +1,41 @@
+from contextlib import redirect_stderr, redirect_stdout
 from copy import deepcopy
+import io
+import os
+import pickle
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 import unittest
-from chess_board import ChessBoard, Position
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from chess_board import ChessBoard, Position, START_FEN, move_to_string
 from pieces import King, Queen, Rook, Bishop, Knight, Pawn, ChessPiece, PlayerColor
 from util import position_to_string
+from transposition_table import (
+    TranspositionTable, SharedTranspositionTable, EXACT, LOWER_BOUND, UPPER_BOUND, encode_move, decode_move,
+)
+from bitboard import (
+    PAWN, ROOK, ORTHOGONAL_DIRECTIONS, DIAGONAL_DIRECTIONS, sliding_attacks, rook_attacks, bishop_attacks,
+)
+from perft import perft, divide
+from benchmark import run_position, welch_t_test
+from engine import (
+    SearchStats, PruningOptions, NO_PRUNING, MoveOrdering, get_best_move, iterative_deepening_minimax, minimax, move_score,
+    staged_moves, static_exchange_evaluation, see_ge, TimeControl, SearchTimer, allocate_time, MOVE_OVERHEAD,
+)
+from profiling import MoveProfiler
+from parallel_search import lazy_smp_search, root_split_search
+from pondering import Ponderer
+from uci import UCIEngine, score_to_uci
+from analysis import analyze_positions, parse_position_line
 
 class TestChessBoard(unittest.TestCase):
 
@@ -86,5 +119,708 @@ class TestChessBoard(unittest.TestCase):
         self.assertFalse(board.is_checkmate(PlayerColor.BLACK))
         self.assertTrue(board.is_stalemate(PlayerColor.BLACK))
 
+    def test_bitboards_follow_moves(self):
+        board = ChessBoard()
+        for start, end in [((6, 4), (4, 4)), ((1, 4), (3, 4)), ((7, 6), (5, 5)), ((0, 1), (2, 2)),
+                           ((7, 5), (4, 2)), ((0, 6), (2, 5)), ((7, 4), (7, 6))]:
+            self.assertTrue(board.move_piece(board.get_piece(start), end))
+
+        self.assertTrue(isinstance(board.get_piece((7, 5)), Rook))
+        self.assertTrue(board.is_square_empty((7, 7)))
+        self.assertTrue(board.is_opponent_piece(PlayerColor.BLACK, (7, 5)))
+        self.assertFalse(board.is_opponent_piece(PlayerColor.WHITE, (7, 5)))
+
+        expected = ChessBoard(board_state=board.board)
+        self.assertEqual(board.bitboards, expected.bitboards)
+        self.assertEqual(board.color_occupancy, expected.color_occupancy)
+        self.assertEqual(board.occupancy, expected.occupancy)
+
+    def test_make_unmake_move_restores_board(self):
+        board = ChessBoard()
+        for start, end in [((6, 4), (4, 4)), ((1, 3), (3, 3)), ((7, 6), (5, 5)), ((0, 6), (2, 5)),
+                           ((7, 5), (4, 2))]:
+            board.move_piece(board.get_piece(start), end)
+
+        layout = [row[:] for row in board.board]
+        positions = [(piece, piece.position) for piece in board.get_pieces(PlayerColor.WHITE) + board.get_pieces(PlayerColor.BLACK)]
+        bitboards = deepcopy(board.bitboards)
+        moves = list(board.moves)
+
+        white_king = board.get_piece((7, 4))
+        white_rook = board.get_piece((7, 7))
+        board.make_move((board.get_piece((3, 3)), (4, 4)))  # capture
+        board.make_move((white_king, (7, 6)))  # castle
+        self.assertIs(board.get_piece((7, 5)), white_rook)
+        self.assertTrue(white_king.has_moved and white_rook.has_moved)
+        board.make_move((board.get_piece((0, 4)), (1, 3)))
+
+        for _ in range(3):
+            board.unmake_move()
+
+        self.assertEqual(board.board, layout)
+        self.assertEqual(bitboards, board.bitboards)
+        self.assertEqual(moves, board.moves)
+        self.assertFalse(white_king.has_moved or white_rook.has_moved)
+        for piece, position in positions:
+            self.assertEqual(piece.position, position)
+
+    def test_zobrist_key_is_incremental(self):
+        board = ChessBoard()
+        start_key = board.zobrist_key
+
+        board.make_move((board.get_piece((7, 6)), (5, 5)))
+        board.make_move((board.get_piece((0, 6)), (2, 5)))
+        board.make_move((board.get_piece((7, 1)), (5, 2)))
+        self.assertEqual(board.zobrist_key, board.compute_zobrist_key())
+        self.assertEqual(board.turn, PlayerColor.BLACK)
+
+        # same position reached through a different move order
+        other = ChessBoard()
+        other.make_move((other.get_piece((7, 1)), (5, 2)))
+        other.make_move((other.get_piece((0, 6)), (2, 5)))
+        other.make_move((other.get_piece((7, 6)), (5, 5)))
+        self.assertEqual(hash(board), hash(other))
+        self.assertEqual(hash(board), hash(deepcopy(board)))
+
+        # moving the rook loses the castling right, so moving it back is a different position
+        rook = board.get_piece((7, 7))
+        board.make_move((rook, (7, 6)))
+        board.make_move((board.get_piece((2, 5)), (0, 6)))
+        board.make_move((rook, (7, 7)))
+        board.make_move((board.get_piece((0, 6)), (2, 5)))
+        self.assertEqual(board.castling_rights, board.compute_castling_rights())
+        self.assertNotEqual(board.zobrist_key, other.zobrist_key)
+
+        for _ in range(7):
+            board.unmake_move()
+        self.assertEqual(board.zobrist_key, start_key)
+
+    def test_legal_moves_respect_pins_and_checks(self):
+        board = ChessBoard(board_state=ChessBoard().create_empty_board())
+        white_king = King(PlayerColor.WHITE, (7, 4))
+        white_rook = Rook(PlayerColor.WHITE, (7, 7))
+        white_bishop = Bishop(PlayerColor.WHITE, (6, 4))
+        black_king = King(PlayerColor.BLACK, (0, 0))
+        black_rook = Rook(PlayerColor.BLACK, (0, 4))
+        black_bishop = Bishop(PlayerColor.BLACK, (4, 3))
+        for piece in [white_king, white_rook, white_bishop, black_king, black_rook, black_bishop]:
+            board.place_piece(piece, piece.position)
+        board.castling_rights = board.compute_castling_rights()
+
+        moves = dict(board.get_possible_moves(PlayerColor.WHITE))
+        # the bishop is pinned on the e-file, and castling would land on g1, attacked by the black bishop
+        self.assertEqual(moves[white_bishop], [])
+        self.assertEqual(set(moves[white_king]), {(7, 3), (6, 3), (7, 5)})
+
+        # in check from the rook next to the king: it can only be captured or stepped away from
+        board.make_move((black_rook, (6, 4)))
+        moves = board.generate_legal_moves(PlayerColor.WHITE)
+        self.assertTrue(board.is_king_in_check(PlayerColor.WHITE))
+        self.assertEqual(set(moves), {(white_king, (6, 4)), (white_king, (7, 3)), (white_king, (7, 5))})
+
+    def test_attack_queries(self):
+        board = ChessBoard()
+        board.move_piece(board.get_piece((6, 4)), (4, 4))
+        board.move_piece(board.get_piece((1, 3)), (3, 3))
+
+        # d5 is attacked by the e4 pawn and defended by the black queen
+        attackers = board.attackers_to((3, 3))
+        self.assertEqual(attackers, (1 << (4 * 8 + 4)) | (1 << (0 * 8 + 3)))
+        self.assertTrue(board.is_square_attacked((3, 3), PlayerColor.WHITE))
+        self.assertFalse(board.is_square_attacked((4, 3), PlayerColor.WHITE))
+
+        # the attack map is cached until the next move
+        self.assertFalse((board.attack_map(PlayerColor.WHITE) >> (2 * 8 + 2)) & 1)
+        board.move_piece(board.get_piece((7, 5)), (3, 1))
+        self.assertEqual(board.attack_maps, {})
+        self.assertTrue(board.is_square_attacked((2, 2), PlayerColor.WHITE))
+        self.assertTrue((board.attack_map(PlayerColor.WHITE) >> (2 * 8 + 2)) & 1)
+        self.assertTrue(board.is_king_in_check(PlayerColor.BLACK))
+
+    def test_slider_attack_tables(self):
+        rng = random.Random(10)
+        for _ in range(200):
+            square = rng.randrange(64)
+            occupancy = rng.getrandbits(64) & rng.getrandbits(64)
+            row, col = square >> 3, square & 7
+            self.assertEqual(rook_attacks(square, occupancy),
+                             sliding_attacks(row, col, ORTHOGONAL_DIRECTIONS, occupancy))
+            self.assertEqual(bishop_attacks(square, occupancy),
+                             sliding_attacks(row, col, DIAGONAL_DIRECTIONS, occupancy))
+
+    def test_piece_lists_and_king_squares(self):
+        board = ChessBoard()
+        self.assertEqual(len(board.get_pieces_of_type(PlayerColor.WHITE, PAWN)), 8)
+        self.assertEqual(board.king_squares, {PlayerColor.WHITE: 60, PlayerColor.BLACK: 4})
+
+        for start, end in [((6, 4), (4, 4)), ((1, 3), (3, 3)), ((4, 4), (3, 3)), ((0, 3), (3, 3)),
+                           ((7, 6), (5, 5)), ((0, 1), (2, 2)), ((7, 5), (6, 4)), ((0, 2), (4, 6))]:
+            board.move_piece(board.get_piece(start), end)
+        white_king = board.get_piece((7, 4))
+        board.move_piece(white_king, (7, 6))
+
+        self.assertEqual(len(board.get_pieces_of_type(PlayerColor.WHITE, PAWN)), 7)
+        self.assertEqual(len(board.get_pieces_of_type(PlayerColor.BLACK, PAWN)), 7)
+        self.assertEqual(board.king_squares[PlayerColor.WHITE], 62)
+        self.assertIn(board.get_piece((7, 5)), board.get_pieces_of_type(PlayerColor.WHITE, ROOK))
+
+        board.unmake_move()
+        self.assertEqual(board.king_squares[PlayerColor.WHITE], 60)
+        expected = ChessBoard(board_state=board.board)
+        self.assertEqual(board.piece_lists, expected.piece_lists)
+
+    def test_incremental_evaluation(self):
+        board = ChessBoard()
+        self.assertEqual(board.evaluation_function(), 0)
+
+        # fool's mate, with a capture on the way
+        for start, end in [((6, 5), (5, 5)), ((1, 4), (3, 4)), ((6, 6), (4, 6)), ((1, 3), (3, 3)),
+                           ((4, 6), (3, 6)), ((0, 3), (3, 6)), ((6, 7), (5, 7))]:
+            board.move_piece(board.get_piece(start), end)
+        self.assertEqual((board.material_score, board.position_score), board.compute_evaluation_scores())
+        self.assertEqual(board.material_score, -10)
+
+        board.move_piece(board.get_piece((3, 6)), (4, 7))
+        self.assertTrue(board.is_checkmate(PlayerColor.WHITE))
+        self.assertEqual(board.evaluation_function(), -float('inf'))
+
+        for _ in range(8):
+            board.unmake_move()
+        self.assertEqual((board.material_score, board.position_score), (0, 0))
+
+    def test_null_move(self):
+        board = ChessBoard()
+        key = board.zobrist_key
+        board.make_null_move()
+        self.assertEqual(board.turn, PlayerColor.BLACK)
+        self.assertNotEqual(board.zobrist_key, key)
+        self.assertEqual(board.zobrist_key, board.compute_zobrist_key())
+        board.unmake_null_move()
+        self.assertEqual((board.turn, board.zobrist_key), (PlayerColor.WHITE, key))
+
+        self.assertTrue(board.has_non_pawn_material(PlayerColor.WHITE))
+        self.assertFalse(ChessBoard.from_fen("4k3/pppp4/8/8/8/8/8/4K3 b - - 0 1").has_non_pawn_material(PlayerColor.BLACK))
+
+    def test_fen_round_trip(self):
+        board = ChessBoard.from_fen(START_FEN)
+        self.assertEqual(board.zobrist_key, ChessBoard().zobrist_key)
+        self.assertEqual(ChessBoard().to_fen(), START_FEN)
+
+        # castling rights follow the moved flags of the kings and rooks
+        board = ChessBoard.from_fen("4k3/8/8/8/8/8/8/R3K2R b K - 0 1")
+        self.assertEqual(board.turn, PlayerColor.BLACK)
+        self.assertFalse(board.get_piece((7, 7)).has_moved)
+        self.assertTrue(board.get_piece((7, 0)).has_moved)
+        self.assertEqual(board.to_fen(), "4k3/8/8/8/8/8/8/R3K2R b K - 0 1")
+        self.assertRaises(ValueError, ChessBoard.from_fen, "8/8/8 w - - 0 1")
+
+
+class TestPerft(unittest.TestCase):
+
+    def test_start_position_counts(self):
+        board = ChessBoard()
+        self.assertEqual([perft(board, depth) for depth in range(1, 4)], [20, 400, 8902])
+        self.assertEqual(board.to_fen(), START_FEN)
+
+        counts = divide(board, 2)
+        self.assertEqual(len(counts), 20)
+        self.assertEqual(counts["e2e4"], 20)
+        self.assertEqual(sum(counts.values()), 400)
+
+
+class TestTranspositionTable(unittest.TestCase):
+
+    def test_store_and_probe(self):
+        board = ChessBoard()
+        knight = board.get_piece((7, 6))
+        table = TranspositionTable(size_mb=1)
+
+        table.store(board.zobrist_key, 3, 12.5, EXACT, encode_move((knight, (5, 5))))
+        entry = table.probe(board.zobrist_key)
+        self.assertEqual((entry.depth, entry.score, entry.bound), (3, 12.5, EXACT))
+        self.assertEqual(decode_move(board, entry.best_move), (knight, (5, 5)))
+        self.assertIsNone(table.probe(board.zobrist_key ^ 1))
+
+    def test_depth_preferred_replacement(self):
+        table = TranspositionTable(size_mb=1)
+        key = 12345
+        colliding_key = key + (table.mask + 1)
+
+        table.store(key, 5, 1.0, EXACT, 0)
+        table.store(colliding_key, 2, 2.0, LOWER_BOUND, 0)
+        # the shallower result goes to the always-replace slot
+        self.assertEqual(table.probe(key).depth, 5)
+        self.assertEqual(table.probe(colliding_key).depth, 2)
+
+        # entries from an older search give way to new ones
+        table.new_search()
+        table.store(colliding_key + (table.mask + 1), 1, 3.0, EXACT, 0)
+        self.assertIsNone(table.probe(key))
+        self.assertEqual(table.probe(colliding_key).depth, 2)
+
+    def test_size_is_bounded(self):
+        self.assertLess(len(TranspositionTable(size_mb=1).slots), len(TranspositionTable(size_mb=4).slots))
+
+
+class TestSharedTranspositionTable(unittest.TestCase):
+
+    def test_entries_are_shared(self):
+        table = SharedTranspositionTable(size_mb=1)
+        self.addCleanup(table.close)
+        table.store(12345, 3, -4.5, LOWER_BOUND, 777)
+        table.store(54321, 2, float('inf'), EXACT, None)
+
+        # a pickled copy attaches to the same memory, as in a worker process
+        attached = pickle.loads(pickle.dumps(table))
+        self.addCleanup(attached.close)
+        self.assertEqual(attached.probe(12345), (12345, 3, -4.5, LOWER_BOUND, 777, 0))
+        self.assertEqual(attached.probe(54321).score, float('inf'))
+        self.assertIsNone(attached.probe(54321).best_move)
+        attached.store(99, 1, -float('inf'), UPPER_BOUND, 5)
+        self.assertEqual(table.probe(99), (99, 1, -float('inf'), UPPER_BOUND, 5, 0))
+
+        # a slot whose words do not match its key is ignored
+        slot = (12345 & table.mask) * 2
+        table.words[slot * 2 + 1] ^= 1
+        self.assertIsNone(table.probe(12345))
+
+    def test_lazy_smp_search(self):
+        board = ChessBoard.from_fen("6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1")
+        stats = SearchStats()
+        reported_depths = []
+        piece, move, score = lazy_smp_search(
+            board, 2, PlayerColor.WHITE, 60, workers=2, stats=stats,
+            on_depth=lambda depth_stats: reported_depths.append(depth_stats.depth_reached))
+        self.assertEqual((piece.position, move), ((7, 3), (0, 3)))
+        self.assertEqual(score, float('inf'))
+        self.assertGreater(stats.nodes, 0)
+        self.assertEqual(reported_depths[-1], 2)
+        self.assertEqual(stats.principal_variation[0], "d1d8")
+
+        # the node limit is shared by the workers
+        board = ChessBoard.from_fen("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1")
+        stats = SearchStats()
+        lazy_smp_search(board, 20, PlayerColor.WHITE, 60, workers=2, stats=stats, node_limit=1000)
+        self.assertLessEqual(stats.nodes, 1000)
+
+        # too few nodes for any worker to complete the first depth still gives a move
+        stats = SearchStats()
+        with redirect_stdout(io.StringIO()):
+            piece, move, _ = lazy_smp_search(board, 20, PlayerColor.WHITE, 60, workers=2, stats=stats, node_limit=2)
+        self.assertIn((piece, move), board.generate_legal_moves(PlayerColor.WHITE))
+        self.assertEqual(stats.depth_reached, 1)
+
+    def test_root_split_search(self):
+        board = ChessBoard.from_fen("8/7p/5k2/5p2/p1p2P2/Pr1pPK2/1P1R3P/6R1 b - - 0 1")
+        _, _, expected_score = iterative_deepening_minimax(board, 2, PlayerColor.BLACK, 60)
+        stats = SearchStats()
+        reported_depths = []
+        piece, move, score = root_split_search(
+            board, 2, PlayerColor.BLACK, 60, workers=2, stats=stats,
+            on_depth=lambda depth_stats: reported_depths.append(depth_stats.depth_reached))
+        self.assertEqual(score, expected_score)
+        self.assertIn((piece, move), board.generate_legal_moves(PlayerColor.BLACK))
+        self.assertEqual(stats.depth_reached, 2)
+        self.assertEqual(reported_depths, [1, 2])
+        self.assertEqual(stats.depth_moves[-1], (piece, move, score))
+
+        # the depth cut short by the node limit is thrown away, the last completed one is played
+        stats = SearchStats()
+        result = root_split_search(board, 20, PlayerColor.BLACK, 60, workers=2, stats=stats, node_limit=1000)
+        self.assertLessEqual(stats.nodes, 1000)
+        self.assertGreaterEqual(stats.depth_reached, 1)
+        self.assertEqual(result, stats.depth_moves[-1])
+
+
+@unittest.skipUnless(numpy, "numpy is not installed")
+class TestBatchEvaluation(unittest.TestCase):
+
+    def test_batch_matches_evaluation_function(self):
+        from batch_evaluation import evaluate_boards, evaluate_moves
+
+        rng = random.Random(0)
+        board = ChessBoard()
+        color = PlayerColor.WHITE
+        boards = []
+        for _ in range(60):
+            moves = board.generate_legal_moves(color)
+            if not moves:
+                break
+            board.make_move(rng.choice(moves))
+            color = PlayerColor.WHITE if color == PlayerColor.BLACK else PlayerColor.BLACK
+            boards.append(deepcopy(board))
+
+            children = board.generate_legal_moves(color)
+            expected = []
+            for child in children:
+                board.make_move(child)
+                expected.append(board.evaluation_function())
+                board.unmake_move()
+            self.assertEqual(list(evaluate_moves(board, children)), expected)
+
+        self.assertEqual(list(evaluate_boards(boards)), [b.evaluation_function() for b in boards])
+
+    def test_batch_checkmate(self):
+        from batch_evaluation import evaluate_boards
+
+        board = ChessBoard()
+        for start, end in [((6, 5), (5, 5)), ((1, 4), (3, 4)), ((6, 6), (4, 6)), ((0, 3), (4, 7))]:
+            board.move_piece(board.get_piece(start), end)
+        self.assertEqual(list(evaluate_boards([board, ChessBoard()])), [-float('inf'), 0])
+
+    def test_batch_frontier_counts_nodes(self):
+        board = ChessBoard.from_fen("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1")
+        timer = SearchTimer(node_limit=2000)
+        stats = SearchStats()
+        with redirect_stdout(io.StringIO()):
+            iterative_deepening_minimax(board, 20, PlayerColor.WHITE, batch_frontier=True, timer=timer, stats=stats)
+        # the batch scored children count like searched ones, at most one frontier node's children past the limit
+        self.assertEqual(timer.nodes, stats.nodes)
+        self.assertLess(stats.nodes, 2000 + 60)
+
+
+class TestSearchStats(unittest.TestCase):
+
+    def test_stats_are_collected(self):
+        board = ChessBoard.from_fen("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1")
+        stats = SearchStats()
+        depths = []
+        piece, move = get_best_move(board, PlayerColor.WHITE, max_depth=2, max_time=60, stats=stats,
+                                    on_depth=lambda depth_stats: depths.append(depth_stats.depth_reached))
+
+        self.assertEqual(depths, [1, 2])
+        self.assertEqual(stats.depth_reached, 2)
+        self.assertEqual(stats.depth_nodes[-1], stats.nodes)
+        self.assertEqual(stats.depth_moves[-1][:2], (piece, move))
+        self.assertEqual(stats.tt_probes, stats.nodes)
+        self.assertLessEqual(stats.leaf_evaluations, stats.nodes)
+        self.assertLessEqual(stats.first_move_cutoffs, stats.cutoffs)
+        self.assertGreater(stats.cutoffs, 0)
+        self.assertEqual(stats.as_dict()["nodes"], stats.nodes)
+
+    def test_selective_pruning(self):
+        board = ChessBoard.from_fen("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1")
+        full_stats, pruned_stats = SearchStats(), SearchStats()
+        iterative_deepening_minimax(board, 3, PlayerColor.WHITE, 60, stats=full_stats, pruning=NO_PRUNING)
+        iterative_deepening_minimax(board, 3, PlayerColor.WHITE, 60, stats=pruned_stats)
+        self.assertEqual(full_stats.futility_prunes + full_stats.null_move_cutoffs + full_stats.razorings, 0)
+        self.assertGreater(pruned_stats.futility_prunes, 0)
+        self.assertLess(pruned_stats.nodes, full_stats.nodes)
+
+        # pruning doesn't hide a mate
+        board = ChessBoard.from_fen("6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1")
+        piece, move, score = iterative_deepening_minimax(board, 3, PlayerColor.WHITE, 60, pruning=PruningOptions())
+        self.assertEqual((piece.position, move, score), ((7, 3), (0, 3), float('inf')))
+
+    def test_principal_variation(self):
+        board = ChessBoard.from_fen("r1bqk1nr/pppp1ppp/2n5/2b1p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4")
+        stats = SearchStats()
+        piece, move, score = iterative_deepening_minimax(board, 3, PlayerColor.WHITE, 60, stats=stats)
+        self.assertEqual(stats.principal_variation[0], move_to_string((piece, move)))
+        self.assertGreater(stats.pvs_researches, 0)
+        # the line is played through and taken back
+        self.assertEqual(board.to_fen().split()[0], "r1bqk1nr/pppp1ppp/2n5/2b1p3/2B1P3/5N2/PPPP1PPP/RNBQK2R")
+
+
+class TestMoveOrdering(unittest.TestCase):
+
+    def test_move_order(self):
+        board = ChessBoard.from_fen("4k3/8/4p3/3pq3/8/5N2/8/3Q3K w - - 0 1")
+        move_ordering = MoveOrdering()
+        king_move = board.parse_move("h1g1")
+        move_ordering.add_cutoff(PlayerColor.WHITE, encode_move(king_move), 3, 2)
+        queen_move = board.parse_move("d1a4")
+        move_ordering.add_cutoff(PlayerColor.WHITE, encode_move(queen_move), 5, 4)
+
+        # winning capture, killer, quiet move with history, quiet move, losing capture
+        moves = [board.parse_move(move) for move in ["f3e5", "h1g1", "d1a4", "d1b3", "d1d5"]]
+        scores = [move_score(move, board, move_ordering, 3) for move in moves]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        self.assertEqual(len(set(scores)), len(scores))
+        self.assertEqual(move_ordering.killers_at(3), [encode_move(king_move)])
+        self.assertEqual(move_ordering.killers_at(4), [])
+
+        move_ordering.new_search()
+        self.assertEqual(move_ordering.killers_at(3), [])
+        self.assertEqual(move_ordering.history[PlayerColor.WHITE][encode_move(queen_move)], 8)
+
+    def test_staged_moves(self):
+        board = ChessBoard.from_fen("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1")
+        move_ordering = MoveOrdering()
+        killer = encode_move(board.parse_move("a2a3"))
+        move_ordering.add_cutoff(PlayerColor.WHITE, killer, 2, 3)
+        hash_move = encode_move(board.parse_move("e1g1"))
+        illegal_killer = encode_move((board.get_piece((6, 3)), (3, 0)))  # d2a5, the bishop is blocked here
+        move_ordering.add_cutoff(PlayerColor.WHITE, illegal_killer, 2, 3)
+
+        moves = [encode_move(move) for move in staged_moves(board, PlayerColor.WHITE, hash_move, None, move_ordering, 2)]
+        legal_moves = [encode_move(move) for move in board.generate_legal_moves(PlayerColor.WHITE)]
+        self.assertEqual(sorted(moves), sorted(legal_moves))
+        self.assertEqual(moves[0], hash_move)
+        captures = len(board.generate_legal_moves(PlayerColor.WHITE, board.color_occupancy[PlayerColor.BLACK]))
+        self.assertIn(killer, moves[1:captures + 2])
+
+        self.assertTrue(board.is_legal_move(PlayerColor.WHITE, board.parse_move("e1g1")))
+        self.assertFalse(board.is_legal_move(PlayerColor.WHITE, decode_move(board, illegal_killer)))
+        self.assertFalse(board.is_legal_move(PlayerColor.BLACK, board.parse_move("a2a3")))
+
+    def test_static_exchange_evaluation(self):
+        # fen, move, exchange value in pawns
+        exchanges = [
+            ("4k3/8/8/4p3/8/5N2/8/4K3 w - - 0 1", "f3e5", 1),  # undefended pawn
+            ("4k3/8/3p4/4p3/8/5N2/8/4K3 w - - 0 1", "f3e5", -2),  # defended by a pawn
+            ("4r1k1/8/8/4p3/8/8/4R3/6K1 w - - 0 1", "e2e5", -4),
+            ("4r1k1/8/8/4p3/8/8/4R3/4Q1K1 w - - 0 1", "e2e5", 1),  # the queen behind the rook joins in
+            ("3qk3/8/8/3p4/8/8/3Q4/3RK3 w - - 0 1", "d2d5", 1),
+        ]
+        for fen, move_string, value in exchanges:
+            board = ChessBoard.from_fen(fen)
+            move = board.parse_move(move_string)
+            self.assertEqual(static_exchange_evaluation(board, move), value, fen)
+            self.assertTrue(see_ge(board, move, value), fen)
+            self.assertFalse(see_ge(board, move, value + 1), fen)
+
+
+class TestTimeManagement(unittest.TestCase):
+
+    def test_allocate_time(self):
+        soft_limit, hard_limit = allocate_time(TimeControl(60))
+        self.assertAlmostEqual(soft_limit, (60 - MOVE_OVERHEAD) / 30)
+        self.assertAlmostEqual(hard_limit, soft_limit * 3)
+
+        # the increment is mostly spent, but a short clock caps both limits
+        soft_limit, hard_limit = allocate_time(TimeControl(60, increment=2, moves_to_go=10))
+        self.assertAlmostEqual(soft_limit, (60 - MOVE_OVERHEAD) / 10 + 1.5)
+        soft_limit, hard_limit = allocate_time(TimeControl(1, increment=5))
+        self.assertLessEqual(hard_limit, 0.5)
+        self.assertLessEqual(soft_limit, hard_limit)
+        soft_limit, hard_limit = allocate_time(TimeControl(10, moves_to_go=1))
+        self.assertAlmostEqual(hard_limit, 10 - MOVE_OVERHEAD)
+
+    def test_stopped_search_plays_completed_depth(self):
+        board = ChessBoard.from_fen("r1bqk1nr/pppp1ppp/2n5/2b1p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4")
+        timer = SearchTimer()
+        stats = SearchStats()
+        stopper = threading.Timer(0.5, timer.stop)
+        stopper.start()
+        start_time = time.time()
+        piece, move, score = iterative_deepening_minimax(board, 20, PlayerColor.WHITE, timer=timer, stats=stats)
+        stopper.cancel()
+        self.assertLess(time.time() - start_time, 2)
+        self.assertGreaterEqual(stats.depth_reached, 1)
+        self.assertEqual((piece, move, score), stats.depth_moves[-1])
+
+        # the first depth is completed even without any time
+        stats = SearchStats()
+        piece, move, score = iterative_deepening_minimax(board, 20, PlayerColor.WHITE, timer=SearchTimer(0), stats=stats)
+        self.assertEqual(stats.depth_reached, 1)
+        self.assertIsNotNone(piece)
+
+    def test_node_limit(self):
+        board = ChessBoard.from_fen("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1")
+        for node_limit in (3000, 200):
+            timer = SearchTimer(node_limit=node_limit)
+            stats = SearchStats()
+            iterative_deepening_minimax(board, 20, PlayerColor.WHITE, timer=timer, stats=stats)
+            self.assertEqual((stats.nodes, timer.nodes), (node_limit, node_limit))
+
+        # too few nodes to finish the first depth still gives a move
+        stats = SearchStats()
+        piece, move, _ = iterative_deepening_minimax(
+            board, 20, PlayerColor.WHITE, timer=SearchTimer(node_limit=1), stats=stats)
+        self.assertEqual(stats.depth_reached, 0)
+        self.assertIn((piece, move), board.generate_legal_moves(PlayerColor.WHITE))
+
+    def test_stop_during_first_depth(self):
+        timer = SearchTimer()
+
+        class StoppingTable(TranspositionTable):
+            # stops the search from inside the first depth, as a stop command from another thread would
+            def probe(self, key):
+                self.probes += 1
+                if self.probes == 10:
+                    timer.stop()
+                return super().probe(key)
+
+        board = ChessBoard.from_fen("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1")
+        table = StoppingTable()
+        table.probes = 0
+        stats = SearchStats()
+        piece, move, _ = iterative_deepening_minimax(
+            board, 20, PlayerColor.WHITE, transposition_table=table, stats=stats, timer=timer)
+        self.assertEqual(stats.depth_reached, 0)
+        self.assertEqual(stats.nodes, 10)
+        self.assertIn((piece, move), board.generate_legal_moves(PlayerColor.WHITE))
+
+    def test_stopped_search_stores_nothing(self):
+        timer = SearchTimer()
+        stores_after_stop = []
+
+        class RecordingTable(TranspositionTable):
+            def store(self, *args):
+                if timer.stopped:
+                    stores_after_stop.append(args)
+                super().store(*args)
+
+        fen = "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1"
+        board = ChessBoard.from_fen(fen)
+        # partial results of a stopped search must not be stored as full depth ones, whichever node it stops at
+        for node_limit in range(1000, 13000, 3000):
+            timer = SearchTimer(node_limit=node_limit)
+            _, _, _, terminated = minimax(board, 5, PlayerColor.WHITE, transposition_table=RecordingTable(), timer=timer)
+            self.assertTrue(terminated)
+        self.assertEqual(stores_after_stop, [])
+        self.assertEqual(board.to_fen(), fen)
+
+
+class TestPondering(unittest.TestCase):
+
+    def test_ponder_hit_and_miss(self):
+        board = ChessBoard()
+        ponderer = Ponderer()
+        self.assertFalse(ponderer.start(board, PlayerColor.BLACK, "e2e5"))
+
+        self.assertTrue(ponderer.start(board, PlayerColor.BLACK, "e2e4"))
+        time.sleep(0.3)
+        move_string = ponderer.finish("e2e4", 0.2)
+        self.assertFalse(ponderer.pondering)
+        self.assertGreaterEqual(ponderer.stats.depth_reached, 1)
+        board.make_move(board.parse_move("e2e4"))
+        self.assertIsNotNone(board.parse_move(move_string))
+        board.unmake_move()
+
+        # a miss stops the search right away, the board was never touched
+        ponderer.start(board, PlayerColor.BLACK, "e2e4")
+        start_time = time.time()
+        self.assertIsNone(ponderer.finish("d2d4", 10))
+        self.assertLess(time.time() - start_time, 1)
+        self.assertEqual(board.to_fen(), START_FEN)
+
+
+class TestUCI(unittest.TestCase):
+
+    def test_search_and_stop(self):
+        output = io.StringIO()
+        engine = UCIEngine(output)
+        engine.handle("uci")
+        self.assertIn("uciok", output.getvalue())
+
+        engine.handle("position fen r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1 moves e1g1")
+        engine.handle("go depth 2")
+        engine.search_thread.join()
+        lines = output.getvalue().splitlines()
+        self.assertTrue(lines[-2].startswith("info depth 2 score cp "))
+        self.assertTrue(lines[-1].startswith("bestmove "))
+
+        engine.handle("go infinite")
+        time.sleep(0.3)
+        start_time = time.time()
+        engine.handle("stop")
+        self.assertLess(time.time() - start_time, 0.5)
+        self.assertTrue(output.getvalue().splitlines()[-1].startswith("bestmove "))
+        self.assertTrue(engine.handle("isready"))
+        self.assertFalse(engine.handle("quit"))
+
+    def test_parallel_ponder_hit(self):
+        output = io.StringIO()
+        engine = UCIEngine(output)
+        engine.handle("setoption name Threads value 2")
+        engine.handle("position fen r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1")
+        engine.handle("go ponder wtime 3000 btime 3000")
+        time.sleep(1)
+        self.assertNotIn("bestmove", output.getvalue())
+
+        # the workers only learn about the ponder hit's time limit through the stop event
+        start_time = time.time()
+        engine.handle("ponderhit")
+        engine.search_thread.join(5)
+        self.assertLess(time.time() - start_time, 2)
+        lines = output.getvalue().splitlines()
+        self.assertTrue(lines[-1].startswith("bestmove "))
+        self.assertTrue(any(line.startswith("info depth 1 ") for line in lines))
+        engine.handle("quit")
+
+    def test_malformed_commands(self):
+        output = io.StringIO()
+        engine = UCIEngine(output)
+        with redirect_stderr(io.StringIO()):
+            self.assertTrue(engine.handle("setoption name Hash value big"))
+            self.assertTrue(engine.handle("go wtime soon"))
+            # unsupported arguments like searchmoves are skipped, the known limits still apply
+            engine.handle("position fen rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1")
+            engine.handle("go searchmoves e7e5 d7d5 depth 1")
+            engine.search_thread.join()
+        lines = output.getvalue().splitlines()
+        self.assertTrue(lines[-2].startswith("info depth 1 "))
+        self.assertTrue(lines[-1].startswith("bestmove "))
+        self.assertEqual(engine.hash_mb, 16)
+
+    def test_score_to_uci(self):
+        self.assertEqual(score_to_uci(1.5, PlayerColor.BLACK, []), "cp -15")
+        self.assertEqual(score_to_uci(float('inf'), PlayerColor.WHITE, ["d1d8"]), "mate 1")
+        self.assertEqual(score_to_uci(float('inf'), PlayerColor.BLACK, ["a7a6", "d1d8"]), "mate -1")
+
+    def test_no_gui_imports(self):
+        code = "import sys, uci; print('tkinter' in sys.modules or 'PIL' in sys.modules)"
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.strip(), "False")
+
+
+class TestAnalysis(unittest.TestCase):
+
+    def test_analyze_positions(self):
+        lines = [
+            "# comment",
+            "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+            "",
+            '6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - bm Rd8#; id "back rank";',
+            "not a fen",
+        ]
+        self.assertEqual(parse_position_line(lines[3]), ("6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - -", "back rank"))
+
+        results = list(analyze_positions(lines, depth=2))
+        self.assertEqual([result["line"] for result in results], [2, 4, 5])
+        self.assertEqual(results[0]["depth"], 2)
+        self.assertIsNotNone(results[0]["score"])
+        self.assertEqual((results[1]["id"], results[1]["move"], results[1]["mate"]), ("back rank", "d1d8", 1))
+        self.assertIn("error", results[2])
+
+        # the pool returns the same results, in completion order
+        pooled = sorted(analyze_positions(lines, depth=2, workers=2), key=lambda result: result["line"])
+        for result in results + pooled:
+            result.pop("time", None)
+        self.assertEqual(pooled, results)
+
+
+class TestProfiling(unittest.TestCase):
+
+    def test_profiles_are_saved_per_move(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            profiler = MoveProfiler(output_dir)
+            board = ChessBoard()
+            for _ in range(2):
+                piece, move = get_best_move(board, PlayerColor.WHITE, max_depth=2, max_time=60, profiler=profiler)
+            self.assertEqual(sorted(os.listdir(output_dir)), ["move_001.prof", "move_002.prof", "summary.txt"])
+
+            times = profiler.category_times()
+            self.assertGreater(times["move generation"], 0)
+            self.assertGreater(times["search"], 0)
+            self.assertIn("2 moves profiled", profiler.summary())
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_run_position(self):
+        result = run_position("8/5k2/8/8/8/8/1R6/4K3 w - - 0 1", 2, 2)
+        self.assertEqual(len(result["times"]), 2)
+        self.assertEqual(len(result["time_to_depth"]), 2)
+        self.assertGreater(result["nodes"], 0)
+        self.assertIsNotNone(result["move"])
+
+    def test_welch_t_test(self):
+        self.assertTrue(welch_t_test([1.0, 1.1, 0.9, 1.0], [2.0, 2.1, 1.9, 2.0])[1])
+        self.assertFalse(welch_t_test([1.0, 1.5, 0.5, 1.0], [1.1, 1.6, 0.6, 1.1])[1])
+        self.assertFalse(welch_t_test([1.0], [2.0])[1])
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,248 @@
+from multiprocessing import shared_memory
+from typing import NamedTuple, Optional
+
+from chess_board import ChessBoard, Move
+
+# bound types
+EXACT = 0
+LOWER_BOUND = 1  # the search failed high, the real score is at least the stored score
+UPPER_BOUND = 2  # the search failed low, the real score is at most the stored score
+
+# rough memory cost of one entry, tuple plus the objects it holds
+ENTRY_SIZE_BYTES = 160
+
+# each bucket holds a depth-preferred slot followed by an always-replace slot
+BUCKET_SIZE = 2
+
+
+class TTEntry(NamedTuple):
+    key: int
+    depth: int
+    score: float
+    bound: int
+    best_move: Optional[int]
+    age: int
+
+
+def encode_move(move: Move) -> int:
+    """Packs a move into start square * 64 + target square so it does not hold on to piece objects"""
+    piece, (new_row, new_col) = move
+    old_row, old_col = piece.position
+    return (old_row * 8 + old_col) * 64 + new_row * 8 + new_col
+
+
+def decode_move(board: ChessBoard, encoded_move: int) -> Optional[Move]:
+    """Unpacks an encoded move for the given board, None if there is no piece on its start square"""
+    start, target = divmod(encoded_move, 64)
+    piece = board.board[start >> 3][start & 7]
+    if piece is None:
+        return None
+    return piece, (target >> 3, target & 7)
+
+
+class TranspositionTable:
+    """
+    Fixed size hash table of search results keyed by the board's zobrist key.
+
+    Every bucket has a depth-preferred slot, kept unless the new result is searched at least as deep
+    or the stored one is from an older search, and an always-replace slot for everything else.
+    The table is meant to be kept between iterations and between moves of a game,
+    new_search() ages the entries so stale results are the first to be replaced.
+    """
+
+    def __init__(self, size_mb: int = 16):
+        self.resize(size_mb)
+
+    def resize(self, size_mb: int):
+        """Reallocates the table for the given size in MB, dropping every entry"""
+        bucket_count = 1
+        while bucket_count * 2 * BUCKET_SIZE * ENTRY_SIZE_BYTES <= size_mb * 1024 * 1024:
+            bucket_count *= 2
+
+        self.size_mb = size_mb
+        self.mask = bucket_count - 1
+        self.slots: list[Optional[TTEntry]] = [None] * (bucket_count * BUCKET_SIZE)
+        self.age = 0
+
+    def clear(self):
+        """Drops every entry"""
+        self.slots = [None] * len(self.slots)
+        self.age = 0
+
+    def new_search(self):
+        """Marks the entries stored so far as coming from an older search"""
+        self.age += 1
+
+    def probe(self, key: int) -> Optional[TTEntry]:
+        """Returns the entry stored for a zobrist key, if any"""
+        index = (key & self.mask) * BUCKET_SIZE
+        entry = self.slots[index]
+        if entry is not None and entry.key == key:
+            return entry
+        entry = self.slots[index + 1]
+        if entry is not None and entry.key == key:
+            return entry
+        return None
+
+    def store(self, key: int, depth: int, score: float, bound: int, best_move: Optional[int]):
+        """Stores a search result, choosing the slot by the replacement policy"""
+        index = (key & self.mask) * BUCKET_SIZE
+        preferred = self.slots[index]
+
+        # keep the best move of an earlier search of this position if this one has none
+        if best_move is None and preferred is not None and preferred.key == key:
+            best_move = preferred.best_move
+
+        entry = TTEntry(key, depth, score, bound, best_move, self.age)
+        if preferred is None or preferred.key == key or preferred.age != self.age or depth >= preferred.depth:
+            self.slots[index] = entry
+        else:
+            self.slots[index + 1] = entry
+
+    def hashfull(self) -> int:
+        """Returns the per mille of the first 1000 slots used by the current search"""
+        sample = self.slots[:1000]
+        return sum(1 for entry in sample if entry is not None and entry.age == self.age) * 1000 // len(sample)
+
+
+# Shared table entries are packed into one 64-bit data word:
+# bits 0-12 best move + 1 (0 for none), 13-14 bound, 15-22 depth, 23-30 age, 31-62 score * 2 offset by 2**31.
+# Every score is a multiple of 0.5 (see chess_board.py), so doubling it gives an exact integer.
+SHARED_ENTRY_WORDS = 2
+SHARED_WORD_BYTES = 8
+SCORE_OFFSET = 1 << 31
+SCORE_INF = (1 << 32) - 1  # packed +inf, packed -inf is 0
+
+
+def pack_entry(depth: int, score: float, bound: int, best_move: Optional[int], age: int) -> int:
+    """Packs an entry's fields into one 64-bit word"""
+    if score == float('inf'):
+        packed_score = SCORE_INF
+    elif score == -float('inf'):
+        packed_score = 0
+    else:
+        packed_score = min(max(int(score * 2) + SCORE_OFFSET, 1), SCORE_INF - 1)
+    return ((0 if best_move is None else best_move + 1) | bound << 13 | min(max(depth, 0), 255) << 15
+            | (age & 255) << 23 | packed_score << 31)
+
+
+def unpack_entry(key: int, data: int) -> TTEntry:
+    """Unpacks a 64-bit data word into an entry for the given key"""
+    packed_score = data >> 31
+    if packed_score == SCORE_INF:
+        score = float('inf')
+    elif packed_score == 0:
+        score = -float('inf')
+    else:
+        score = (packed_score - SCORE_OFFSET) / 2
+    best_move = (data & 8191) - 1
+    return TTEntry(key, (data >> 15) & 255, score, (data >> 13) & 3, None if best_move < 0 else best_move, (data >> 23) & 255)
+
+
+class SharedTranspositionTable:
+    """
+    Transposition table in shared memory, so several search processes can use the same results (see parallel_search.py).
+    Has the same interface and replacement policy as TranspositionTable.
+
+    Every slot is two 64-bit words: the key XOR the packed data, then the packed data. Processes write without locks,
+    a slot half written by one process while another reads it fails the XOR check and reads as empty.
+    The process that creates the table owns the shared memory and should close() it when done,
+    pickling the table (e.g. passing it to a worker process) attaches the copy to the same memory.
+    """
+
+    def __init__(self, size_mb: int = 16):
+        self.memory = None
+        self.resize(size_mb)
+
+    def resize(self, size_mb: int):
+        """Reallocates the table for the given size in MB, dropping every entry"""
+        bucket_count = 1
+        while bucket_count * 2 * BUCKET_SIZE * SHARED_ENTRY_WORDS * SHARED_WORD_BYTES <= size_mb * 1024 * 1024:
+            bucket_count *= 2
+
+        self.close()
+        self.size_mb = size_mb
+        self.mask = bucket_count - 1
+        self.slot_count = bucket_count * BUCKET_SIZE
+        self.owner = True
+        self.memory = shared_memory.SharedMemory(create=True, size=self.slot_count * SHARED_ENTRY_WORDS * SHARED_WORD_BYTES)
+        self.words = self.memory.buf.cast('Q')
+        self.age = 0
+        self.clear()
+
+    def __getstate__(self):
+        return {"name": self.memory.name, "size_mb": self.size_mb, "mask": self.mask,
+                "slot_count": self.slot_count, "age": self.age}
+
+    def __setstate__(self, state):
+        self.size_mb = state["size_mb"]
+        self.mask = state["mask"]
+        self.slot_count = state["slot_count"]
+        self.age = state["age"]
+        self.owner = False
+        self.memory = shared_memory.SharedMemory(name=state["name"])
+        self.words = self.memory.buf.cast('Q')
+
+    def close(self):
+        """Detaches from the shared memory, and frees it if this is the owning process"""
+        if self.memory is None:
+            return
+        self.words.release()
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+        self.memory = None
+
+    def clear(self):
+        """Drops every entry"""
+        self.memory.buf[:self.slot_count * SHARED_ENTRY_WORDS * SHARED_WORD_BYTES] = \
+            bytes(self.slot_count * SHARED_ENTRY_WORDS * SHARED_WORD_BYTES)
+        self.age = 0
+
+    def new_search(self):
+        """Marks the entries stored so far as coming from an older search"""
+        self.age = (self.age + 1) & 255
+
+    def read_slot(self, slot: int, key: int) -> Optional[TTEntry]:
+        """Returns the entry in a slot if it holds the given key and is not torn"""
+        data = self.words[slot * SHARED_ENTRY_WORDS + 1]
+        if data == 0 or self.words[slot * SHARED_ENTRY_WORDS] ^ data != key:
+            return None
+        return unpack_entry(key, data)
+
+    def probe(self, key: int) -> Optional[TTEntry]:
+        """Returns the entry stored for a zobrist key, if any"""
+        index = (key & self.mask) * BUCKET_SIZE
+        entry = self.read_slot(index, key)
+        if entry is None:
+            entry = self.read_slot(index + 1, key)
+        return entry
+
+    def store(self, key: int, depth: int, score: float, bound: int, best_move: Optional[int]):
+        """Stores a search result, choosing the slot by the replacement policy"""
+        index = (key & self.mask) * BUCKET_SIZE
+        preferred_data = self.words[index * SHARED_ENTRY_WORDS + 1]
+        preferred_key = self.words[index * SHARED_ENTRY_WORDS] ^ preferred_data
+        preferred = unpack_entry(preferred_key, preferred_data) if preferred_data else None
+
+        # keep the best move of an earlier search of this position if this one has none
+        if best_move is None and preferred is not None and preferred.key == key:
+            best_move = preferred.best_move
+
+        data = pack_entry(depth, score, bound, best_move, self.age)
+        if preferred is None or preferred.key == key or preferred.age != self.age or depth >= preferred.depth:
+            slot = index
+        else:
+            slot = index + 1
+        self.words[slot * SHARED_ENTRY_WORDS] = key ^ data
+        self.words[slot * SHARED_ENTRY_WORDS + 1] = data
+
+    def hashfull(self) -> int:
+        """Returns the per mille of the first 1000 slots used by the current search"""
+        sample = min(1000, self.slot_count)
+        used = 0
+        for slot in range(sample):
+            data = self.words[slot * SHARED_ENTRY_WORDS + 1]
+            if data and (data >> 23) & 255 == self.age:
+                used += 1
+        return used * 1000 // sample
@@ -0,0 +1,266 @@
+"""
+UCI (Universal Chess Interface) front end, to run the engine headless in chess GUIs and match harnesses.
+
+    python uci.py
+
+Speaks UCI over stdin and stdout: uci, isready, ucinewgame, setoption (Hash, Threads, Ponder), position startpos/fen
+with moves, go (depth, movetime, wtime/btime/winc/binc, movestogo, nodes, infinite, ponder), ponderhit, stop and quit.
+The search runs in its own thread so stop and isready are answered while it searches.
+The engine's progress messages are sent to stderr, stdout only carries the protocol.
+Nothing here imports Tkinter or Pillow.
+"""
+from contextlib import redirect_stdout
+from copy import deepcopy
+import multiprocessing
+import sys
+import threading
+from typing import Optional, TextIO
+
+from chess_board import ChessBoard, START_FEN, move_to_string
+from engine import SearchStats, SearchTimer, TimeControl, allocate_time, get_best_move
+from pieces.chess_piece import PlayerColor
+from transposition_table import TranspositionTable, SharedTranspositionTable
+
+ENGINE_NAME = "ChessEngine"
+ENGINE_AUTHOR = "ChessEngine authors"
+DEFAULT_HASH_MB = 16
+MAX_HASH_MB = 1024
+MAX_THREADS = 64
+# go arguments followed by a number, others like searchmoves are skipped
+GO_LIMITS = ("depth", "movetime", "wtime", "btime", "winc", "binc", "movestogo", "nodes")
+
+
+def score_to_uci(score: float, color: PlayerColor, principal_variation: list[str]) -> str:
+    """
+    Returns a search score in UCI form, from the side to move's point of view: centipawns (a pawn is worth 10 points),
+    or the moves to mate along the principal variation
+    """
+    if color == PlayerColor.BLACK:
+        score = -score
+    if abs(score) == float('inf'):
+        moves_to_mate = (len(principal_variation) + 1) // 2
+        return f"mate {moves_to_mate if score > 0 else -moves_to_mate}"
+    return f"cp {round(score * 10)}"
+
+
+class UCIEngine:
+    """
+    Handles UCI commands one line at a time, see handle. Replies are written to output.
+    The position and table persist between commands, each go searches a copy of the position in a thread.
+    """
+
+    def __init__(self, output: TextIO = sys.stdout):
+        self.output = output
+        self.output_lock = threading.Lock()
+        self.board = ChessBoard()
+        self.from_start_position = True  # the opening book only knows games played from the start position
+        self.hash_mb = DEFAULT_HASH_MB
+        self.threads = 1
+        self.transposition_table = TranspositionTable(size_mb=self.hash_mb)
+
+        # the running search, if any
+        self.search_thread: Optional[threading.Thread] = None
+        self.timer: Optional[SearchTimer] = None
+        self.ponder_limits: Optional[tuple[Optional[float], Optional[float]]] = None
+        # infinite and ponder searches may only send bestmove once this is set, by stop or ponderhit
+        self.search_released = threading.Event()
+
+    def send(self, line: str):
+        """Writes one line of the protocol"""
+        with self.output_lock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    def handle(self, line: str) -> bool:
+        """Handles one command line, returns False after quit. A malformed command is reported on stderr and ignored."""
+        try:
+            return self.handle_command(line)
+        except ValueError as error:
+            print(f"invalid command: {line.strip()}: {error}", file=sys.stderr)
+            return True
+
+    def handle_command(self, line: str) -> bool:
+        """Handles one command line, returns False after quit"""
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, arguments = tokens[0], tokens[1:]
+
+        if command == "uci":
+            self.send(f"id name {ENGINE_NAME}")
+            self.send(f"id author {ENGINE_AUTHOR}")
+            self.send(f"option name Hash type spin default {DEFAULT_HASH_MB} min 1 max {MAX_HASH_MB}")
+            self.send(f"option name Threads type spin default 1 min 1 max {MAX_THREADS}")
+            self.send("option name Ponder type check default false")
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "setoption":
+            self.set_option(arguments)
+        elif command == "ucinewgame":
+            self.stop()
+            self.transposition_table.clear()
+            self.board = ChessBoard()
+            self.from_start_position = True
+        elif command == "position":
+            self.stop()
+            self.set_position(arguments)
+        elif command == "go":
+            self.go(arguments)
+        elif command == "ponderhit":
+            self.ponder_hit()
+        elif command == "stop":
+            self.stop()
+        elif command == "quit":
+            self.stop()
+            if isinstance(self.transposition_table, SharedTranspositionTable):
+                self.transposition_table.close()
+            return False
+        else:
+            print(f"unknown command: {line.strip()}", file=sys.stderr)
+        return True
+
+    def set_option(self, arguments: list[str]):
+        """Handles setoption name <name> value <value> for Hash and Threads, Ponder needs no setting"""
+        if "name" not in arguments:
+            return
+        name_end = arguments.index("value") if "value" in arguments else len(arguments)
+        name = " ".join(arguments[arguments.index("name") + 1:name_end]).lower()
+        value = " ".join(arguments[name_end + 1:])
+
+        self.stop()
+        if name == "hash":
+            self.hash_mb = min(max(int(value), 1), MAX_HASH_MB)
+        elif name == "threads":
+            self.threads = min(max(int(value), 1), MAX_THREADS)
+        else:
+            return
+
+        # several search processes share the table through shared memory
+        if isinstance(self.transposition_table, SharedTranspositionTable):
+            self.transposition_table.close()
+        if self.threads > 1:
+            self.transposition_table = SharedTranspositionTable(size_mb=self.hash_mb)
+        else:
+            self.transposition_table = TranspositionTable(size_mb=self.hash_mb)
+
+    def set_position(self, arguments: list[str]):
+        """Handles position startpos|fen <fen> [moves <move>...]"""
+        moves_index = arguments.index("moves") if "moves" in arguments else len(arguments)
+        if arguments and arguments[0] == "fen":
+            fen = " ".join(arguments[1:moves_index])
+        else:
+            fen = START_FEN
+        try:
+            board = ChessBoard.from_fen(fen)
+        except ValueError as error:
+            print(f"invalid fen: {error}", file=sys.stderr)
+            return
+
+        for move_string in arguments[moves_index + 1:]:
+            move = board.parse_move(move_string)
+            if move is None:
+                print(f"illegal move: {move_string}", file=sys.stderr)
+                break
+            board.make_move(move)
+        self.board = board
+        self.from_start_position = fen == START_FEN
+
+    def go(self, arguments: list[str]):
+        """Starts searching the current position with the limits of a go command"""
+        self.stop()
+        limits = {}
+        flags = set()
+        index = 0
+        while index < len(arguments):
+            if arguments[index] in ("infinite", "ponder"):
+                flags.add(arguments[index])
+            elif arguments[index] in GO_LIMITS and index + 1 < len(arguments):
+                limits[arguments[index]] = int(arguments[index + 1])
+                index += 1
+            index += 1
+
+        color = self.board.turn
+        soft_limit, hard_limit = None, None
+        if "movetime" in limits:
+            soft_limit = hard_limit = limits["movetime"] / 1000
+        else:
+            remaining, increment = ("wtime", "winc") if color == PlayerColor.WHITE else ("btime", "binc")
+            if remaining in limits:
+                soft_limit, hard_limit = allocate_time(TimeControl(
+                    limits[remaining] / 1000, limits.get(increment, 0) / 1000, limits.get("movestogo")))
+
+        # a ponder search runs without limits until ponderhit gives it the move's limits
+        self.ponder_limits = (soft_limit, hard_limit) if "ponder" in flags else None
+        if flags:
+            soft_limit, hard_limit = None, None
+        self.timer = SearchTimer(soft_limit, hard_limit, node_limit=limits.get("nodes"))
+        self.search_released.clear()
+        self.search_thread = threading.Thread(
+            target=self.search, args=(deepcopy(self.board), color, limits.get("depth"), self.timer, bool(flags)),
+            daemon=True,
+        )
+        self.search_thread.start()
+
+    def search(self, board: ChessBoard, color: PlayerColor, max_depth: Optional[int], timer: SearchTimer,
+               wait_for_release: bool):
+        """The search thread: searches, reports every completed depth and sends the best move"""
+        stats = SearchStats()
+        piece, move = get_best_move(
+            board, color, max_depth=max_depth, transposition_table=self.transposition_table, stats=stats,
+            on_depth=lambda depth_stats: self.send_info(depth_stats, color), workers=self.threads, timer=timer,
+            use_book=self.from_start_position,
+        )
+
+        # infinite and ponder searches that end on their own still wait for stop or ponderhit
+        if wait_for_release:
+            self.search_released.wait()
+
+        best_move = move_to_string((piece, move)) if piece is not None else "0000"
+        principal_variation = stats.principal_variation
+        if len(principal_variation) >= 2 and principal_variation[0] == best_move:
+            self.send(f"bestmove {best_move} ponder {principal_variation[1]}")
+        else:
+            self.send(f"bestmove {best_move}")
+
+    def send_info(self, stats: SearchStats, color: PlayerColor):
+        """Reports a completed depth"""
+        _, _, score = stats.depth_moves[-1]
+        elapsed = stats.depth_times[-1]
+        nps = round(stats.nodes / elapsed) if elapsed > 0 else 0
+        self.send(f"info depth {stats.depth_reached} score {score_to_uci(score, color, stats.principal_variation)} "
+                  f"nodes {stats.nodes} nps {nps} time {round(elapsed * 1000)} "
+                  f"hashfull {self.transposition_table.hashfull()} pv {' '.join(stats.principal_variation)}")
+
+    def ponder_hit(self):
+        """The opponent played the expected move, the ponder search becomes the search for the move"""
+        if self.timer is not None and self.ponder_limits is not None:
+            self.timer.restart(*self.ponder_limits)
+            self.ponder_limits = None
+            self.search_released.set()
+
+    def stop(self):
+        """Stops the running search, if any, and waits until it has sent its best move"""
+        if self.search_thread is None:
+            return
+        self.timer.stop()
+        self.search_released.set()
+        self.search_thread.join()
+        self.search_thread = None
+
+
+def main():
+    # worker processes forked from this multithreaded process could inherit the lock of stdin, held by the loop below,
+    # and hang when they close it on start up
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        multiprocessing.set_start_method("forkserver")
+    engine = UCIEngine(sys.stdout)
+    # anything the engine prints goes to stderr, so it can't be mistaken for protocol output
+    with redirect_stdout(sys.stderr):
+        for line in sys.stdin:
+            if not engine.handle(line):
+                break
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+"""
+Zobrist hashing keys.
+
+A position key is the XOR of one random 64-bit number per (color, piece type, square) occupied,
+one for the 4-bit castling rights mask and one if black is to move. Making a move only XORs the keys
+that changed, so the key is kept up to date in O(1).
+"""
+import random
+
+from bitboard import PIECE_TYPE_COUNT
+from pieces.chess_piece import PlayerColor
+
+# fixed seed so keys are identical between runs and processes
+_random = random.Random(0x5EED)
+
+PIECE_KEYS: dict[PlayerColor, list[list[int]]] = {
+    color: [[_random.getrandbits(64) for _ in range(64)] for _ in range(PIECE_TYPE_COUNT)]
+    for color in (PlayerColor.WHITE, PlayerColor.BLACK)
+}
+CASTLING_KEYS: list[int] = [_random.getrandbits(64) for _ in range(16)]
+BLACK_TO_MOVE_KEY: int = _random.getrandbits(64)